@@ -0,0 +1,104 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIHandler
+from django.db import connections
+
+
+current_receive = ContextVar('current_receive')
+
+
+def next_part(iterator):
+    return next(iterator, None)
+
+
+def finish_stream():
+    """
+    Closes the connections opened for the stream: its thread ends with it, so they'd never be reused.
+    """
+    for connection in connections.all():
+        connection.close()
+
+
+async def wait_for_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+class AsyncStreamingASGIHandler(ASGIHandler):
+    """
+    Pulls the parts of streaming responses (file downloads, exports) from a dedicated thread,
+    so file reads and database cursors behind them never block the event loop.
+    Async event streams are sent from the loop until they end or the client disconnects.
+    """
+
+    async def __call__(self, scope, receive, send):
+        current_receive.set(receive)
+        await super().__call__(scope, receive, send)
+
+    async def send_response(self, response, send):
+        if not response.streaming:
+            return await super().send_response(response, send)
+        await self.start_response(response, send)
+        if getattr(response, 'is_async', False):
+            await self.send_async_stream(response, send)
+        else:
+            await self.send_stream(response, send)
+
+    async def start_response(self, response, send):
+        response_headers = []
+        for header, value in response.items():
+            if isinstance(header, str):
+                header = header.encode('ascii')
+            if isinstance(value, str):
+                value = value.encode('latin1')
+            response_headers.append((bytes(header), bytes(value)))
+        for cookie in response.cookies.values():
+            response_headers.append((b'Set-Cookie', cookie.output(header='').encode('ascii').strip()))
+        await send({
+            'type': 'http.response.start',
+            'status': response.status_code,
+            'headers': response_headers,
+        })
+
+    async def send_stream(self, response, send):
+        loop = asyncio.get_running_loop()
+        executor = ThreadPoolExecutor(max_workers=1)
+        iterator = iter(response)
+        try:
+            while True:
+                part = await loop.run_in_executor(executor, next_part, iterator)
+                if part is None:
+                    break
+                for chunk, _ in self.chunk_bytes(part):
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            await send({'type': 'http.response.body'})
+        finally:
+            await loop.run_in_executor(executor, finish_stream)
+            executor.shutdown(wait=False)
+            await sync_to_async(response.close, thread_sensitive=True)()
+
+    async def send_async_stream(self, response, send):
+        disconnect = asyncio.ensure_future(wait_for_disconnect(current_receive.get()))
+        events = response.events.__aiter__()
+        try:
+            while True:
+                part = asyncio.ensure_future(events.__anext__())
+                await asyncio.wait((part, disconnect), return_when=asyncio.FIRST_COMPLETED)
+                if not part.done():
+                    part.cancel()
+                    await asyncio.wait((part,))
+                    break
+                try:
+                    chunk = part.result()
+                except StopAsyncIteration:
+                    break
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            if not disconnect.done():
+                await send({'type': 'http.response.body'})
+        finally:
+            disconnect.cancel()
+            await events.aclose()
+            await sync_to_async(response.close, thread_sensitive=True)()
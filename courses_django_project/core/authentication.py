@@ -0,0 +1,93 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.utils.functional import cached_property
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.settings import api_settings
+
+from core.cache import get_versions, user_scope
+
+ROLE_CLAIM = 'role'
+ROSTER_CLAIM = 'roster'
+COURSES_CLAIM = 'courses'
+MAX_COURSES_CLAIM = 100
+
+
+def get_roster_version(user_id):
+    return get_versions([user_scope(user_id)])[0][0]
+
+
+def add_claims(token, user):
+    """
+    Stores the role, the roster version and the course ids of `user` in `token`. The version is read
+    before the courses, so a roster change racing with this call leaves the token with a stale version.
+    """
+    from courses.models import Course
+
+    token[ROLE_CLAIM] = user.role
+    token[ROSTER_CLAIM] = get_roster_version(user.id)
+    course_ids = list(Course.participants.through.objects.filter(user_id=user.id)
+                      .values_list('course_id', flat=True)[:MAX_COURSES_CLAIM + 1])
+    token[COURSES_CLAIM] = course_ids if len(course_ids) <= MAX_COURSES_CLAIM else None
+    return token
+
+
+class TokenUser:
+    """
+    The user of a verified access token, built from its claims.
+    The `User` row is only loaded when a view reads an attribute the token doesn't carry.
+    """
+    is_active = True
+    is_anonymous = False
+    is_authenticated = True
+
+    def __init__(self, token):
+        self.token = token
+        self.id = self.pk = token[api_settings.USER_ID_CLAIM]
+        self.role = token[ROLE_CLAIM]
+
+    @cached_property
+    def user(self):
+        model = get_user_model()
+        try:
+            return model.objects.get(**{api_settings.USER_ID_FIELD: self.id})
+        except model.DoesNotExist:
+            raise AuthenticationFailed(_('User not found'), code='user_not_found')
+
+    @cached_property
+    def token_courses(self):
+        """
+        Course ids of the token while the user's roster is unchanged since it was issued, else None.
+        None without TOKEN_COURSES_CLAIM, when another process could have changed the roster unseen.
+        """
+        course_ids = self.token.get(COURSES_CLAIM)
+        if not settings.TOKEN_COURSES_CLAIM or course_ids is None or self.token.get(ROSTER_CLAIM) != get_roster_version(self.id):
+            return None
+        return frozenset(course_ids)
+
+    def __getattr__(self, name):
+        if name.startswith('_') or name == 'token':
+            raise AttributeError(name)
+        return getattr(self.user, name)
+
+    def __eq__(self, other):
+        return getattr(other, 'pk', None) == self.pk
+
+    def __hash__(self):
+        return hash(self.pk)
+
+    def __str__(self):
+        return f'TokenUser {self.id}'
+
+
+class StatelessJWTAuthentication(JWTAuthentication):
+    """
+    Authenticates access tokens without a database query. Tokens issued without
+    the role claim fall back to loading the user.
+    """
+
+    def get_user(self, validated_token):
+        if api_settings.USER_ID_CLAIM not in validated_token or ROLE_CLAIM not in validated_token:
+            return super().get_user(validated_token)
+        return TokenUser(validated_token)
@@ -0,0 +1,98 @@
+import hashlib
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+
+from rest_framework import status
+from rest_framework.response import Response
+
+from core.files import matches_etag
+
+RESPONSE_CACHE_TIMEOUT = getattr(settings, 'RESPONSE_CACHE_TIMEOUT', 300)
+
+
+def get_cache():
+    return caches['responses']
+
+
+def course_scope(course_id):
+    return f'course:{course_id}'
+
+
+def user_scope(user_id):
+    return f'user:{user_id}'
+
+
+def get_versions(scopes):
+    """
+    Returns a (token, timestamp) version per scope. A missing version is recreated with a
+    fresh token, so an evicted version can never bring back an older cached response.
+    """
+    cache = get_cache()
+    keys = [f'version:{scope}' for scope in scopes]
+    versions = cache.get_many(keys)
+    missing = {key: (uuid.uuid4().hex, time.time()) for key in keys if key not in versions}
+    if missing:
+        cache.set_many(missing, None)
+        versions.update(missing)
+    return [versions[key] for key in keys]
+
+
+def bump_versions(scopes):
+    now = time.time()
+    get_cache().set_many({f'version:{scope}': (uuid.uuid4().hex, now) for scope in scopes}, None)
+
+
+class CachedResponseMixin:
+    """
+    Caches list and retrieve responses under versioned keys and answers conditional requests.
+    Views define `get_cache_scopes` (the scopes whose writes invalidate the response) and
+    may override `get_cache_vary` to key the response per role or per user. Responses are
+    also keyed by host, as their links are absolute.
+    """
+    cached_actions = ('list', 'retrieve')
+
+    def get_cache_scopes(self):
+        raise NotImplementedError
+
+    def get_cache_vary(self):
+        return self.request.user.role
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(super().retrieve, request, *args, **kwargs)
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        versions = get_versions(self.get_cache_scopes())
+        signature = '|'.join([
+            type(self).__name__, self.action, request.get_host(), request.get_full_path(),
+            str(self.get_cache_vary()),
+            *(token for token, _ in versions),
+        ])
+        key = hashlib.md5(signature.encode()).hexdigest()
+        etag = quote_etag(key)
+        last_modified = int(max(timestamp for _, timestamp in versions))
+
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+        if_modified_since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+        if (if_none_match and matches_etag(if_none_match, etag)) or \
+                (not if_none_match and if_modified_since and if_modified_since >= last_modified):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            cache = get_cache()
+            data = cache.get(f'response:{key}')
+            if data is not None:
+                response = Response(data)
+            else:
+                response = handler(request, *args, **kwargs)
+                if response.status_code == status.HTTP_200_OK:
+                    cache.set(f'response:{key}', response.data, RESPONSE_CACHE_TIMEOUT)
+        if response.status_code in (status.HTTP_200_OK, status.HTTP_304_NOT_MODIFIED):
+            response['ETag'] = etag
+            response['Last-Modified'] = http_date(last_modified)
+        return response
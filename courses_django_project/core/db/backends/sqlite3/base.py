@@ -0,0 +1,9 @@
+from django.db.backends.sqlite3 import base
+
+from core.db.pool import PooledDatabaseWrapperMixin
+
+
+class DatabaseWrapper(PooledDatabaseWrapperMixin, base.DatabaseWrapper):
+    """
+    The pooled SQLite backend, a stand-in for the pooled PostgreSQL backend in development and tests.
+    """
@@ -0,0 +1,192 @@
+import threading
+import time
+from collections import deque
+
+from django.db.utils import OperationalError
+
+POOL_DEFAULTS = {
+    'SIZE': 10,
+    'TIMEOUT': 30,
+    'CHECK_INTERVAL': 30,
+    'MAX_LIFETIME': 60 * 60,
+}
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class PoolTimeout(OperationalError):
+    pass
+
+
+class IdleConnection:
+    __slots__ = ('connection', 'created', 'released')
+
+    def __init__(self, connection, created, released):
+        self.connection = connection
+        self.created = created
+        self.released = released
+
+
+def check_connection(connection):
+    cursor = connection.cursor()
+    try:
+        cursor.execute('SELECT 1')
+    finally:
+        cursor.close()
+
+
+def close_connection(connection):
+    try:
+        connection.close()
+    except Exception:
+        pass
+
+
+class ConnectionPool:
+    """
+    Up to `size` database connections shared by the threads of a process. The most recently released
+    connection is handed out first; one idle for `check_interval` seconds is checked with `SELECT 1`
+    and connections older than `max_lifetime` are replaced. A checkout waits up to `timeout` seconds
+    for a connection when all of them are in use.
+    """
+
+    def __init__(self, connect, size=POOL_DEFAULTS['SIZE'], timeout=POOL_DEFAULTS['TIMEOUT'],
+                 check_interval=POOL_DEFAULTS['CHECK_INTERVAL'], max_lifetime=POOL_DEFAULTS['MAX_LIFETIME'],
+                 check=check_connection):
+        self.connect = connect
+        self.size = size
+        self.timeout = timeout
+        self.check_interval = check_interval
+        self.max_lifetime = max_lifetime
+        self.check = check
+        self.idle = deque()
+        self.created = {}
+        self.condition = threading.Condition()
+
+    @property
+    def open(self):
+        return len(self.created)
+
+    def take_idle(self, now):
+        """
+        The first healthy idle connection, connections that expired or failed their check are closed.
+        Called with the condition held.
+        """
+        while self.idle:
+            idle = self.idle.pop()
+            if self.max_lifetime is not None and now - idle.created >= self.max_lifetime:
+                self.discard(idle.connection)
+                continue
+            if self.check_interval is not None and now - idle.released >= self.check_interval:
+                try:
+                    self.check(idle.connection)
+                except Exception:
+                    self.discard(idle.connection)
+                    continue
+            return idle.connection
+        return None
+
+    def acquire(self):
+        deadline = time.monotonic() + self.timeout
+        with self.condition:
+            while True:
+                now = time.monotonic()
+                connection = self.take_idle(now)
+                if connection is not None:
+                    return connection
+                if self.open < self.size:
+                    break
+                if now >= deadline or not self.condition.wait(deadline - now):
+                    raise PoolTimeout(f'No database connection became free within {self.timeout} seconds')
+            key = object()
+            self.created[key] = now
+        try:
+            connection = self.connect()
+        except Exception:
+            with self.condition:
+                del self.created[key]
+                self.condition.notify()
+            raise
+        with self.condition:
+            self.created[id(connection)] = self.created.pop(key)
+        return connection
+
+    def release(self, connection, reusable=True):
+        """
+        Returns a connection to the pool, rolling back whatever it left uncommitted.
+        Connections that aren't reusable or fail the rollback are closed.
+        """
+        if reusable:
+            try:
+                connection.rollback()
+            except Exception:
+                reusable = False
+        with self.condition:
+            created = self.created.get(id(connection))
+            if created is None:
+                close_connection(connection)
+                return
+            if reusable:
+                self.idle.append(IdleConnection(connection, created, time.monotonic()))
+            else:
+                self.discard(connection)
+            self.condition.notify()
+
+    def discard(self, connection):
+        """
+        Closes a connection of the pool. Called with the condition held.
+        """
+        self.created.pop(id(connection), None)
+        close_connection(connection)
+
+    def close(self):
+        with self.condition:
+            while self.idle:
+                self.discard(self.idle.pop().connection)
+            self.condition.notify_all()
+
+
+def get_pool(alias, settings_dict, connect):
+    """
+    The pool of the database alias in this process, configured by the POOL entry of its settings.
+    """
+    with _pools_lock:
+        pool = _pools.get(alias)
+        if pool is None:
+            options = {**POOL_DEFAULTS, **settings_dict.get('POOL', {})}
+            pool = _pools[alias] = ConnectionPool(connect, size=options['SIZE'], timeout=options['TIMEOUT'],
+                                                  check_interval=options['CHECK_INTERVAL'],
+                                                  max_lifetime=options['MAX_LIFETIME'])
+        return pool
+
+
+def close_pools():
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
+
+
+class PooledDatabaseWrapperMixin:
+    """
+    Takes the connections of a database backend from the process pool and returns them on close
+    instead of closing them. With CONN_MAX_AGE = 0 Django closes the connection after every request,
+    which hands it back to the pool for the next request of any thread.
+    """
+
+    def get_pool(self):
+        return get_pool(self.alias, self.settings_dict, self.connect_params)
+
+    def connect_params(self):
+        return super().get_new_connection(self.get_connection_params())
+
+    def get_new_connection(self, conn_params):
+        return self.get_pool().acquire()
+
+    def _close(self):
+        if self.connection is None:
+            return
+        reusable = not self.errors_occurred or self.is_usable()
+        with self.wrap_database_errors:
+            self.get_pool().release(self.connection, reusable)
@@ -0,0 +1,60 @@
+import hashlib
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, connections
+
+_use_replica = ContextVar('use_replica', default=False)
+
+
+@contextmanager
+def replica_reads():
+    """
+    Lets the reads of the block go to a replica, e.g. while serving a safe request.
+    """
+    token = _use_replica.set(True)
+    try:
+        yield
+    finally:
+        _use_replica.reset(token)
+
+
+def sticky_key(credentials):
+    return 'db-sticky:' + hashlib.sha1(credentials.encode()).hexdigest()
+
+
+def is_sticky(credentials):
+    return bool(credentials) and caches[settings.DATABASE_STICKY_CACHE].get(sticky_key(credentials)) is not None
+
+
+def stick(credentials):
+    """
+    Sends the reads of the client with these credentials to the primary for DATABASE_STICKY_SECONDS,
+    so it reads its own writes while the replicas catch up.
+    """
+    if credentials:
+        caches[settings.DATABASE_STICKY_CACHE].set(sticky_key(credentials), 1, settings.DATABASE_STICKY_SECONDS)
+
+
+class ReplicaRouter:
+    """
+    Routes the reads allowed by `replica_reads` to a random DATABASE_REPLICAS alias outside transactions,
+    everything else to the primary database.
+    """
+
+    def db_for_read(self, model, **hints):
+        if settings.DATABASE_REPLICAS and _use_replica.get() and not connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return random.choice(settings.DATABASE_REPLICAS)
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        return db == DEFAULT_DB_ALIAS
@@ -0,0 +1,119 @@
+import asyncio
+import json
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from django.utils.module_loading import import_string
+
+
+class Subscription:
+    def __init__(self, channels, loop, maxsize):
+        self.channels = channels
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize)
+
+    def put(self, event):
+        if not self.queue.full():
+            self.queue.put_nowait(event)
+
+
+class LocalBackend:
+    """
+    Delivers events to the subscribers of this process only. A backend sharing events between
+    processes publishes them to its bus and calls `broker.deliver` for every event it receives.
+    """
+
+    def __init__(self, broker):
+        self.broker = broker
+
+    def publish(self, channels, event):
+        self.broker.deliver(channels, event)
+
+
+class Broker:
+    """
+    Fans events published to channels out to the event streams subscribed in this process.
+    Publishing is thread-safe, events are handed to the event loop of every subscription.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscriptions = defaultdict(set)
+        self._backend = None
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            self._backend = import_string(settings.EVENTS_BACKEND)(self)
+        return self._backend
+
+    def subscribe(self, channels):
+        subscription = Subscription(channels, asyncio.get_running_loop(), settings.EVENTS_QUEUE_SIZE)
+        with self.lock:
+            for channel in channels:
+                self.subscriptions[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            for channel in subscription.channels:
+                self.subscriptions[channel].discard(subscription)
+                if not self.subscriptions[channel]:
+                    del self.subscriptions[channel]
+
+    def publish(self, channels, event):
+        self.backend.publish(channels, event)
+
+    def deliver(self, channels, event):
+        with self.lock:
+            subscriptions = set().union(*(self.subscriptions.get(channel, ()) for channel in channels))
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.put, event)
+            except RuntimeError:
+                self.unsubscribe(subscription)
+
+
+broker = Broker()
+
+
+def format_event(event):
+    return f"event: {event['type']}\ndata: {json.dumps(event['data'])}\n\n".encode()
+
+
+async def stream_events(subscription, user_id, expires):
+    """
+    Yields the server-sent events of the subscription with keepalive comments in between, until
+    the access token of the stream expires. Events caused by the user are skipped.
+    """
+    try:
+        yield b'retry: 5000\n\n'
+        while True:
+            remaining = expires - time.time()
+            if remaining <= 0:
+                break
+            try:
+                event = await asyncio.wait_for(subscription.queue.get(), min(settings.EVENTS_KEEPALIVE, remaining))
+            except asyncio.TimeoutError:
+                yield b': keepalive\n\n'
+                continue
+            if event.get('actor') != user_id:
+                yield format_event(event)
+    finally:
+        broker.unsubscribe(subscription)
+
+
+class EventStreamResponse(StreamingHttpResponse):
+    """
+    A text/event-stream response over an async iterator, sent by AsyncStreamingASGIHandler.
+    """
+    is_async = True
+
+    def __init__(self, events, *args, **kwargs):
+        super().__init__((), *args, content_type='text/event-stream', **kwargs)
+        self.events = events
+        self['Cache-Control'] = 'no-cache'
+        self['X-Accel-Buffering'] = 'no'
@@ -0,0 +1,47 @@
+from rest_framework.permissions import SAFE_METHODS
+
+FIELDS_PARAM = 'fields'
+
+
+def field_path(serializer):
+    """
+    The dotted path of a nested serializer from the root one, '' for the root serializer.
+    Children of list serializers share the path of their list.
+    """
+    names = []
+    while serializer.parent is not None:
+        if serializer.field_name:
+            names.append(serializer.field_name)
+        serializer = serializer.parent
+    return '.'.join(reversed(names))
+
+
+def selected_fields(request, path=''):
+    """
+    The names selected with `?fields=` for the serializer at `path`, None when all its fields are kept.
+    """
+    if request is None or request.method not in SAFE_METHODS:
+        return None
+    value = request.query_params.get(FIELDS_PARAM)
+    if not value:
+        return None
+    prefix = f'{path}.' if path else ''
+    selected = {name[len(prefix):].split('.', 1)[0] for name in value.split(',')
+                if name.startswith(prefix) and len(name) > len(prefix)}
+    return selected or None
+
+
+class SparseFieldsMixin:
+    """
+    Keeps the fields of a response selected with `?fields=`, e.g. `?fields=id,user.username` returns solutions
+    with their id and the username of their author. A nested serializer none of whose fields are named keeps them all.
+    Serializers run for a field of another one get its path as context['fields_path'].
+    """
+
+    def get_fields(self):
+        fields = super().get_fields()
+        path = '.'.join(name for name in (self.context.get('fields_path'), field_path(self)) if name)
+        selected = selected_fields(self.context.get('request'), path)
+        if selected is None:
+            return fields
+        return {name: field for name, field in fields.items() if name in selected}
@@ -0,0 +1,102 @@
+import hashlib
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.http import parse_etags, quote_etag
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+READ_SIZE = 64 * 1024
+PLAIN_FILENAME_RE = re.compile(r'[\x20-\x7e]*')
+
+
+def get_etag(field_file):
+    return quote_etag(hashlib.md5(f'{field_file.name}:{field_file.size}'.encode()).hexdigest())
+
+
+def matches_etag(header, etag):
+    """
+    Whether an If-None-Match header matches the ETag, comparing weakly.
+    """
+    tags = parse_etags(header)
+    return '*' in tags or etag in (tag[2:] if tag.startswith('W/') else tag for tag in tags)
+
+
+def content_disposition(filename):
+    """
+    An attachment Content-Disposition, names that aren't printable ASCII go in an RFC 5987 `filename*`.
+    """
+    if PLAIN_FILENAME_RE.fullmatch(filename):
+        escaped = filename.replace('\\', '\\\\').replace('"', '\\"')
+        return f'attachment; filename="{escaped}"'
+    return f"attachment; filename*=utf-8''{quote(filename, safe='')}"
+
+
+def parse_range(header, size):
+    """
+    Returns the (start, end) byte positions of a single-range `Range` header, None if it can't be satisfied.
+    """
+    match = RANGE_RE.match(header.strip())
+    if not match or match.groups() == ('', ''):
+        return None
+    start, end = match.groups()
+    if not start:
+        start, end = max(size - int(end), 0), size - 1
+    else:
+        start, end = int(start), min(int(end), size - 1) if end else size - 1
+    if start > end or start >= size:
+        return None
+    return start, end
+
+
+def iter_range(file, start, length):
+    with file:
+        file.seek(start)
+        while length:
+            block = file.read(min(READ_SIZE, length))
+            if not block:
+                break
+            length -= len(block)
+            yield block
+
+
+def serve_file(request, field_file):
+    """
+    Serves a stored file with ETag, If-None-Match and single-range support,
+    or hands it off to the web server when SENDFILE_BACKEND is set.
+    """
+    etag = get_etag(field_file)
+    if matches_etag(request.META.get('HTTP_IF_NONE_MATCH', ''), etag):
+        response = HttpResponse(status=304)
+        response['ETag'] = etag
+        return response
+
+    filename = os.path.basename(field_file.name)
+    content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    if settings.SENDFILE_BACKEND == 'x-sendfile':
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = field_file.path
+    elif settings.SENDFILE_BACKEND == 'x-accel-redirect':
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = settings.SENDFILE_URL_PREFIX + field_file.name
+    elif 'HTTP_RANGE' in request.META:
+        size = field_file.size
+        byte_range = parse_range(request.META['HTTP_RANGE'], size)
+        if byte_range is None:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+        start, end = byte_range
+        response = StreamingHttpResponse(iter_range(field_file.open('rb'), start, end - start + 1),
+                                         status=206, content_type=content_type)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = end - start + 1
+    else:
+        response = FileResponse(field_file.open('rb'), content_type=content_type)
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Content-Disposition'] = content_disposition(filename)
+    return response
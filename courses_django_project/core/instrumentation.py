@@ -0,0 +1,271 @@
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import Http404, HttpResponse
+from django.utils.crypto import constant_time_compare
+from rest_framework.serializers import BaseSerializer
+
+METRICS = ('wall_ms', 'queries', 'sql_ms', 'serialize_ms', 'render_ms')
+QUANTILES = (0.5, 0.95, 0.99)
+# Snapshots not flushed for this many intervals belong to exited processes
+STALE_FLUSHES = 3
+
+_sample = ContextVar('instrumentation_sample', default=None)
+
+
+class QueryRecorder:
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.signatures = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+            self.signatures[sql] = self.signatures.get(sql, 0) + 1
+
+    def duplicates(self):
+        return {sql: count for sql, count in self.signatures.items() if count > 1}
+
+
+class Sample:
+    """
+    The measurements of a sampled request, shared by the threads serving it through a context variable.
+    """
+
+    def __init__(self):
+        self.recorder = QueryRecorder()
+        self.serialize_ms = 0.0
+        self.render_ms = 0.0
+        self.serializing = False
+
+
+def current_sample():
+    return _sample.get()
+
+
+@contextmanager
+def sampling(sample):
+    token = _sample.set(sample)
+    try:
+        yield sample
+    finally:
+        _sample.reset(token)
+
+
+def record_sampled_query(execute, sql, params, many, context):
+    sample = current_sample()
+    if sample is None:
+        return execute(sql, params, many, context)
+    return sample.recorder(execute, sql, params, many, context)
+
+
+def install_query_recorder(connection, **kwargs):
+    if record_sampled_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_sampled_query)
+
+
+def record_queries():
+    """
+    Records the queries of sampled requests on every connection, whichever thread serves them: the ones
+    open in this thread and, through `connection_created`, every one opened later. Installed once by the
+    instrumentation middleware.
+    """
+    for connection in connections.all():
+        install_query_recorder(connection)
+    connection_created.connect(install_query_recorder, dispatch_uid='record_sampled_queries')
+
+
+@contextmanager
+def timed_serialization():
+    """
+    Adds the time of the block to the serialization time of the sampled request, less the time of
+    the queries it ran, e.g. while evaluating a lazy queryset.
+    """
+    sample = current_sample()
+    if sample is None or sample.serializing:
+        yield
+        return
+    sample.serializing = True
+    started, sql = time.perf_counter(), sample.recorder.duration
+    try:
+        yield
+    finally:
+        sample.serializing = False
+        sample.serialize_ms += (time.perf_counter() - started - (sample.recorder.duration - sql)) * 1000
+
+
+@contextmanager
+def timed_rendering():
+    sample = current_sample()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if sample is not None:
+            sample.render_ms += (time.perf_counter() - started) * 1000
+
+
+def time_serializers():
+    """
+    Times `serializer.data` of every serializer, installed once by the instrumentation middleware.
+    """
+    data = BaseSerializer.data.fget
+    if getattr(data, 'timed', False):
+        return
+
+    def timed_data(self):
+        with timed_serialization():
+            return data(self)
+
+    timed_data.timed = True
+    BaseSerializer.data = property(timed_data)
+
+
+class Registry:
+    """
+    Keeps a rolling window of samples per view in this process. A background thread flushes it to
+    INSTRUMENTATION_DIR every INSTRUMENTATION_FLUSH_INTERVAL seconds, so reports can merge the samples
+    of every worker process without requests waiting on the file. The thread stops once instrumentation
+    is disabled and the next sample starts it again.
+    """
+
+    def __init__(self, window):
+        self.lock = threading.Lock()
+        self.samples = defaultdict(lambda: deque(maxlen=window))
+        self.duplicates = defaultdict(Counter)
+        self.flusher = None
+
+    def add(self, view, sample, duplicates):
+        with self.lock:
+            self.samples[view].append(sample)
+            self.duplicates[view].update(duplicates)
+            if self.flusher is None or not self.flusher.is_alive():
+                self.flusher = threading.Thread(target=self.run_flusher, name='instrumentation-flush', daemon=True)
+                self.flusher.start()
+
+    def run_flusher(self):
+        while True:
+            time.sleep(settings.INSTRUMENTATION_FLUSH_INTERVAL)
+            if not settings.INSTRUMENTATION_ENABLED:
+                return
+            try:
+                self.flush(settings.INSTRUMENTATION_DIR)
+            except OSError:
+                continue
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                view: {'samples': list(samples), 'duplicates': dict(self.duplicates[view].most_common(20))}
+                for view, samples in self.samples.items()
+            }
+
+    def flush(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f'{os.getpid()}.json')
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as tmp_file:
+            json.dump(self.snapshot(), tmp_file)
+        os.replace(tmp_path, path)
+
+
+registry = Registry(getattr(settings, 'INSTRUMENTATION_WINDOW', 1000))
+
+
+def load_snapshots():
+    """
+    Merges the flushed snapshots of all processes with the live samples of this one. Snapshots older than
+    STALE_FLUSHES flush intervals were left by exited processes and are deleted.
+    """
+    snapshots = []
+    directory = settings.INSTRUMENTATION_DIR
+    stale = time.time() - STALE_FLUSHES * settings.INSTRUMENTATION_FLUSH_INTERVAL
+    if os.path.isdir(directory):
+        for name in os.listdir(directory):
+            if name.endswith('.json') and name != f'{os.getpid()}.json':
+                path = os.path.join(directory, name)
+                try:
+                    if os.path.getmtime(path) < stale:
+                        os.remove(path)
+                        continue
+                    with open(path) as snapshot:
+                        snapshots.append(json.load(snapshot))
+                except (OSError, ValueError):
+                    continue
+    snapshots.append(registry.snapshot())
+
+    merged = defaultdict(lambda: {'samples': [], 'duplicates': Counter()})
+    for snapshot in snapshots:
+        for view, data in snapshot.items():
+            merged[view]['samples'].extend(data['samples'])
+            merged[view]['duplicates'].update(data['duplicates'])
+    return merged
+
+
+def quantile(values, fraction):
+    values = sorted(values)
+    return values[min(int(round(fraction * (len(values) - 1))), len(values) - 1)]
+
+
+def summarize():
+    summary = {}
+    for view, data in load_snapshots().items():
+        samples = data['samples']
+        if not samples:
+            continue
+        summary[view] = {
+            'count': len(samples),
+            'duplicates': data['duplicates'],
+            **{
+                metric: {fraction: quantile([sample.get(metric, 0) for sample in samples], fraction)
+                         for fraction in QUANTILES}
+                for metric in METRICS
+            },
+        }
+    return summary
+
+
+def prometheus_text(summary):
+    lines = []
+    for metric in METRICS:
+        name = f'courses_view_{metric}'
+        lines.append(f'# TYPE {name} summary')
+        for view, data in sorted(summary.items()):
+            for fraction, value in data[metric].items():
+                lines.append(f'{name}{{view="{view}",quantile="{fraction}"}} {value}')
+            lines.append(f'{name}_count{{view="{view}"}} {data["count"]}')
+    lines.append('# TYPE courses_view_duplicate_queries counter')
+    for view, data in sorted(summary.items()):
+        lines.append(f'courses_view_duplicate_queries{{view="{view}"}} {sum(data["duplicates"].values())}')
+    return '\n'.join(lines) + '\n'
+
+
+def can_read_metrics(request):
+    """
+    Staff users and scrapers sending `Authorization: Bearer <INSTRUMENTATION_METRICS_TOKEN>` may read the metrics.
+    """
+    token = settings.INSTRUMENTATION_METRICS_TOKEN
+    if token and constant_time_compare(request.META.get('HTTP_AUTHORIZATION', ''), f'Bearer {token}'):
+        return True
+    user = getattr(request, 'user', None)
+    return user is not None and user.is_staff
+
+
+def metrics_view(request):
+    if not settings.INSTRUMENTATION_ENABLED or not can_read_metrics(request):
+        raise Http404
+    return HttpResponse(prometheus_text(summarize()), content_type='text/plain; version=0.0.4')
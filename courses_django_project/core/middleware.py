@@ -0,0 +1,155 @@
+import asyncio
+import random
+import time
+
+from asgiref.sync import markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured, MiddlewareNotUsed
+from rest_framework.permissions import SAFE_METHODS
+
+from core.db.router import is_sticky, replica_reads, stick
+from core.instrumentation import (
+    time_serializers,
+    timed_rendering,
+    record_queries,
+    current_sample,
+    sampling,
+    registry,
+    Sample,
+)
+
+
+def get_view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return None
+    func = match.func
+    cls = getattr(func, 'cls', None) or getattr(func, 'view_class', None)
+    if cls is None:
+        return match.view_name or func.__name__
+    actions = getattr(func, 'actions', None)
+    if actions:
+        return f'{cls.__name__}.{actions.get(request.method.lower(), request.method.lower())}'
+    return f'{cls.__name__}.{request.method.lower()}'
+
+
+class InstrumentationMiddleware:
+    """
+    Records wall time, query count, SQL time, duplicate queries, serialization and render time of sampled
+    requests per resolved view and reports them in a Server-Timing header. Disabled unless INSTRUMENTATION_ENABLED.
+    Runs on the event loop under ASGI, so requests aren't serialized onto the thread of sync middleware.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.INSTRUMENTATION_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.sample_rate = settings.INSTRUMENTATION_SAMPLE_RATE
+        if asyncio.iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        time_serializers()
+        record_queries()
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        if random.random() >= self.sample_rate:
+            return self.get_response(request)
+        started = time.perf_counter()
+        with sampling(Sample()) as sample:
+            response = self.get_response(request)
+        return self.report(request, response, sample, started)
+
+    async def __acall__(self, request):
+        if random.random() >= self.sample_rate:
+            return await self.get_response(request)
+        started = time.perf_counter()
+        with sampling(Sample()) as sample:
+            response = await self.get_response(request)
+        return self.report(request, response, sample, started)
+
+    def report(self, request, response, sample, started):
+        wall_ms = (time.perf_counter() - started) * 1000
+        recorder = sample.recorder
+
+        view = get_view_name(request)
+        if view is not None:
+            registry.add(view, {
+                'wall_ms': round(wall_ms, 3),
+                'queries': recorder.count,
+                'sql_ms': round(recorder.duration * 1000, 3),
+                'serialize_ms': round(sample.serialize_ms, 3),
+                'render_ms': round(sample.render_ms, 3),
+            }, recorder.duplicates())
+        response['Server-Timing'] = ', '.join([
+            f'app;dur={wall_ms:.2f}',
+            f'db;dur={recorder.duration * 1000:.2f};desc="{recorder.count} queries"',
+            f'serialize;dur={sample.serialize_ms:.2f}',
+            f'render;dur={sample.render_ms:.2f}',
+        ])
+        return response
+
+    def process_template_response(self, request, response):
+        if current_sample() is None:
+            return response
+        render = response.render
+
+        def timed_render():
+            with timed_rendering():
+                return render()
+
+        response.render = timed_render
+        return response
+
+
+def get_credentials(request):
+    return request.META.get('HTTP_AUTHORIZATION') or request.COOKIES.get(settings.SESSION_COOKIE_NAME, '')
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Serves the reads of safe requests from the DATABASE_REPLICAS. A successful unsafe request pins the
+    reads of its client to the primary for DATABASE_STICKY_SECONDS, so clients read their own writes.
+    Disabled without replicas. Under ASGI it runs on the event loop and reaches the sticky cache from
+    the thread pool.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.DATABASE_REPLICAS:
+            raise MiddlewareNotUsed
+        if settings.CACHES[settings.DATABASE_STICKY_CACHE]['BACKEND'] in settings.LOCAL_CACHE_BACKENDS:
+            # Another process would serve the next read of a client from a replica that lacks its write
+            raise ImproperlyConfigured('DATABASE_REPLICAS need a DATABASE_STICKY_CACHE shared by every process')
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        credentials = get_credentials(request)
+        if request.method not in SAFE_METHODS:
+            response = self.get_response(request)
+            if response.status_code < 400:
+                stick(credentials)
+            return response
+        if is_sticky(credentials):
+            return self.get_response(request)
+        with replica_reads():
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        credentials = get_credentials(request)
+        if request.method not in SAFE_METHODS:
+            response = await self.get_response(request)
+            if response.status_code < 400:
+                await sync_to_async(stick, thread_sensitive=False)(credentials)
+            return response
+        if credentials and await sync_to_async(is_sticky, thread_sensitive=False)(credentials):
+            return await self.get_response(request)
+        with replica_reads():
+            return await self.get_response(request)
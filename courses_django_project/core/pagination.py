@@ -0,0 +1,27 @@
+from django.conf import settings
+from rest_framework.pagination import CursorPagination, LimitOffsetPagination
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Cursor pagination over the primary key, so every page is a single indexed range scan.
+    Views may override `cursor_ordering` and `page_size`.
+    """
+    ordering = 'id'
+    page_size_query_param = 'page_size'
+    max_page_size = settings.REST_FRAMEWORK.get('MAX_PAGE_SIZE', 100)
+
+    def get_ordering(self, request, queryset, view):
+        return (getattr(view, 'cursor_ordering', self.ordering),)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = getattr(view, 'page_size', self.page_size)
+        return super().paginate_queryset(queryset, request, view)
+
+
+class RankedPagination(LimitOffsetPagination):
+    """
+    Limit/offset pagination for results ordered by a computed rank, which a cursor can't follow.
+    """
+    default_limit = settings.REST_FRAMEWORK.get('PAGE_SIZE')
+    max_limit = settings.REST_FRAMEWORK.get('MAX_PAGE_SIZE', 100)
@@ -1,7 +1,8 @@
-from rest_framework.generics import get_object_or_404
+from django.http import Http404
 from rest_framework.permissions import BasePermission, SAFE_METHODS
 
 from courses.models import Course
+from courses.membership import is_participant
 
 from users.enum_types import RoleTypes
 
@@ -28,5 +29,12 @@ class StudentOrTeacherReadOnly(BasePermission):
 
 class IsParticipant(BasePermission):
     def has_permission(self, request, view):
-        course = get_object_or_404(Course, pk=view.kwargs['course_pk'])
-        return request.user in course.participants.all()
+        try:
+            course_pk = int(view.kwargs['course_pk'])
+        except (TypeError, ValueError):
+            raise Http404
+        if is_participant(request, course_pk):
+            return True
+        if not Course.objects.filter(pk=course_pk).exists():
+            raise Http404
+        return False
@@ -0,0 +1,91 @@
+import math
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+from users.enum_types import RoleTypes
+
+DURATIONS = {'s': 1, 'm': 60, 'h': 60 * 60, 'd': 24 * 60 * 60}
+LOCK_TIMEOUT = 1
+LOCK_WAIT = 0.05
+
+
+@lru_cache(maxsize=None)
+def parse_rate(rate):
+    """
+    The capacity and the tokens per second of a `<requests>/<period>` rate, e.g. `10/minute`.
+    """
+    count, period = rate.split('/')
+    return int(count), int(count) / DURATIONS[period[0]]
+
+
+def take(state, capacity, rate, now):
+    """
+    Refills a (tokens, updated) bucket up to `now` and takes a token from it. Returns the new state
+    and 0, or the refilled bucket and the seconds until it holds a token again.
+    """
+    tokens, updated = state if state is not None else (capacity, now)
+    tokens = min(capacity, tokens + (now - updated) * rate)
+    if tokens >= 1:
+        return (tokens - 1, now), 0
+    return (tokens, now), (1 - tokens) / rate
+
+
+@contextmanager
+def bucket_lock(cache, key):
+    """
+    Serializes the read and write of a bucket with an atomic `cache.add` of a lock key, which expires after
+    LOCK_TIMEOUT seconds should its holder die. A request that can't take the lock within LOCK_WAIT seconds
+    goes on without it, so heavy contention on one bucket makes its limit approximate instead of slow.
+    """
+    lock = f'{key}:lock'
+    deadline = time.monotonic() + LOCK_WAIT
+    locked = cache.add(lock, 1, LOCK_TIMEOUT)
+    while not locked and time.monotonic() < deadline:
+        time.sleep(0.001)
+        locked = cache.add(lock, 1, LOCK_TIMEOUT)
+    try:
+        yield
+    finally:
+        if locked:
+            cache.delete(lock)
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Throttles the actions views name in `throttle_scopes` (or all with `throttle_scope`) at the rate
+    of the scope in DEFAULT_THROTTLE_RATES, with a bucket per scope, user and course. Anonymous clients
+    are keyed by address (see NUM_PROXIES) and teachers aren't throttled. Buckets live in the THROTTLE_CACHE
+    cache, a throttled request takes the bucket lock, reads and writes the bucket.
+    """
+
+    def __init__(self):
+        self.delay = None
+
+    def get_scope(self, view):
+        scopes = getattr(view, 'throttle_scopes', {})
+        return scopes.get(getattr(view, 'action', None), getattr(view, 'throttle_scope', None))
+
+    def get_cache_key(self, request, view, scope):
+        ident = request.user.id if request.user.is_authenticated else self.get_ident(request)
+        return f"throttle:{scope}:{ident}:{view.kwargs.get('course_pk', '')}"
+
+    def allow_request(self, request, view):
+        scope = self.get_scope(view)
+        if scope is None or getattr(request.user, 'role', None) == RoleTypes.TEACHER.value:
+            return True
+        capacity, rate = parse_rate(api_settings.DEFAULT_THROTTLE_RATES[scope])
+        cache = caches[settings.THROTTLE_CACHE]
+        key = self.get_cache_key(request, view, scope)
+        with bucket_lock(cache, key):
+            state, self.delay = take(cache.get(key), capacity, rate, time.time())
+            cache.set(key, state, math.ceil(capacity / rate))
+        return not self.delay
+
+    def wait(self):
+        return self.delay
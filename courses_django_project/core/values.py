@@ -0,0 +1,145 @@
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import FileField
+from django.db.models.fields.files import FieldFile
+from rest_framework import fields, relations, serializers
+from rest_framework.pagination import CursorPagination
+from rest_framework.response import Response
+
+from core.instrumentation import timed_serialization
+
+PLAIN_FIELDS = (fields.IntegerField, fields.CharField, fields.BooleanField)
+COMPUTED_FIELDS = (
+    serializers.BaseSerializer,
+    relations.ManyRelatedField,
+    fields.SerializerMethodField,
+    relations.RelatedField,
+)
+
+
+class Unsupported(Exception):
+    pass
+
+
+def get_converter(field, model_field):
+    """
+    The function turning a column value into the representation of the field, None when they're equal
+    """
+    if type(field) in PLAIN_FIELDS:
+        return None
+    if isinstance(model_field, FileField):
+        return lambda name: field.to_representation(FieldFile(None, model_field, name))
+    return field.to_representation
+
+
+def compile_fields(serializer, model, annotations=(), prefix=''):
+    """
+    (key, column, converter, nested fields) of every readable field of the serializer.
+    Nested serializers of forward relations read the columns of the related model through the join,
+    fields the columns can't express raise Unsupported.
+    """
+    plan = []
+    for name, field in serializer.fields.items():
+        if field.write_only:
+            continue
+        if len(field.source_attrs) != 1:
+            raise Unsupported(name)
+        column = f'{prefix}{field.source}'
+        if not prefix and field.source in annotations:
+            if isinstance(field, COMPUTED_FIELDS):
+                raise Unsupported(name)
+            plan.append((name, column, field.to_representation, None))
+            continue
+        try:
+            model_field = model._meta.get_field(field.source)
+        except FieldDoesNotExist:
+            raise Unsupported(name)
+        if not model_field.concrete or model_field.many_to_many:
+            raise Unsupported(name)
+        if isinstance(field, serializers.BaseSerializer):
+            if isinstance(field, serializers.ListSerializer) or not model_field.is_relation:
+                raise Unsupported(name)
+            plan.append((name, column, None, compile_fields(field, model_field.related_model, prefix=f'{column}__')))
+        elif isinstance(field, relations.PrimaryKeyRelatedField) and field.pk_field is None:
+            plan.append((name, column, None, None))
+        elif isinstance(field, COMPUTED_FIELDS) or model_field.is_relation:
+            raise Unsupported(name)
+        else:
+            plan.append((name, column, get_converter(field, model_field), None))
+    return plan
+
+
+def get_columns(plan):
+    for _, column, _, nested in plan:
+        yield column
+        if nested is not None:
+            yield from get_columns(nested)
+
+
+def represent(plan, row):
+    item = {}
+    for key, column, convert, nested in plan:
+        value = row[column]
+        if value is None:
+            item[key] = None
+        elif nested is not None:
+            item[key] = represent(nested, row)
+        else:
+            item[key] = value if convert is None else convert(value)
+    return item
+
+
+class ValuesPlan:
+    """
+    Reads the representation of a serializer from `.values()` rows, without model instances
+    and without running the serializer per row.
+    """
+
+    def __init__(self, serializer, queryset):
+        self.fields = compile_fields(serializer, queryset.model, queryset.query.annotations)
+        self.columns = list(dict.fromkeys(get_columns(self.fields)))
+
+    def values(self, queryset, *extra):
+        return queryset.prefetch_related(None).values(*dict.fromkeys((*self.columns, *extra)))
+
+    def represent(self, rows):
+        with timed_serialization():
+            return [represent(self.fields, row) for row in rows]
+
+
+def compile_plan(serializer, queryset):
+    """
+    The values plan of the serializer, None when one of its fields needs the regular serializer.
+    """
+    try:
+        return ValuesPlan(serializer, queryset)
+    except Unsupported:
+        return None
+
+
+class ValuesListMixin:
+    """
+    Lists through the values plan of the view serializer when it has one, which returns the same
+    data as the serializer; method fields, to-many relations and custom sources use the serializer.
+    Views list through the serializer unless they set `values_list = True` or VALUES_LISTS is on.
+    """
+    values_list = None
+
+    def uses_values_list(self):
+        return settings.VALUES_LISTS if self.values_list is None else self.values_list
+
+    def list(self, request, *args, **kwargs):
+        if not self.uses_values_list():
+            return super().list(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset())
+        plan = compile_plan(self.get_serializer(), queryset)
+        if plan is None:
+            return super().list(request, *args, **kwargs)
+        ordering = ()
+        if isinstance(self.paginator, CursorPagination):
+            ordering = [name.lstrip('-') for name in self.paginator.get_ordering(request, queryset, self)]
+        rows = plan.values(queryset, *ordering)
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(plan.represent(page))
+        return Response(plan.represent(rows))
@@ -1,24 +1,41 @@
+import csv
+import io
+import os
+
 from rest_framework import serializers
 
+from core.fieldsets import SparseFieldsMixin
+
 from courses.models import (
     Solution,
     Lecture,
     Comment,
+    LectureUpload,
+    DocumentContent,
+    StudentGrades,
+    SearchEntry,
+    TaskGrades,
+    Change,
     Course,
     Mark,
     Task,
 )
 
+from courses.enum_types import ChangeTarget, EnrollmentStatus, MarkingStatus
+from courses.membership import invalidate_membership
+
 from users.api.v1.serializers import UserSerializer
 
 
-class CourseSerializer(serializers.ModelSerializer):
+class CourseSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     participants = UserSerializer(many=True, read_only=True)
 
     def create(self, validated_data):
         course = super().create(validated_data)
-        course.participants.add(self.context['request'].user)
+        user = self.context['request'].user
+        course.participants.add(user.id)
         course.save()
+        invalidate_membership(course.id, [user.id])
         return course
 
     class Meta:
@@ -26,12 +43,129 @@ class CourseSerializer(serializers.ModelSerializer):
         fields = ('id', 'title', 'participants')
 
 
-class LectureSerializer(serializers.ModelSerializer):
+class CourseCloneSerializer(serializers.Serializer):
+    title = serializers.CharField(max_length=256, required=False)
+
+    class Meta:
+        fields = ('title',)
+
+
+class BundleDocumentSerializer(serializers.Serializer):
+    name = serializers.CharField(max_length=200)
+    sha256 = serializers.RegexField(r'^[0-9a-f]{64}$')
+    size = serializers.IntegerField(min_value=0)
+
+    def validate_name(self, value):
+        name = os.path.basename(value)
+        if not name:
+            raise serializers.ValidationError("Invalid file name")
+        return name
+
+    class Meta:
+        fields = ('name', 'sha256', 'size')
+
+
+class BundleTaskSerializer(serializers.Serializer):
+    text = serializers.CharField()
+
+    class Meta:
+        fields = ('text',)
+
+
+class BundleLectureSerializer(serializers.Serializer):
+    topic = serializers.CharField(max_length=256)
+    document = BundleDocumentSerializer(required=False, allow_null=True)
+    tasks = BundleTaskSerializer(many=True, required=False, default=list)
+
+    class Meta:
+        fields = ('topic', 'document', 'tasks')
+
+
+class CourseBundleSerializer(serializers.Serializer):
+    max_lectures = 1000
+    max_tasks = 10000
+    version = serializers.IntegerField(min_value=1, max_value=1)
+    title = serializers.CharField(max_length=256)
+    lectures = BundleLectureSerializer(many=True)
+
+    def validate_lectures(self, lectures):
+        if len(lectures) > self.max_lectures:
+            raise serializers.ValidationError(f"A bundle may have at most {self.max_lectures} lectures")
+        if sum(len(lecture['tasks']) for lecture in lectures) > self.max_tasks:
+            raise serializers.ValidationError(f"A bundle may have at most {self.max_tasks} tasks")
+        return lectures
+
+    class Meta:
+        fields = ('version', 'title', 'lectures')
+
+
+class CourseIdsSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    participants = serializers.PrimaryKeyRelatedField(many=True, read_only=True)
+
+    class Meta:
+        model = Course
+        fields = ('id', 'title', 'participants')
+
+
+class CourseCountSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    participants_count = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = Course
+        fields = ('id', 'title', 'participants_count')
+
+
+class LectureSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Lecture
         fields = ('id', 'topic', 'document')
 
 
+class DocumentContentSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    preview_length = 1000
+    preview = serializers.SerializerMethodField()
+
+    def get_preview(self, content):
+        return content.text[:self.preview_length]
+
+    class Meta:
+        model = DocumentContent
+        fields = ('sha256', 'size', 'content_type', 'pages', 'preview', 'extracted')
+
+
+class LectureUploadSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    def validate_filename(self, value):
+        filename = os.path.basename(value)
+        if not filename:
+            raise serializers.ValidationError("Invalid file name")
+        return filename
+
+    def validate_sha256(self, value):
+        return value.lower()
+
+    class Meta:
+        model = LectureUpload
+        fields = ('id', 'filename', 'size', 'sha256', 'offset')
+        read_only_fields = ('id', 'offset')
+        extra_kwargs = {
+            'size': {'min_value': 1},
+            'sha256': {'min_length': 64, 'max_length': 64},
+        }
+
+
+class LectureUploadCompleteSerializer(serializers.Serializer):
+    topic = serializers.CharField(max_length=256, required=False)
+    lecture = serializers.IntegerField(required=False)
+
+    def validate(self, attrs):
+        if not attrs.get('topic') and not attrs.get('lecture'):
+            raise serializers.ValidationError("Provide a topic for a new lecture or an existing lecture id")
+        return attrs
+
+    class Meta:
+        fields = ('topic', 'lecture')
+
+
 class ParticipantSerializer(serializers.Serializer):
     id = serializers.IntegerField()
 
@@ -40,13 +174,61 @@ class ParticipantSerializer(serializers.Serializer):
         read_only_fields = ('id',)
 
 
-class TaskSerializer(serializers.ModelSerializer):
+class BulkParticipantSerializer(serializers.Serializer):
+    ids = serializers.ListField(child=serializers.IntegerField(), required=False)
+    file = serializers.FileField(required=False)
+
+    def read_file(self, file):
+        """
+        The user ids in the first column of a CSV file and the (row number, value) of the rows that hold
+        no id. A first row without an id is a header.
+        """
+        ids, invalid = [], []
+        try:
+            for number, row in enumerate(csv.reader(io.TextIOWrapper(file, encoding='utf-8-sig')), 1):
+                value = row[0].strip() if row else ''
+                if value.isdigit():
+                    ids.append(int(value))
+                elif number > 1 and any(cell.strip() for cell in row):
+                    invalid.append((number, value))
+        except (UnicodeDecodeError, csv.Error):
+            raise serializers.ValidationError({'file': "Upload a UTF-8 encoded CSV file"})
+        return ids, invalid
+
+    def validate(self, attrs):
+        ids, invalid = list(attrs.get('ids', [])), []
+        if 'file' in attrs:
+            rows, invalid = self.read_file(attrs['file'])
+            ids.extend(rows)
+        if not ids and not invalid:
+            raise serializers.ValidationError("Provide a list of user ids or a CSV file")
+        return {'ids': list(dict.fromkeys(ids)), 'invalid': invalid}
+
+    class Meta:
+        fields = ('ids', 'file')
+
+
+class BulkParticipantResultSerializer(serializers.Serializer):
+    """
+    The result for a user id, or for a CSV row holding no user id with its number and first column
+    """
+    id = serializers.IntegerField(allow_null=True)
+    status = serializers.ChoiceField(choices=EnrollmentStatus.items())
+    row = serializers.IntegerField(required=False)
+    value = serializers.CharField(required=False)
+
+    class Meta:
+        fields = ('id', 'status', 'row', 'value')
+        read_only_fields = ('id', 'status', 'row', 'value')
+
+
+class TaskSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Task
         fields = ('id', 'text')
 
 
-class SolutionSerializer(serializers.ModelSerializer):
+class SolutionSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
 
     class Meta:
@@ -54,15 +236,190 @@ class SolutionSerializer(serializers.ModelSerializer):
         fields = ('id', 'user', 'text')
 
 
-class MarkSerializer(serializers.ModelSerializer):
+class SimilarSolutionSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    user = UserSerializer(read_only=True)
+
+    class Meta:
+        model = Solution
+        fields = ('id', 'user', 'created')
+
+
+class SimilarityClusterSerializer(SparseFieldsMixin, serializers.Serializer):
+    similarity = serializers.FloatField()
+    solutions = SimilarSolutionSerializer(many=True)
+
+    class Meta:
+        fields = ('similarity', 'solutions')
+
+
+class MarkSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Mark
         fields = ('id', 'result')
 
 
-class CommentSerializer(serializers.ModelSerializer):
+class StudentGradesSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    user = UserSerializer(read_only=True)
+    mean = serializers.FloatField(read_only=True)
+
+    class Meta:
+        model = StudentGrades
+        fields = ('user', 'count', 'mean', 'histogram')
+
+
+class TaskGradesSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    mean = serializers.FloatField(read_only=True)
+
+    class Meta:
+        model = TaskGrades
+        fields = ('task', 'count', 'mean', 'histogram')
+
+
+class GradingQueueSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    user = UserSerializer(read_only=True)
+
+    class Meta:
+        model = Solution
+        fields = ('id', 'lecture', 'task', 'user', 'text', 'created')
+
+
+class BatchMarkSerializer(serializers.Serializer):
+    solution = serializers.IntegerField()
+    result = serializers.IntegerField(min_value=1, max_value=10)
+
+    class Meta:
+        fields = ('solution', 'result')
+
+
+class BatchMarkingSerializer(serializers.Serializer):
+    max_marks = 500
+    marks = BatchMarkSerializer(many=True, allow_empty=False)
+
+    def validate_marks(self, marks):
+        if len(marks) > self.max_marks:
+            raise serializers.ValidationError(f"Mark at most {self.max_marks} solutions at once")
+        solutions = [mark['solution'] for mark in marks]
+        if len(set(solutions)) != len(solutions):
+            raise serializers.ValidationError("Every solution may be marked once")
+        return marks
+
+    class Meta:
+        fields = ('marks',)
+
+
+class BatchMarkingResultSerializer(serializers.Serializer):
+    solution = serializers.IntegerField()
+    mark = serializers.IntegerField(allow_null=True)
+    status = serializers.ChoiceField(choices=MarkingStatus.items())
+
+    class Meta:
+        fields = ('solution', 'mark', 'status')
+        read_only_fields = ('solution', 'mark', 'status')
+
+
+class CommentSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
 
     class Meta:
         model = Comment
         fields = ('id', 'user', 'text')
+
+
+class ChangeSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    """
+    A change log entry with the current state of the changed object,
+    `data` is null once the object is deleted
+    """
+    data = serializers.SerializerMethodField()
+    target_serializers = {
+        ChangeTarget.LECTURE.value: LectureSerializer,
+        ChangeTarget.TASK.value: TaskSerializer,
+        ChangeTarget.SOLUTION.value: SolutionSerializer,
+        ChangeTarget.MARK.value: MarkSerializer,
+        ChangeTarget.COMMENT.value: CommentSerializer,
+    }
+
+    def get_data(self, change):
+        instance = self.context['objects'].get((change.target, change.object_id))
+        if instance is None:
+            return None
+        context = {**self.context, 'fields_path': 'data'}
+        return self.target_serializers[change.target](instance, context=context).data
+
+    class Meta:
+        model = Change
+        fields = ('id', 'target', 'action', 'object_id', 'parent_id', 'created', 'data')
+
+
+class SearchResultSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    snippet_length = 200
+    snippet = serializers.SerializerMethodField()
+    rank = serializers.FloatField(read_only=True)
+
+    def get_snippet(self, entry):
+        return entry.text[:self.snippet_length]
+
+    class Meta:
+        model = SearchEntry
+        fields = ('target', 'object_id', 'parent_id', 'solution_id', 'course', 'lecture', 'snippet', 'rank')
+
+
+class TreeSerializerMixin:
+    """
+    A level of the course tree. Keeps the fields selected for `Meta.resource` in context['fields']
+    (all when nothing is selected) and the `Meta.children` levels within context['depth'].
+    """
+
+    def get_fields(self):
+        fields = super().get_fields()
+        selected = self.context['fields'].get(self.Meta.resource)
+        children = getattr(self.Meta, 'children', {})
+        return {
+            name: field for name, field in fields.items()
+            if (children[name] <= self.context['depth'] if name in children else selected is None or name in selected)
+        }
+
+
+class TreeSolutionSerializer(TreeSerializerMixin, serializers.ModelSerializer):
+    user = UserSerializer(read_only=True)
+    mark = MarkSerializer(read_only=True)
+    comments_count = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = Solution
+        fields = ('id', 'user', 'text', 'created', 'mark', 'comments_count')
+        resource = 'solution'
+
+
+class TreeTaskSerializer(TreeSerializerMixin, serializers.ModelSerializer):
+    solutions = TreeSolutionSerializer(many=True, read_only=True, source='tree_solutions')
+
+    class Meta:
+        model = Task
+        fields = ('id', 'text', 'solutions')
+        resource = 'task'
+        children = {'solutions': 3}
+
+
+class TreeLectureSerializer(TreeSerializerMixin, serializers.ModelSerializer):
+    tasks = TreeTaskSerializer(many=True, read_only=True, source='tree_tasks')
+
+    class Meta:
+        model = Lecture
+        fields = ('id', 'topic', 'document', 'tasks')
+        resource = 'lecture'
+        children = {'tasks': 2}
+
+
+class CourseTreeSerializer(TreeSerializerMixin, serializers.ModelSerializer):
+    """
+    A course with its lectures, their tasks and the solutions visible to the user,
+    each solution with its mark and the number of comments on it
+    """
+    lectures = TreeLectureSerializer(many=True, read_only=True, source='tree_lectures')
+
+    class Meta:
+        model = Course
+        fields = ('id', 'title', 'lectures')
+        resource = 'course'
+        children = {'lectures': 1}
@@ -1,14 +1,21 @@
+from django.conf import settings
 from django.urls import path, include
 
 from rest_framework_nested import routers
 
+from core.async_views import asyncify
+
 from courses.api.v1 import views
 
 router = routers.SimpleRouter()
 router.register('courses', views.CourseViewSet)
+router.register('search', views.SearchViewSet, basename='search')
 course_router = routers.NestedSimpleRouter(router, 'courses', lookup='course')
 course_router.register('lectures', views.LectureViewSet, basename='lectures')
 course_router.register('participants', views.ParticipantViewSet, basename='participants')
+course_router.register('uploads', views.LectureUploadViewSet, basename='uploads')
+course_router.register('grading-queue', views.GradingQueueViewSet, basename='grading-queue')
+course_router.register('grades', views.GradesViewSet, basename='grades')
 lecture_router = routers.NestedSimpleRouter(course_router, 'lectures', lookup='lecture')
 lecture_router.register('tasks', views.TaskViewSet, basename='tasks')
 task_router = routers.NestedSimpleRouter(lecture_router, 'tasks', lookup='task')
@@ -28,3 +35,6 @@ urlpatterns = [
     path('', include(solution_router.urls)),
     path('', include(mark_router.urls)),
 ]
+
+if settings.ASYNC_VIEWS:
+    urlpatterns = asyncify(urlpatterns)
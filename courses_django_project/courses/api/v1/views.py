@@ -1,13 +1,23 @@
-from django.http import Http404
+import re
+
+from django.db import transaction
+from django.db.models import Count, OuterRef, Prefetch, Subquery
+from django.http import FileResponse, Http404, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 
 from rest_framework import viewsets, status, mixins
-from rest_framework.parsers import MultiPartParser
+from rest_framework.decorators import action
+from rest_framework.exceptions import APIException
+from rest_framework.parsers import JSONParser, MultiPartParser
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 
+from core.cache import CachedResponseMixin, bump_versions, course_scope, user_scope
 from core.error_serializer import ErrorSerializer
+from core.files import serve_file
+from core.pagination import KeysetPagination, RankedPagination
 from core.success_serializer import SuccessSerializer
+from core.values import ValuesListMixin
 from core.permissions import (
     StudentOrTeacherReadOnly,
     TeacherOrStudentReadOnly,
@@ -24,25 +34,227 @@ from courses.api.v1.serializers import (
     TaskSerializer,
     MarkSerializer,
 )
-from courses.models import Course, Lecture, Task, Solution, Mark, Comment
-from courses.api.v1.serializers import CourseSerializer, LectureSerializer, ParticipantSerializer
+from courses.bundles import BundleError, clone_course, export_course, import_course, read_bundle, write_zip
+from courses.changes import load_objects, record_bulk, visible_changes
+from courses.documents import enqueue
+from courses.enum_types import ChangeAction, EnrollmentStatus, EventType, MarkingStatus
+from courses.gradebook import stream_csv, stream_jsonl
+from courses.grades import apply_results
+from courses.models import (
+    DocumentContent,
+    LectureUpload,
+    StudentGrades,
+    SearchEntry,
+    TaskGrades,
+    Solution,
+    Lecture,
+    Comment,
+    Course,
+    Task,
+    Mark,
+)
+from courses.membership import course_changed, invalidate_membership, is_participant
+from courses.notifications import publish
+from courses.search import search, visible_entries
+from courses.similarity import THRESHOLD, find_clusters, store_signatures
+from courses.tree import MAX_DEPTH, load_tree, parse_fields
+from courses.uploads import ChunkError, start_upload, append_chunk, complete_upload, abort_upload
+from courses.api.v1.serializers import (
+    LectureUploadCompleteSerializer,
+    BulkParticipantResultSerializer,
+    BatchMarkingResultSerializer,
+    SimilarityClusterSerializer,
+    DocumentContentSerializer,
+    BulkParticipantSerializer,
+    StudentGradesSerializer,
+    LectureUploadSerializer,
+    GradingQueueSerializer,
+    CourseBundleSerializer,
+    BatchMarkingSerializer,
+    SearchResultSerializer,
+    TaskGradesSerializer,
+    CourseCountSerializer,
+    CourseCloneSerializer,
+    ParticipantSerializer,
+    CourseTreeSerializer,
+    CourseIdsSerializer,
+    LectureSerializer,
+    ChangeSerializer,
+    CourseSerializer,
+)
 
 
-class CourseViewSet(viewsets.ModelViewSet):
+class CourseViewSet(CachedResponseMixin, ValuesListMixin, viewsets.ModelViewSet):
     """
     Create, retrieve, update, delete a course instance
+
+    The list accepts `?participants=ids` or `?participants=count` to return
+    a compact roster instead of the full one.
+    Teachers may stream the course gradebook as CSV or JSONL (`?output=jsonl`).
+    `changes/?since=<cursor>` returns the course changes after the cursor of a previous poll.
+    `tree/` returns the lectures, tasks and visible solutions in one response, `?depth=1..3` limits the levels
+    and `?fields=lecture.topic,solution.mark` selects the fields of each level.
+    Teachers may clone a course with its lectures and tasks, export it as a JSON or ZIP bundle
+    (`export/?bundle=zip` includes the documents) and create a course from a bundle with `import/`.
     """
     queryset = Course.objects.all()
     permission_classes = (IsAuthenticated & TeacherOrStudentReadOnly,)
     serializer_class = CourseSerializer
+    list_serializer_classes = {
+        'ids': CourseIdsSerializer,
+        'count': CourseCountSerializer,
+    }
+
+    def get_participants_mode(self):
+        if self.action != 'list':
+            return None
+        mode = self.request.query_params.get('participants')
+        return mode if mode in self.list_serializer_classes else None
 
     def get_queryset(self):
-        return self.queryset.filter(participants__in=[self.request.user])
+        queryset = self.queryset.filter(participants=self.request.user.id)
+        mode = self.get_participants_mode()
+        if mode == 'count':
+            participants = (Course.participants.through.objects
+                            .filter(course_id=OuterRef('pk'))
+                            .order_by()
+                            .values('course_id')
+                            .annotate(count=Count('*'))
+                            .values('count'))
+            return queryset.annotate(participants_count=Subquery(participants))
+        if mode == 'ids':
+            return queryset.prefetch_related(Prefetch('participants', queryset=User.objects.only('id')))
+        if self.action in ('gradebook', 'changes', 'clone', 'export', 'tree'):
+            return queryset
+        return queryset.prefetch_related('participants')
+
+    def get_serializer_class(self):
+        mode = self.get_participants_mode()
+        if mode:
+            return self.list_serializer_classes[mode]
+        return super().get_serializer_class()
+
+    def get_cache_scopes(self):
+        if self.action == 'list':
+            return [user_scope(self.request.user.id)]
+        return [course_scope(self.kwargs['pk'])]
+
+    def get_cache_vary(self):
+        if self.action == 'list':
+            return self.request.user.id
+        return super().get_cache_vary()
+
+    def retrieve(self, request, *args, **kwargs):
+        # The cached course is shared by the participants of a role, so others are turned away before it is read
+        try:
+            course_id = int(kwargs['pk'])
+        except (TypeError, ValueError):
+            raise Http404
+        if not is_participant(request, course_id):
+            raise Http404
+        return super().retrieve(request, *args, **kwargs)
 
+    def perform_create(self, serializer):
+        super().perform_create(serializer)
+        bump_versions([user_scope(self.request.user.id)])
 
-class LectureViewSet(viewsets.ModelViewSet):
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        course_changed(serializer.instance.id)
+
+    def perform_destroy(self, instance):
+        user_ids = list(instance.participants.values_list('id', flat=True))
+        course_id = instance.id
+        instance.delete()
+        invalidate_membership(course_id, user_ids)
+        course_changed(course_id, user_ids)
+
+    @action(detail=True, methods=['get'], permission_classes=(IsAuthenticated & TeacherOnly,))
+    def gradebook(self, request, *args, **kwargs):
+        course = self.get_object()
+        if request.query_params.get('output') == 'jsonl':
+            response = StreamingHttpResponse(stream_jsonl(course.id), content_type='application/x-ndjson')
+            extension = 'jsonl'
+        else:
+            response = StreamingHttpResponse(stream_csv(course.id), content_type='text/csv')
+            extension = 'csv'
+        response['Content-Disposition'] = f'attachment; filename="gradebook-{course.id}.{extension}"'
+        return response
+
+    @action(detail=True, methods=['get'])
+    def changes(self, request, *args, **kwargs):
+        course = self.get_object()
+        try:
+            since = int(request.query_params.get('since', 0))
+        except ValueError:
+            return Response(ErrorSerializer({'detail': 'Invalid cursor'}).data, status=status.HTTP_400_BAD_REQUEST)
+        limit = KeysetPagination().get_page_size(request)
+        changes = list(visible_changes(course.id, request.user).filter(id__gt=since).order_by('id')[:limit + 1])
+        more = len(changes) > limit
+        changes = changes[:limit]
+        context = {**self.get_serializer_context(), 'objects': load_objects(course.id, changes)}
+        return Response({
+            'cursor': changes[-1].id if changes else since,
+            'more': more,
+            'results': ChangeSerializer(changes, many=True, context=context).data,
+        })
+
+    @action(detail=True, methods=['get'])
+    def tree(self, request, *args, **kwargs):
+        course = self.get_object()
+        try:
+            depth = int(request.query_params.get('depth', MAX_DEPTH))
+            fields = parse_fields(request.query_params.get('fields', ''))
+        except ValueError as error:
+            return Response(ErrorSerializer({'detail': str(error)}).data, status=status.HTTP_400_BAD_REQUEST)
+        if not 1 <= depth <= MAX_DEPTH:
+            return Response(ErrorSerializer({'detail': f"Depth must be between 1 and {MAX_DEPTH}"}).data,
+                            status=status.HTTP_400_BAD_REQUEST)
+        context = {**self.get_serializer_context(), 'depth': depth, 'fields': fields}
+        return Response(CourseTreeSerializer(load_tree(course, request.user, depth), context=context).data)
+
+    @action(detail=True, methods=['post'], permission_classes=(IsAuthenticated & TeacherOnly,),
+            serializer_class=CourseCloneSerializer)
+    def clone(self, request, *args, **kwargs):
+        source = self.get_object()
+        serializer = CourseCloneSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        course = clone_course(source, serializer.validated_data.get('title', source.title), request.user)
+        return Response(CourseSerializer(course, context=self.get_serializer_context()).data,
+                        status=status.HTTP_201_CREATED)
+
+    @action(detail=True, methods=['get'], permission_classes=(IsAuthenticated & TeacherOnly,))
+    def export(self, request, *args, **kwargs):
+        course = self.get_object()
+        bundle, documents = export_course(course)
+        if request.query_params.get('bundle') == 'zip':
+            return FileResponse(write_zip(bundle, documents), as_attachment=True, filename=f'course-{course.id}.zip',
+                                content_type='application/zip')
+        return Response(bundle)
+
+    @action(detail=False, methods=['post'], url_path='import', permission_classes=(IsAuthenticated & TeacherOnly,),
+            parser_classes=(JSONParser, MultiPartParser), serializer_class=CourseBundleSerializer)
+    def import_bundle(self, request, *args, **kwargs):
+        data, open_document = request.data, None
+        try:
+            if 'file' in request.FILES:
+                data, open_document = read_bundle(request.FILES['file'])
+            serializer = CourseBundleSerializer(data=data)
+            if not serializer.is_valid():
+                return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+            course = import_course(serializer.validated_data, request.user, open_document)
+        except BundleError as error:
+            return Response(ErrorSerializer({'detail': error.detail}).data, status=status.HTTP_400_BAD_REQUEST)
+        return Response(CourseSerializer(course, context=self.get_serializer_context()).data,
+                        status=status.HTTP_201_CREATED)
+
+
+class LectureViewSet(CachedResponseMixin, ValuesListMixin, viewsets.ModelViewSet):
     """
     Create, retrieve, update, delete a lecture instance
+
+    The text of the lecture document is extracted in the background, `content/` returns its metadata and a preview.
     """
     parser_classes = (MultiPartParser, )
     queryset = Lecture.objects.all()
@@ -52,40 +264,171 @@ class LectureViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         return self.queryset.filter(course__id=self.kwargs['course_pk'])
 
+    def get_cache_scopes(self):
+        return [course_scope(self.kwargs['course_pk'])]
+
     def perform_create(self, serializer):
         serializer.save(course_id=self.kwargs['course_pk'])
+        enqueue([serializer.instance.document.name])
+        bump_versions(self.get_cache_scopes())
 
     def perform_update(self, serializer):
         serializer.save(course_id=self.kwargs['course_pk'])
+        enqueue([serializer.instance.document.name])
+        bump_versions(self.get_cache_scopes())
+
+    def perform_destroy(self, instance):
+        instance.delete()
+        bump_versions(self.get_cache_scopes())
+
+    @action(detail=True, methods=['get'])
+    def download(self, request, *args, **kwargs):
+        lecture = self.get_object()
+        if not lecture.document:
+            raise Http404
+        return serve_file(request, lecture.document)
+
+    @action(detail=True, methods=['get'])
+    def content(self, request, *args, **kwargs):
+        lecture = self.get_object()
+        content = DocumentContent.objects.filter(document=lecture.document.name).first() if lecture.document else None
+        if content is None:
+            return Response(ErrorSerializer({'detail': "Document text is not extracted yet"}).data,
+                            status=status.HTTP_404_NOT_FOUND)
+        return Response(DocumentContentSerializer(content).data)
+
+
+class LectureUploadViewSet(mixins.CreateModelMixin,
+                           mixins.RetrieveModelMixin,
+                           mixins.DestroyModelMixin,
+                           viewsets.GenericViewSet):
+    """
+    Start, resume, complete or abort a chunked lecture document upload
 
+    Chunks are sent with `PUT chunk/` as the raw request body with a
+    `Content-Range: bytes <start>-<end>/<size>` header and an optional
+    `X-Chunk-Checksum` sha256 hex digest. Retrieving the upload returns the
+    offset to resume from.
+    """
+    queryset = LectureUpload.objects.all()
+    permission_classes = (IsAuthenticated & TeacherOnly & IsParticipant,)
+    serializer_class = LectureUploadSerializer
+    content_range_re = re.compile(r'^bytes (\d+)-(\d+)/(\d+|\*)$')
+
+    def get_queryset(self):
+        return self.queryset.filter(course_id=self.kwargs['course_pk'], user_id=self.request.user.id)
 
-class TaskViewSet(mixins.ListModelMixin,
+    def perform_create(self, serializer):
+        start_upload(serializer.save(course_id=self.kwargs['course_pk'], user_id=self.request.user.id))
+
+    def perform_destroy(self, instance):
+        abort_upload(instance)
+
+    def chunk_error(self, error):
+        if error.offset is None:
+            return Response(ErrorSerializer({'detail': error.detail}).data, status=status.HTTP_400_BAD_REQUEST)
+        return Response({**ErrorSerializer({'detail': error.detail}).data, 'offset': error.offset},
+                        status=status.HTTP_409_CONFLICT)
+
+    @action(detail=True, methods=['put'], parser_classes=())
+    def chunk(self, request, *args, **kwargs):
+        upload = self.get_object()
+        match = self.content_range_re.match(request.META.get('HTTP_CONTENT_RANGE', ''))
+        if not match:
+            return Response(ErrorSerializer({'detail': "Content-Range header is required"}).data,
+                            status=status.HTTP_400_BAD_REQUEST)
+        start, end = int(match.group(1)), int(match.group(2))
+        try:
+            upload = append_chunk(upload.pk, request.stream, start, end - start + 1,
+                                  request.META.get('HTTP_X_CHUNK_CHECKSUM'))
+        except ChunkError as error:
+            return self.chunk_error(error)
+        return Response(LectureUploadSerializer(upload).data, status=status.HTTP_200_OK)
+
+    @action(detail=True, methods=['post'], serializer_class=LectureUploadCompleteSerializer)
+    def complete(self, request, *args, **kwargs):
+        upload = self.get_object()
+        serializer = LectureUploadCompleteSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        lecture = None
+        if serializer.validated_data.get('lecture'):
+            lecture = get_object_or_404(Lecture, pk=serializer.validated_data['lecture'],
+                                        course_id=self.kwargs['course_pk'])
+        try:
+            lecture = complete_upload(upload, serializer.validated_data.get('topic'), lecture)
+        except ChunkError as error:
+            return self.chunk_error(error)
+        enqueue([lecture.document.name])
+        bump_versions([course_scope(self.kwargs['course_pk'])])
+        return Response(LectureSerializer(lecture, context=self.get_serializer_context()).data,
+                        status=status.HTTP_201_CREATED)
+
+
+class TaskViewSet(CachedResponseMixin,
+                  ValuesListMixin,
+                  mixins.ListModelMixin,
                   mixins.CreateModelMixin,
                   mixins.RetrieveModelMixin,
                   viewsets.GenericViewSet):
     """
-    Create, list, retrieve a task instance
+    Create, list, retrieve a task instance, teachers may retrieve the mark statistics of a task
+
+    `similar/` groups the solutions of the task whose texts look copied from each other,
+    `?threshold=` (0 to 1, 0.8 by default) is the estimated share of common phrases.
     """
     queryset = Task.objects.all()
     permission_classes = (IsAuthenticated & TeacherOrStudentReadOnly & IsParticipant,)
     serializer_class = TaskSerializer
 
     def get_queryset(self):
-        return self.queryset.filter(lecture__id=self.kwargs['lecture_pk'],
-                                    lecture__course__id=self.kwargs['course_pk'])
+        queryset = self.queryset.filter(lecture_id=self.kwargs['lecture_pk'], course_id=self.kwargs['course_pk'])
+        if self.action == 'grades':
+            return queryset.select_related('taskgrades')
+        return queryset
+
+    def get_cache_scopes(self):
+        return [course_scope(self.kwargs['course_pk'])]
 
     def post(self, request, *args, **kwargs):
         return self.create(self, request, *args, **kwargs)
 
     def perform_create(self, serializer):
-        serializer.save(lecture_id=self.kwargs['lecture_pk'])
+        lecture = get_object_or_404(Lecture, pk=self.kwargs['lecture_pk'], course_id=self.kwargs['course_pk'])
+        serializer.save(lecture=lecture, course_id=lecture.course_id)
+        bump_versions(self.get_cache_scopes())
+
+    @action(detail=True, methods=['get'], permission_classes=(IsAuthenticated & TeacherOnly & IsParticipant,))
+    def grades(self, request, *args, **kwargs):
+        task = self.get_object()
+        try:
+            grades = task.taskgrades
+        except TaskGrades.DoesNotExist:
+            grades = TaskGrades(task=task, course_id=task.course_id)
+        return Response(TaskGradesSerializer(grades).data)
+
+    @action(detail=True, methods=['get'], permission_classes=(IsAuthenticated & TeacherOnly & IsParticipant,))
+    def similar(self, request, *args, **kwargs):
+        task = self.get_object()
+        try:
+            threshold = float(request.query_params.get('threshold', THRESHOLD))
+        except ValueError:
+            threshold = -1
+        if not 0 < threshold <= 1:
+            return Response(ErrorSerializer({'detail': "Threshold must be a number between 0 and 1"}).data,
+                            status=status.HTTP_400_BAD_REQUEST)
+        clusters = find_clusters(task.id, threshold)
+        solutions = Solution.objects.select_related('user').in_bulk([pk for _, ids in clusters for pk in ids])
+        data = [{'similarity': round(similarity, 3), 'solutions': [solutions[pk] for pk in ids if pk in solutions]}
+                for similarity, ids in clusters]
+        return Response(SimilarityClusterSerializer(data, many=True).data)
 
 
 class ParticipantViewSet(mixins.CreateModelMixin,
                          mixins.DestroyModelMixin,
                          viewsets.GenericViewSet):
     """
-    Create, delete a participant instance
+    Create, delete a participant instance, enroll or remove many participants at once
     """
     permission_classes = (IsAuthenticated & TeacherOnly & IsParticipant,)
     serializer_class = ParticipantSerializer
@@ -100,10 +443,11 @@ class ParticipantViewSet(mixins.CreateModelMixin,
         serializer = ParticipantSerializer(data=request.data)
         if serializer.is_valid():
             user = get_object_or_404(User, pk=serializer.data['id'])
-            course = Course.objects.get(pk=kwargs['course_pk'])
-            if user not in course.participants.all():
+            course = get_object_or_404(Course, pk=kwargs['course_pk'])
+            if not course.participants.filter(pk=user.pk).exists():
                 course.participants.add(user)
-                course.save()
+                invalidate_membership(course.id, [user.id])
+                course_changed(course.id, [user.id])
             else:
                 return Response(ErrorSerializer({'detail': "This user has already joined"}).data,
                                 status=status.HTTP_403_FORBIDDEN)
@@ -117,39 +461,89 @@ class ParticipantViewSet(mixins.CreateModelMixin,
             if user.role == RoleTypes.TEACHER.value:
                 return Response(ErrorSerializer({'detail': "You can't remove teacher"}).data,
                                 status=status.HTTP_403_FORBIDDEN)
-            course = Course.objects.get(pk=kwargs['course_pk'])
-            if user not in course.participants.all():
+            course = get_object_or_404(Course, pk=kwargs['course_pk'])
+            if not course.participants.filter(pk=user.pk).exists():
                 raise Http404
             course.participants.remove(user)
+            invalidate_membership(course.id, [user.id])
+            course_changed(course.id, [user.id])
             return Response(SuccessSerializer().data, status=status.HTTP_200_OK)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-
-class SolutionViewSet(mixins.ListModelMixin,
+    @action(detail=False, methods=['post', 'delete'], serializer_class=BulkParticipantSerializer)
+    def bulk(self, request, *args, **kwargs):
+        serializer = BulkParticipantSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        ids = serializer.validated_data['ids']
+        course_id = int(kwargs['course_pk'])
+        roles = dict(User.objects.filter(pk__in=ids).values_list('id', 'role'))
+        participants = Course.participants.through.objects.filter(course_id=course_id)
+        joined = set(participants.filter(user_id__in=roles).values_list('user_id', flat=True))
+
+        results = {}
+        for user_id in ids:
+            if user_id not in roles:
+                results[user_id] = EnrollmentStatus.NOT_FOUND
+            elif request.method == 'POST':
+                results[user_id] = EnrollmentStatus.ALREADY_JOINED if user_id in joined else EnrollmentStatus.ADDED
+            elif roles[user_id] == RoleTypes.TEACHER.value:
+                results[user_id] = EnrollmentStatus.TEACHER
+            else:
+                results[user_id] = EnrollmentStatus.REMOVED if user_id in joined else EnrollmentStatus.NOT_JOINED
+
+        if request.method == 'POST':
+            changed = [user_id for user_id, result in results.items() if result == EnrollmentStatus.ADDED]
+            participants.bulk_create([participants.model(course_id=course_id, user_id=user_id) for user_id in changed],
+                                     ignore_conflicts=True)
+        else:
+            changed = [user_id for user_id, result in results.items() if result == EnrollmentStatus.REMOVED]
+            participants.filter(user_id__in=changed).delete()
+        invalidate_membership(course_id, changed)
+        if changed:
+            course_changed(course_id, changed)
+
+        report = [{'id': user_id, 'status': result.value} for user_id, result in results.items()]
+        report.extend({'id': None, 'status': EnrollmentStatus.INVALID.value, 'row': row, 'value': value}
+                      for row, value in serializer.validated_data['invalid'])
+        return Response(BulkParticipantResultSerializer(report, many=True).data, status=status.HTTP_200_OK)
+
+
+class SolutionViewSet(ValuesListMixin,
+                      mixins.ListModelMixin,
                       mixins.CreateModelMixin,
                       mixins.RetrieveModelMixin,
                       viewsets.GenericViewSet):
     """
-    Create, list, retrieve a solution instance
+    Create, list, retrieve a solution instance, the submissions of a student are throttled per course
     """
-    queryset = Solution.objects.all()
+    queryset = Solution.objects.select_related('user')
     permission_classes = (IsAuthenticated & StudentOrTeacherReadOnly & IsParticipant,)
     serializer_class = SolutionSerializer
+    throttle_scopes = {'create': 'submissions'}
 
     def get_queryset(self):
+        queryset = self.queryset.filter(task_id=self.kwargs['task_pk'],
+                                        lecture_id=self.kwargs['lecture_pk'],
+                                        course_id=self.kwargs['course_pk'])
         if self.request.user.role == RoleTypes.STUDENT.value:
-            return self.queryset.filter(task__id=self.kwargs['task_pk'], user__id=self.request.user.id,
-                                        task__lecture__id=self.kwargs['lecture_pk'],
-                                        task__lecture__course__id=self.kwargs['course_pk'])
-        return self.queryset.filter(task__id=self.kwargs['task_pk'],
-                                    task__lecture__id=self.kwargs['lecture_pk'],
-                                    task__lecture__course__id=self.kwargs['course_pk'])
+            return queryset.filter(user_id=self.request.user.id)
+        return queryset
 
     def post(self, request, *args, **kwargs):
         return self.create(request, *args, **kwargs)
 
     def perform_create(self, serializer):
-        serializer.save(task_id=self.kwargs['task_pk'], user_id=self.request.user.id)
+        task = get_object_or_404(Task, pk=self.kwargs['task_pk'], lecture_id=self.kwargs['lecture_pk'],
+                                 course_id=self.kwargs['course_pk'])
+        serializer.save(task=task, lecture_id=task.lecture_id, course_id=task.course_id,
+                        user_id=self.request.user.id)
+        store_signatures([serializer.instance])
+
+
+class AlreadyMarked(APIException):
+    status_code = status.HTTP_400_BAD_REQUEST
+    default_detail = 'The solution is already marked, update its mark instead'
 
 
 class MarkViewSet(mixins.CreateModelMixin,
@@ -157,38 +551,162 @@ class MarkViewSet(mixins.CreateModelMixin,
                   mixins.UpdateModelMixin,
                   viewsets.GenericViewSet):
     """
-    Create, retrieve, update a mark instance
+    Create, retrieve, update a mark instance, students polling a mark are throttled
     """
-    queryset = Mark.objects.all()
+    queryset = Mark.objects.select_related('solution')
     permission_classes = (IsAuthenticated & TeacherOrStudentReadOnly & IsParticipant,)
     serializer_class = MarkSerializer
+    throttle_scopes = {'retrieve': 'marks'}
+
+    def get_queryset(self):
+        return self.queryset.filter(solution_id=self.kwargs['solution_pk'],
+                                    solution__task_id=self.kwargs['task_pk'],
+                                    lecture_id=self.kwargs['lecture_pk'],
+                                    course_id=self.kwargs['course_pk'])
 
     def put(self, request, *args, **kwargs):
         return self.update(request, *args, **kwargs)
 
     def perform_create(self, serializer):
-        serializer.save(solution_id=self.kwargs['solution_pk'])
+        with transaction.atomic():
+            # Locked like the solutions of a batch marking, so a concurrent mark is reported instead of colliding
+            solution = get_object_or_404(Solution.objects.select_for_update(), pk=self.kwargs['solution_pk'],
+                                         task_id=self.kwargs['task_pk'], lecture_id=self.kwargs['lecture_pk'],
+                                         course_id=self.kwargs['course_pk'])
+            if Mark.objects.filter(solution_id=solution.id).exists():
+                raise AlreadyMarked()
+            serializer.save(solution=solution, lecture_id=solution.lecture_id, course_id=solution.course_id)
+            apply_results([(solution, None, serializer.instance.result)])
+        publish(EventType.MARK_CREATED, solution, {'mark': serializer.data}, self.request.user.id)
+
+    def perform_update(self, serializer):
+        previous = serializer.instance.result
+        with transaction.atomic():
+            serializer.save()
+            apply_results([(serializer.instance.solution, previous, serializer.instance.result)])
+        publish(EventType.MARK_UPDATED, serializer.instance.solution, {'mark': serializer.data}, self.request.user.id)
+
+
+class GradesViewSet(ValuesListMixin,
+                    mixins.ListModelMixin,
+                    viewsets.GenericViewSet):
+    """
+    List the mark statistics of the course students, students only get their own
+    """
+    queryset = StudentGrades.objects.select_related('user')
+    permission_classes = (IsAuthenticated & IsParticipant,)
+    serializer_class = StudentGradesSerializer
+
+    def get_queryset(self):
+        queryset = self.queryset.filter(course_id=self.kwargs['course_pk'])
+        if self.request.user.role == RoleTypes.STUDENT.value:
+            return queryset.filter(user_id=self.request.user.id)
+        return queryset
+
 
+class GradingQueueViewSet(ValuesListMixin,
+                          mixins.ListModelMixin,
+                          viewsets.GenericViewSet):
+    """
+    List the ungraded solutions of a course in submission order, create or update many marks at once
+    """
+    queryset = Solution.objects.select_related('user')
+    permission_classes = (IsAuthenticated & TeacherOnly & IsParticipant,)
+    serializer_class = GradingQueueSerializer
 
-class CommentViewSet(mixins.ListModelMixin,
+    def get_queryset(self):
+        return self.queryset.filter(course_id=self.kwargs['course_pk'], mark__isnull=True)
+
+    @action(detail=False, methods=['post'], serializer_class=BatchMarkingSerializer)
+    def marks(self, request, *args, **kwargs):
+        serializer = BatchMarkingSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        results = {row['solution']: row['result'] for row in serializer.validated_data['marks']}
+
+        with transaction.atomic():
+            solutions = Solution.objects.select_for_update().filter(course_id=kwargs['course_pk'],
+                                                                    pk__in=results).in_bulk()
+            updated = list(Mark.objects.filter(solution_id__in=solutions))
+            previous = {mark.solution_id: mark.result for mark in updated}
+            for mark in updated:
+                mark.solution = solutions[mark.solution_id]
+                mark.result = results[mark.solution_id]
+            Mark.objects.bulk_update(updated, ['result'])
+            marked = {mark.solution_id for mark in updated}
+            created = [Mark(course_id=solution.course_id, lecture_id=solution.lecture_id, solution=solution,
+                            result=results[solution.id])
+                       for solution in solutions.values() if solution.id not in marked]
+            Mark.objects.bulk_create(created)
+            if created and created[0].pk is None:
+                created = list(Mark.objects.filter(solution_id__in=[mark.solution_id for mark in created]))
+                for mark in created:
+                    mark.solution = solutions[mark.solution_id]
+            record_bulk([*((mark, ChangeAction.UPDATED) for mark in updated),
+                         *((mark, ChangeAction.CREATED) for mark in created)])
+            apply_results([(mark.solution, previous.get(mark.solution_id), mark.result) for mark in updated + created])
+
+        report = {solution_id: {'solution': solution_id, 'mark': None, 'status': MarkingStatus.NOT_FOUND.value}
+                  for solution_id in results}
+        for marks, event_type, result in ((updated, EventType.MARK_UPDATED, MarkingStatus.UPDATED),
+                                          (created, EventType.MARK_CREATED, MarkingStatus.CREATED)):
+            for mark in marks:
+                report[mark.solution_id].update(mark=mark.id, status=result.value)
+                publish(event_type, mark.solution, {'mark': MarkSerializer(mark).data}, request.user.id)
+        return Response(BatchMarkingResultSerializer(report.values(), many=True).data, status=status.HTTP_200_OK)
+
+
+class CommentViewSet(ValuesListMixin,
+                     mixins.ListModelMixin,
                      mixins.CreateModelMixin,
                      viewsets.GenericViewSet):
     """
     Create, list a comment instance
     """
-    queryset = Comment.objects.all()
+    queryset = Comment.objects.select_related('user')
     permission_classes = (IsAuthenticated & IsParticipant,)
     serializer_class = CommentSerializer
 
     def get_queryset(self):
-        return self.queryset.filter(mark__id=self.kwargs['mark_pk'],
-                                    mark__solution__id=self.kwargs['solution_pk'],
-                                    mark__solution__task__id=self.kwargs['task_pk'],
-                                    mark__solution__task__lecture__id=self.kwargs['lecture_pk'],
-                                    mark__solution__task__lecture__course__id=self.kwargs['course_pk'])
+        return self.queryset.filter(mark_id=self.kwargs['mark_pk'],
+                                    mark__solution_id=self.kwargs['solution_pk'],
+                                    mark__solution__task_id=self.kwargs['task_pk'],
+                                    lecture_id=self.kwargs['lecture_pk'],
+                                    course_id=self.kwargs['course_pk'])
 
     def post(self, request, *args, **kwargs):
         return self.create(request, *args, **kwargs)
 
     def perform_create(self, serializer):
-        serializer.save(mark_id=self.kwargs['mark_pk'], user_id=self.request.user.id)
+        mark = get_object_or_404(Mark.objects.select_related('solution'), pk=self.kwargs['mark_pk'],
+                                 solution_id=self.kwargs['solution_pk'], lecture_id=self.kwargs['lecture_pk'],
+                                 course_id=self.kwargs['course_pk'])
+        serializer.save(mark=mark, lecture_id=mark.lecture_id, course_id=mark.course_id,
+                        user_id=self.request.user.id)
+        publish(EventType.COMMENT_CREATED, mark.solution, {'mark': mark.id, 'comment': serializer.data},
+                self.request.user.id)
+
+
+class SearchViewSet(ValuesListMixin,
+                    mixins.ListModelMixin,
+                    viewsets.GenericViewSet):
+    """
+    Search the lectures, tasks, solutions and comments of your courses for `?q=`, best matches first
+
+    `?course=<id>` narrows the search to one course. Students only find their own solutions and comments on them.
+    """
+    queryset = SearchEntry.objects.all()
+    permission_classes = (IsAuthenticated,)
+    serializer_class = SearchResultSerializer
+    pagination_class = RankedPagination
+
+    def get_queryset(self):
+        course = self.request.query_params.get('course', '')
+        entries = visible_entries(self.request.user, int(course) if course.isdigit() else None)
+        return search(entries, self.request.query_params.get('q', ''))
+
+    def list(self, request, *args, **kwargs):
+        if not request.query_params.get('q', '').strip():
+            return Response(ErrorSerializer({'detail': "Provide a search query in `q`"}).data,
+                            status=status.HTTP_400_BAD_REQUEST)
+        return super().list(request, *args, **kwargs)
@@ -0,0 +1,77 @@
+import random
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+
+from courses import grades, search
+from courses.similarity import sign_missing
+from courses.models import Blob, Course, Lecture, Task, Solution, Mark, Comment, document_storage
+from users.enum_types import RoleTypes
+from users.models import User
+
+BATCH_SIZE = 1000
+
+
+def bulk(model, objects):
+    """
+    Inserts objects in batches and returns them with primary keys,
+    also on backends that can't return ids from a bulk insert.
+    """
+    model.objects.bulk_create(objects, batch_size=BATCH_SIZE)
+    if not objects or objects[0].pk is not None:
+        return objects
+    return list(model.objects.order_by('-id')[:len(objects)])[::-1]
+
+
+def build_school(courses=5, students=100, lectures=5, tasks=3, solution_rate=0.8, mark_rate=0.7,
+                 max_comments=3, seed=0):
+    """
+    Builds a synthetic school: every course has a teacher, `students` students,
+    `lectures` lectures with `tasks` tasks each, and solutions, marks and comments
+    spread over them with the given rates.
+    """
+    rng = random.Random(seed)
+    password = make_password(None)
+    document = document_storage.save('lecture.pdf', ContentFile(b'%PDF-1.4 benchmark lecture'))
+
+    teachers = bulk(User, [User(username=f'teacher{i}', password=password, role=RoleTypes.TEACHER.value)
+                           for i in range(courses)])
+    pupils = bulk(User, [User(username=f'student{i}', password=password, role=RoleTypes.STUDENT.value)
+                         for i in range(students)])
+    school = bulk(Course, [Course(title=f'Course {i}') for i in range(courses)])
+    Participant = Course.participants.through
+    bulk(Participant, [Participant(course_id=course.id, user_id=user.id)
+                       for course, teacher in zip(school, teachers) for user in (teacher, *pupils)])
+
+    all_lectures = bulk(Lecture, [Lecture(course=course, topic=f'Lecture {i}', document=document)
+                                  for course in school for i in range(lectures)])
+    Blob.acquire(document, len(all_lectures))
+    all_tasks = bulk(Task, [Task(course_id=lecture.course_id, lecture=lecture, text=f'Task {i}')
+                            for lecture in all_lectures for i in range(tasks)])
+    solutions = bulk(Solution, [
+        Solution(course_id=task.course_id, lecture_id=task.lecture_id, task=task, user=user,
+                 text=f'Solution of {user.username} for task {task.id}')
+        for task in all_tasks for user in pupils if rng.random() < solution_rate
+    ])
+    marks = bulk(Mark, [
+        Mark(course_id=solution.course_id, lecture_id=solution.lecture_id, solution=solution,
+             result=rng.randint(1, 10))
+        for solution in solutions if rng.random() < mark_rate
+    ])
+    teacher_of = {course.id: teacher for course, teacher in zip(school, teachers)}
+    solution_user = {solution.id: solution.user_id for solution in solutions}
+    bulk(Comment, [
+        Comment(course_id=mark.course_id, lecture_id=mark.lecture_id, mark=mark,
+                user_id=teacher_of[mark.course_id].id if i % 2 == 0 else solution_user[mark.solution_id],
+                text=f'Comment {i}')
+        for mark in marks for i in range(rng.randint(0, max_comments))
+    ])
+    grades.rebuild([course.id for course in school])
+    search.rebuild([course.id for course in school])
+    sign_missing([course.id for course in school])
+    return {
+        'course': school[0],
+        'teacher': teachers[0],
+        'student': pupils[0],
+        'spare_student': pupils[-1],
+    }
@@ -0,0 +1,219 @@
+import io
+import statistics
+import time
+import tracemalloc
+from collections import namedtuple
+
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, reset_queries
+from django.test.utils import CaptureQueriesContext
+
+from rest_framework.test import APIClient
+
+from courses.bundles import clone_course, export_course
+from courses.models import DocumentContent, Lecture, LectureUpload, Mark, Solution, Task
+from courses.uploads import append_chunk, start_upload
+
+TRANSACTION_STATEMENTS = ('BEGIN', 'SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK')
+
+SLIDES = b'%PDF-1.4 benchmark slides'
+
+Scenario = namedtuple('Scenario', ('name', 'user', 'method', 'path', 'data', 'setup', 'extra'),
+                      defaults=(None, None))
+
+
+def get_scenarios(fixture):
+    """
+    One scenario per route of courses/api/v1/urls.py, as the teacher and as a student of the sample course.
+    A callable `path` or `data` is called before every request, outside the timing, for requests that
+    consume what they act on. `extra` holds the request arguments, a JSON body by default.
+    """
+    course, teacher = fixture['course'], fixture['teacher']
+    student, spare = fixture['student'], fixture['spare_student']
+    lecture = Lecture.objects.filter(course=course).order_by('id').first()
+    task = Task.objects.filter(lecture=lecture).order_by('id').first()
+    solution = Solution.objects.filter(task=task, user=student).first() or \
+        Solution.objects.create(task=task, user=student, text='solution')
+    mark = Mark.objects.filter(solution=solution).first() or Mark.objects.create(solution=solution, result=5)
+    DocumentContent.objects.get_or_create(document=lecture.document.name, defaults={
+        'sha256': '', 'size': lecture.document.size, 'content_type': 'application/pdf', 'text': 'benchmark lecture',
+    })
+    bundle = export_course(course)[0]
+
+    c = f'/api/v1/courses/{course.id}'
+    lectures = f'{c}/lectures'
+    tasks = f'{lectures}/{lecture.id}/tasks'
+    solutions = f'{tasks}/{task.id}/solutions'
+    marks = f'{solutions}/{solution.id}/marks'
+    comments = f'{marks}/{mark.id}/comments'
+
+    def new_upload(received=False):
+        upload = start_upload(LectureUpload.objects.create(course=course, user=teacher, filename='slides.pdf',
+                                                           size=len(SLIDES)))
+        if received:
+            append_chunk(upload.pk, io.BytesIO(SLIDES), 0, len(SLIDES), None)
+        return f'{c}/uploads/{upload.id}/'
+
+    def new_lecture():
+        return Lecture.objects.create(course=course, topic='Spare', document=lecture.document.name).id
+
+    def new_solution():
+        return Solution.objects.create(task=task, user=student, text='Another try').id
+
+    multipart = {'format': 'multipart'}
+    return [
+        Scenario('courses.list', teacher, 'get', '/api/v1/courses/', None),
+        Scenario('courses.create', teacher, 'post', '/api/v1/courses/', {'title': 'New course'}),
+        Scenario('courses.import', teacher, 'post', '/api/v1/courses/import/', bundle),
+        Scenario('courses.retrieve', teacher, 'get', f'{c}/', None),
+        Scenario('courses.update', teacher, 'patch', f'{c}/', {'title': course.title}),
+        Scenario('courses.destroy', teacher, 'delete',
+                 lambda: f'/api/v1/courses/{clone_course(course, course.title, teacher).id}/', None),
+        Scenario('courses.gradebook', teacher, 'get', f'{c}/gradebook/', None),
+        Scenario('courses.changes', teacher, 'get', f'{c}/changes/', None),
+        Scenario('courses.tree', teacher, 'get', f'{c}/tree/', None),
+        Scenario('courses.clone', teacher, 'post', f'{c}/clone/', {'title': 'Next semester'}),
+        Scenario('courses.export', teacher, 'get', f'{c}/export/', None),
+        Scenario('grades.list', teacher, 'get', f'{c}/grades/', None),
+        Scenario('grading_queue.list', teacher, 'get', f'{c}/grading-queue/', None),
+        Scenario('grading_queue.marks', teacher, 'post', f'{c}/grading-queue/marks/',
+                 {'marks': [{'solution': solution.id, 'result': 6}]}),
+        Scenario('lectures.list', teacher, 'get', f'{lectures}/', None),
+        Scenario('lectures.create', teacher, 'post', f'{lectures}/',
+                 lambda: {'topic': 'New lecture', 'document': SimpleUploadedFile('slides.pdf', SLIDES)},
+                 extra=multipart),
+        Scenario('lectures.retrieve', teacher, 'get', f'{lectures}/{lecture.id}/', None),
+        Scenario('lectures.update', teacher, 'patch', f'{lectures}/{lecture.id}/', {'topic': lecture.topic},
+                 extra=multipart),
+        Scenario('lectures.destroy', teacher, 'delete', lambda: f'{lectures}/{new_lecture()}/', None),
+        Scenario('lectures.download', teacher, 'get', f'{lectures}/{lecture.id}/download/', None),
+        Scenario('lectures.content', teacher, 'get', f'{lectures}/{lecture.id}/content/', None),
+        Scenario('participants.destroy', teacher, 'delete', f'{c}/participants/', {'id': spare.id},
+                 setup=lambda: course.participants.add(spare)),
+        Scenario('participants.create', teacher, 'post', f'{c}/participants/', {'id': spare.id},
+                 setup=lambda: course.participants.remove(spare)),
+        Scenario('participants.bulk', teacher, 'post', f'{c}/participants/bulk/', {'ids': [student.id, spare.id]}),
+        Scenario('participants.bulk_destroy', teacher, 'delete', f'{c}/participants/bulk/', {'ids': [spare.id]},
+                 setup=lambda: course.participants.add(spare)),
+        Scenario('uploads.create', teacher, 'post', f'{c}/uploads/', {'filename': 'slides.pdf', 'size': 1024}),
+        Scenario('uploads.chunk', teacher, 'put', lambda: f'{new_upload()}chunk/', SLIDES,
+                 extra={'content_type': 'application/octet-stream',
+                        'HTTP_CONTENT_RANGE': f'bytes 0-{len(SLIDES) - 1}/{len(SLIDES)}'}),
+        Scenario('uploads.complete', teacher, 'post', lambda: f'{new_upload(received=True)}complete/',
+                 {'topic': 'Uploaded'}),
+        Scenario('tasks.list', teacher, 'get', f'{tasks}/', None),
+        Scenario('tasks.create', teacher, 'post', f'{tasks}/', {'text': 'New task'}),
+        Scenario('tasks.retrieve', teacher, 'get', f'{tasks}/{task.id}/', None),
+        Scenario('tasks.grades', teacher, 'get', f'{tasks}/{task.id}/grades/', None),
+        Scenario('tasks.similar', teacher, 'get', f'{tasks}/{task.id}/similar/', None),
+        Scenario('solutions.list', teacher, 'get', f'{solutions}/', None),
+        Scenario('solutions.sparse', teacher, 'get', f'{solutions}/?fields=id,user.username', None),
+        Scenario('solutions.retrieve', teacher, 'get', f'{solutions}/{solution.id}/', None),
+        Scenario('marks.create', teacher, 'post', lambda: f'{solutions}/{new_solution()}/marks/', {'result': 6}),
+        Scenario('marks.retrieve', teacher, 'get', f'{marks}/{mark.id}/', None),
+        Scenario('marks.update', teacher, 'put', f'{marks}/{mark.id}/', {'result': 7}),
+        Scenario('comments.list', teacher, 'get', f'{comments}/', None),
+        Scenario('comments.create', teacher, 'post', f'{comments}/', {'text': 'Well done'}),
+        Scenario('search.list', teacher, 'get', '/api/v1/search/?q=solution+task', None),
+        Scenario('student.courses.list', student, 'get', '/api/v1/courses/', None),
+        Scenario('student.courses.tree', student, 'get', f'{c}/tree/', None),
+        Scenario('student.grades.list', student, 'get', f'{c}/grades/', None),
+        Scenario('student.lectures.list', student, 'get', f'{lectures}/', None),
+        Scenario('student.tasks.list', student, 'get', f'{tasks}/', None),
+        Scenario('student.solutions.list', student, 'get', f'{solutions}/', None),
+        Scenario('student.solutions.create', student, 'post', f'{solutions}/', {'text': 'Another try'}),
+        Scenario('student.marks.retrieve', student, 'get', f'{marks}/{mark.id}/', None),
+        Scenario('student.comments.list', student, 'get', f'{comments}/', None),
+        Scenario('student.search.list', student, 'get', '/api/v1/search/?q=solution+task', None),
+    ]
+
+
+def resolve(value):
+    return value() if callable(value) else value
+
+
+def prepare(scenario):
+    """
+    Runs the setup of `scenario`, clears the caches and returns the path and data of its next request.
+    """
+    if scenario.setup:
+        scenario.setup()
+    path, data = resolve(scenario.path), resolve(scenario.data)
+    for cache in caches.all():
+        cache.clear()
+    reset_queries()
+    return path, data
+
+
+def perform(client, scenario, path, data):
+    response = getattr(client, scenario.method)(path, data, **(scenario.extra or {'format': 'json'}))
+    if response.streaming:
+        for _ in response.streaming_content:
+            pass
+    return response
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(round(fraction * (len(values) - 1))), len(values) - 1)]
+
+
+def run_scenarios(fixture, repeat=20):
+    """
+    Runs every scenario `repeat` times with cold caches and records latency percentiles
+    and the query count of a request, then measures peak traced memory in one extra pass.
+    Transaction statements aren't counted, so test runs inside a transaction report the same counts.
+    `p95_ratio` is the p95 latency over the median p50 of all scenarios of the run, comparable across
+    machines where absolute latencies aren't.
+    """
+    report = {}
+    for scenario in get_scenarios(fixture):
+        client = APIClient()
+        client.force_authenticate(scenario.user)
+        perform(client, scenario, *prepare(scenario))
+        timings = []
+        for _ in range(repeat):
+            path, data = prepare(scenario)
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                response = perform(client, scenario, path, data)
+                timings.append((time.perf_counter() - started) * 1000)
+            query_count = len([query for query in queries if not query['sql'].startswith(TRANSACTION_STATEMENTS)])
+        path, data = prepare(scenario)
+        tracemalloc.start()
+        perform(client, scenario, path, data)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        report[scenario.name] = {
+            'status': response.status_code,
+            'queries': query_count,
+            'p50_ms': round(statistics.median(timings), 3),
+            'p95_ms': round(percentile(timings, 0.95), 3),
+            'peak_kb': round(peak / 1024, 1),
+        }
+    scale = statistics.median(result['p50_ms'] for result in report.values())
+    for result in report.values():
+        result['p95_ratio'] = round(result['p95_ms'] / scale, 3)
+    return report
+
+
+def compare(report, baseline, tolerance=2.0):
+    """
+    Returns the regressions of `report` against `baseline`: any extra query or status change,
+    and relative latency (`p95_ratio`) or memory above `tolerance` times the baseline.
+    """
+    regressions = []
+    for name, expected in baseline.items():
+        actual = report.get(name)
+        if actual is None:
+            regressions.append(f'{name}: scenario is missing')
+            continue
+        if actual['status'] != expected['status']:
+            regressions.append(f"{name}: status {actual['status']} != {expected['status']}")
+        if actual['queries'] > expected['queries']:
+            regressions.append(f"{name}: {actual['queries']} queries > {expected['queries']}")
+        for metric in ('p95_ratio', 'peak_kb'):
+            if actual[metric] > expected[metric] * tolerance:
+                regressions.append(f'{name}: {metric} {actual[metric]} > {tolerance} x {expected[metric]}')
+    return regressions
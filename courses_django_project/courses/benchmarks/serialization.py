@@ -0,0 +1,60 @@
+import json
+import time
+
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from core.values import compile_plan
+
+from courses.api.v1.serializers import (
+    GradingQueueSerializer,
+    SolutionSerializer,
+    CommentSerializer,
+    LectureSerializer,
+)
+from courses.models import Comment, Lecture, Solution
+
+
+def get_cases(fixture):
+    """
+    The largest list responses of the sample course, every row of each.
+    """
+    course = fixture['course']
+    solutions = Solution.objects.select_related('user').filter(course=course)
+    return [
+        ('solutions', SolutionSerializer, solutions.order_by('id')),
+        ('grading_queue', GradingQueueSerializer, solutions.filter(mark__isnull=True).order_by('id')),
+        ('comments', CommentSerializer, Comment.objects.select_related('user').filter(course=course).order_by('id')),
+        ('lectures', LectureSerializer, Lecture.objects.filter(course=course).order_by('id')),
+    ]
+
+
+def best_time(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        data = function()
+        timings.append(time.perf_counter() - started)
+    return min(timings) * 1000, data
+
+
+def run_serialization(fixture, repeat=5):
+    """
+    Reads and serializes every case with its serializer and with the values plan of the serializer,
+    records the best of `repeat` runs of each and whether both render the same JSON.
+    """
+    context = {'request': Request(APIRequestFactory().get('/'))}
+    report = {}
+    for name, serializer_class, queryset in get_cases(fixture):
+        plan = compile_plan(serializer_class(context=context), queryset)
+        serializer_ms, expected = best_time(
+            lambda: serializer_class(queryset.all(), many=True, context=context).data, repeat)
+        values_ms, data = best_time(lambda: plan.represent(plan.values(queryset.all())), repeat)
+        report[name] = {
+            'rows': len(data),
+            'serializer_ms': round(serializer_ms, 2),
+            'values_ms': round(values_ms, 2),
+            'speedup': round(serializer_ms / values_ms, 2) if values_ms else None,
+            'identical': json.dumps(data) == json.dumps(expected),
+        }
+    return report
@@ -0,0 +1,186 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import zipfile
+from collections import Counter
+
+from django.core.files import File
+from django.db import transaction
+
+from core.cache import bump_versions, user_scope
+
+from courses import search
+from courses.changes import record_bulk
+from courses.documents import enqueue
+from courses.enum_types import ChangeAction
+from courses.membership import invalidate_membership
+from courses.models import Blob, Course, Lecture, Task, document_storage
+
+BUNDLE_VERSION = 1
+MANIFEST = 'course.json'
+READ_SIZE = 64 * 1024
+
+
+class BundleError(Exception):
+    def __init__(self, detail):
+        super().__init__(detail)
+        self.detail = detail
+
+
+def create_course(title, user, lectures):
+    """
+    Creates a course of `user` with its lectures and tasks in one transaction with one bulk insert
+    per table. `lectures` are (topic, document name, task texts) tuples. Documents are stored by
+    content, so lectures reference the existing files and only their blob reference counts change.
+    Bulk inserts send no signals, so the change log and the search index are written here.
+    """
+    with transaction.atomic():
+        course = Course.objects.create(title=title)
+        course.participants.add(user.id)
+        Lecture.objects.bulk_create([Lecture(course=course, topic=topic, document=document)
+                                     for topic, document, _ in lectures])
+        new_lectures = list(Lecture.objects.filter(course=course).order_by('id'))
+        for name, count in Counter(document for _, document, _ in lectures if document).items():
+            Blob.acquire(name, count)
+        Task.objects.bulk_create([Task(course=course, lecture=lecture, text=text)
+                                  for lecture, (_, _, texts) in zip(new_lectures, lectures) for text in texts])
+        tasks = list(Task.objects.filter(course=course).order_by('id'))
+        record_bulk([(instance, ChangeAction.CREATED) for instance in (*new_lectures, *tasks)])
+        search.rebuild([course.id])
+        enqueue(lecture.document.name for lecture in new_lectures)
+    invalidate_membership(course.id, [user.id])
+    bump_versions([user_scope(user.id)])
+    return course
+
+
+def clone_course(source, title, user):
+    tasks = {}
+    for lecture_id, text in Task.objects.filter(course=source).order_by('id').values_list('lecture_id', 'text'):
+        tasks.setdefault(lecture_id, []).append(text)
+    lectures = Lecture.objects.filter(course=source).order_by('id').values_list('id', 'topic', 'document')
+    return create_course(title, user, [(topic, document, tasks.get(pk, [])) for pk, topic, document in lectures])
+
+
+def describe_document(name, blob):
+    """
+    The bundle reference of a stored document, None when its file is missing.
+    """
+    if blob is not None:
+        return {'name': os.path.basename(name), 'sha256': blob.sha256, 'size': blob.size}
+    if not document_storage.exists(name):
+        return None
+    digest, size = hashlib.sha256(), 0
+    with document_storage.open(name, 'rb') as file:
+        for block in iter(lambda: file.read(READ_SIZE), b''):
+            digest.update(block)
+            size += len(block)
+    return {'name': os.path.basename(name), 'sha256': digest.hexdigest(), 'size': size}
+
+
+def export_course(course):
+    """
+    The course as a bundle: its title and lectures with their tasks and document references.
+    Returns the bundle and the stored name of every referenced document by sha256.
+    """
+    tasks = {}
+    for lecture_id, text in Task.objects.filter(course=course).order_by('id').values_list('lecture_id', 'text'):
+        tasks.setdefault(lecture_id, []).append({'text': text})
+    rows = list(Lecture.objects.filter(course=course).order_by('id').values_list('id', 'topic', 'document'))
+    blobs = Blob.objects.in_bulk([name for _, _, name in rows if name], field_name='name')
+    documents, lectures = {}, []
+    for pk, topic, name in rows:
+        document = describe_document(name, blobs.get(name)) if name else None
+        if document is not None:
+            documents[document['sha256']] = name
+        lectures.append({'topic': topic, 'document': document, 'tasks': tasks.get(pk, [])})
+    return {'version': BUNDLE_VERSION, 'title': course.title, 'lectures': lectures}, documents
+
+
+def write_zip(bundle, documents):
+    """
+    Writes the bundle with the referenced documents to a temporary file, documents are stored under
+    `documents/<sha256>`.
+    """
+    file = tempfile.TemporaryFile()
+    with zipfile.ZipFile(file, 'w', zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr(MANIFEST, json.dumps(bundle, indent=2))
+        for sha256, name in documents.items():
+            with document_storage.open(name, 'rb') as source, archive.open(f'documents/{sha256}', 'w') as target:
+                shutil.copyfileobj(source, target, READ_SIZE)
+    file.seek(0)
+    return file
+
+
+def read_zip(file):
+    """
+    The manifest of a ZIP bundle and a function opening the bundled file of a document reference.
+    """
+    try:
+        archive = zipfile.ZipFile(file)
+        manifest = json.loads(archive.read(MANIFEST))
+    except (zipfile.BadZipFile, KeyError, ValueError):
+        raise BundleError(f'A bundle is a ZIP file with a {MANIFEST} manifest')
+
+    def open_document(document):
+        try:
+            info = archive.getinfo(f"documents/{document['sha256']}")
+        except KeyError:
+            return None
+        if info.file_size != document['size']:
+            raise BundleError(f"Document {document['name']} doesn't match its size")
+        return archive.open(info)
+    return manifest, open_document
+
+
+def read_bundle(file):
+    """
+    The manifest of an uploaded JSON or ZIP bundle and, for a ZIP bundle, its document opener.
+    """
+    if zipfile.is_zipfile(file):
+        return read_zip(file)
+    file.seek(0)
+    try:
+        return json.load(file), None
+    except ValueError:
+        raise BundleError('A bundle is a JSON document or a ZIP file')
+
+
+def resolve_document(document, open_document, user, saved):
+    """
+    The stored name of a bundled document. A stored document is only reused without its bytes when
+    `user` can read a lecture referencing it, otherwise it's read from the bundle and checked against
+    its sha256. Names written to the storage are appended to `saved`.
+    """
+    blob = Blob.objects.filter(sha256=document['sha256'], size=document['size']).first()
+    if blob is not None and Lecture.objects.filter(document=blob.name, course__participants=user.id).exists():
+        return blob.name
+    source = open_document(document) if open_document else None
+    if source is None:
+        raise BundleError(f"Document {document['name']} is neither stored nor bundled")
+    with source:
+        name = document_storage.save(document['name'], File(source))
+    saved.append(name)
+    if name != document_storage.blob_name(document['sha256'], document['name']):
+        raise BundleError(f"Document {document['name']} doesn't match its sha256")
+    return name
+
+
+def import_course(bundle, user, open_document=None):
+    """
+    Creates a course from a validated bundle. `open_document` opens the bundled file of a document.
+    Documents written for a failed import are deleted unless a blob references them.
+    """
+    saved = []
+    try:
+        lectures = []
+        for lecture in bundle['lectures']:
+            document = lecture.get('document')
+            name = resolve_document(document, open_document, user, saved) if document else ''
+            lectures.append((lecture['topic'], name, [task['text'] for task in lecture['tasks']]))
+        return create_course(bundle['title'], user, lectures)
+    except BaseException:
+        for name in saved:
+            Blob.delete_orphan(name)
+        raise
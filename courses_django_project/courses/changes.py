@@ -0,0 +1,105 @@
+from collections import defaultdict
+
+from django.db.models import Q, Subquery
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from courses.enum_types import ChangeAction, ChangeTarget
+from courses.models import Change, Comment, Course, Lecture, Mark, Solution, Task
+from users.enum_types import RoleTypes
+
+TARGETS = {
+    Lecture: (ChangeTarget.LECTURE, None),
+    Task: (ChangeTarget.TASK, 'lecture_id'),
+    Solution: (ChangeTarget.SOLUTION, 'task_id'),
+    Mark: (ChangeTarget.MARK, 'solution_id'),
+    Comment: (ChangeTarget.COMMENT, 'mark_id'),
+}
+
+QUERYSETS = {
+    ChangeTarget.LECTURE.value: Lecture.objects.all(),
+    ChangeTarget.TASK.value: Task.objects.all(),
+    ChangeTarget.SOLUTION.value: Solution.objects.select_related('user'),
+    ChangeTarget.MARK.value: Mark.objects.all(),
+    ChangeTarget.COMMENT.value: Comment.objects.select_related('user'),
+}
+
+
+def get_solution_id(instance):
+    if isinstance(instance, Solution):
+        return instance.pk
+    if isinstance(instance, Mark):
+        return instance.solution_id
+    if isinstance(instance, Comment):
+        if Comment.mark.is_cached(instance):
+            return instance.mark.solution_id
+        return Mark.objects.filter(pk=instance.mark_id).values_list('solution_id', flat=True).first()
+    return None
+
+
+def build_change(instance, action):
+    target, parent = TARGETS[type(instance)]
+    return Change(course_id=instance.course_id, target=target.value, action=action.value,
+                  object_id=instance.pk, parent_id=getattr(instance, parent) if parent else None,
+                  solution_id=get_solution_id(instance))
+
+
+def record(instance, action):
+    build_change(instance, action).save()
+
+
+def record_bulk(changes):
+    """
+    Logs (instance, action) pairs of objects written with bulk_create or bulk_update, which send no signals.
+    """
+    Change.objects.bulk_create([build_change(instance, action) for instance, action in changes])
+
+
+def record_save(sender, instance, created, raw=False, **kwargs):
+    if not raw:
+        record(instance, ChangeAction.CREATED if created else ChangeAction.UPDATED)
+
+
+def record_delete(sender, instance, **kwargs):
+    if not Course.is_being_deleted(instance.course_id):
+        record(instance, ChangeAction.DELETED)
+
+
+for model in TARGETS:
+    post_save.connect(record_save, sender=model, dispatch_uid=f'changes.save.{model.__name__}')
+    post_delete.connect(record_delete, sender=model, dispatch_uid=f'changes.delete.{model.__name__}')
+
+
+@receiver(post_delete, sender=Course)
+def drop_course_changes(sender, instance, **kwargs):
+    """
+    Drops the log of a deleted course with one query, its rows log no deletions while it's deleted.
+    """
+    Change.objects.filter(course_id=instance.id).delete()
+
+
+def visible_changes(course_id, user):
+    """
+    Changes of the course the user may see: students only see the changes of their own solutions,
+    marks and comments on them, like SolutionViewSet lists only their own solutions.
+    """
+    changes = Change.objects.filter(course_id=course_id)
+    if user.role == RoleTypes.STUDENT.value:
+        own = Solution.objects.filter(course_id=course_id, user_id=user.id).values('id')
+        changes = changes.filter(Q(solution_id__isnull=True) | Q(solution_id__in=Subquery(own)))
+    return changes
+
+
+def load_objects(course_id, changes):
+    """
+    Loads the current state of the changed objects with one query per target.
+    """
+    ids = defaultdict(set)
+    for change in changes:
+        if change.action != ChangeAction.DELETED.value:
+            ids[change.target].add(change.object_id)
+    return {
+        (target, instance.pk): instance
+        for target, pks in ids.items()
+        for instance in QUERYSETS[target].filter(course_id=course_id, pk__in=pks)
+    }
@@ -0,0 +1,222 @@
+import hashlib
+import mimetypes
+import os
+import re
+import zipfile
+import zlib
+from datetime import timedelta
+from xml.etree import ElementTree
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from courses import search
+from courses.enum_types import JobStatus
+from courses.models import DocumentContent, DocumentJob, Lecture, document_storage
+
+try:
+    import pypdf
+except ImportError:
+    pypdf = None
+
+READ_SIZE = 64 * 1024
+MAX_MEMBER_SIZE = 64 * 1024 * 1024
+TEXT_EXTENSIONS = {'.txt', '.md', '.rst', '.csv', '.json', '.py'}
+
+PDF_PAGE_RE = re.compile(rb'/Type\s*/Page(?![a-zA-Z])')
+PDF_STREAM_RE = re.compile(rb'stream\r?\n(.*?)\r?\nendstream', re.S)
+PDF_TEXT_RE = re.compile(rb'\[((?:[^\]\\]|\\.)*)\]\s*TJ|\(((?:[^)\\]|\\.)*)\)\s*Tj', re.S)
+PDF_STRING_RE = re.compile(rb'\(((?:[^)\\]|\\.)*)\)', re.S)
+PDF_ESCAPE_RE = re.compile(rb'\\([nrtbf()\\]|[0-7]{1,3})')
+PDF_ESCAPES = {b'n': b'\n', b'r': b'\r', b't': b'\t', b'b': b'\b', b'f': b'\f'}
+
+
+def xml_text(data):
+    """
+    The text of the <t> elements of an Office Open XML part, a line per paragraph or shared string.
+    """
+    parts = []
+    for element in ElementTree.fromstring(data).iter():
+        tag = element.tag.rsplit('}', 1)[-1]
+        if tag == 't' and element.text:
+            parts.append(element.text)
+        elif tag in ('p', 'si') and parts and parts[-1] != '\n':
+            parts.append('\n')
+    return ''.join(parts).strip()
+
+
+def read_member(archive, name):
+    if archive.getinfo(name).file_size > MAX_MEMBER_SIZE:
+        raise ValueError(f'{name} is too large to extract')
+    return archive.read(name)
+
+
+def numbered_members(archive, pattern):
+    members = [(int(match.group(1)), name) for name in archive.namelist() for match in [re.match(pattern, name)]
+               if match]
+    return [name for _, name in sorted(members)]
+
+
+def extract_office(file, extension):
+    with zipfile.ZipFile(file) as archive:
+        if extension == '.docx':
+            text = xml_text(read_member(archive, 'word/document.xml'))
+            pages = None
+            if 'docProps/app.xml' in archive.namelist():
+                match = re.search(rb'<Pages>(\d+)</Pages>', read_member(archive, 'docProps/app.xml'))
+                pages = int(match.group(1)) if match else None
+            return text, pages
+        if extension == '.pptx':
+            slides = numbered_members(archive, r'ppt/slides/slide(\d+)\.xml$')
+            return '\n'.join(xml_text(read_member(archive, name)) for name in slides), len(slides)
+        sheets = numbered_members(archive, r'xl/worksheets/sheet(\d+)\.xml$')
+        text = ''
+        if 'xl/sharedStrings.xml' in archive.namelist():
+            text = xml_text(read_member(archive, 'xl/sharedStrings.xml'))
+        return text, len(sheets)
+
+
+def unescape_pdf_string(value):
+    def replace(match):
+        escape = match.group(1)
+        if escape[:1].isdigit():
+            return bytes([int(escape, 8) & 0xFF])
+        return PDF_ESCAPES.get(escape, escape)
+    return PDF_ESCAPE_RE.sub(replace, value)
+
+
+def extract_pdf(file):
+    """
+    Extracts PDF text with pypdf when it's installed. Otherwise pages are counted and the literal
+    strings shown by the (deflated) content streams are collected, which covers simple text PDFs.
+    """
+    if pypdf is not None:
+        reader = pypdf.PdfReader(file)
+        return '\n'.join(page.extract_text() or '' for page in reader.pages).strip(), len(reader.pages)
+    data = file.read()
+    lines = []
+    for stream in PDF_STREAM_RE.findall(data):
+        try:
+            # Capped like archive members, a small deflated stream can expand to gigabytes
+            stream = zlib.decompressobj().decompress(stream, MAX_MEMBER_SIZE)
+        except zlib.error:
+            pass
+        for array, string in PDF_TEXT_RE.findall(stream):
+            strings = PDF_STRING_RE.findall(array) if array else [string]
+            lines.append(b''.join(unescape_pdf_string(value) for value in strings).decode('latin-1'))
+    return '\n'.join(lines).strip(), len(PDF_PAGE_RE.findall(data)) or None
+
+
+def extract_text(file, extension):
+    if extension == '.pdf':
+        return extract_pdf(file)
+    if extension in ('.docx', '.pptx', '.xlsx'):
+        return extract_office(file, extension)
+    if extension in TEXT_EXTENSIONS:
+        return file.read().decode('utf-8', errors='replace'), None
+    return '', None
+
+
+def extract_document(name):
+    """
+    Reads a stored document and returns the fields of its DocumentContent.
+    Documents of unsupported types get their metadata with an empty text.
+    """
+    extension = os.path.splitext(name)[1].lower()
+    with document_storage.open(name, 'rb') as file:
+        digest, size = hashlib.sha256(), 0
+        for block in iter(lambda: file.read(READ_SIZE), b''):
+            digest.update(block)
+            size += len(block)
+        file.seek(0)
+        text, pages = extract_text(file, extension)
+    return {
+        'sha256': digest.hexdigest(),
+        'size': size,
+        'content_type': mimetypes.guess_type(name)[0] or 'application/octet-stream',
+        'pages': pages,
+        'text': text[:settings.DOCUMENT_TEXT_LIMIT],
+    }
+
+
+def enqueue(names, force=False):
+    """
+    Queues the extraction of the documents. Documents that are queued or already extracted are
+    left alone, failed ones are retried; `force` extracts every document again.
+    """
+    names = {name for name in names if name}
+    if not names:
+        return
+    jobs = DocumentJob.objects.filter(document__in=names)
+    if not force:
+        jobs = jobs.filter(status=JobStatus.FAILED.value)
+    jobs.update(status=JobStatus.PENDING.value, attempts=0, run_after=timezone.now(), error='')
+    DocumentJob.objects.bulk_create([DocumentJob(document=name) for name in names], ignore_conflicts=True)
+
+
+def claim_jobs(limit):
+    """
+    Takes up to `limit` due jobs, pending ones and running ones whose lease expired, and leases them
+    to this worker. Rows locked by another worker are skipped. A running job whose lease expired after
+    its last attempt, e.g. on a document that crashes the worker, fails instead of being leased again.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        due = list(DocumentJob.objects.select_for_update(skip_locked=True).filter(
+            status__in=(JobStatus.PENDING.value, JobStatus.RUNNING.value), run_after__lte=now,
+        ).order_by('run_after', 'id')[:limit])
+        exhausted = [job.pk for job in due
+                     if job.status == JobStatus.RUNNING.value and job.attempts >= settings.DOCUMENT_JOB_ATTEMPTS]
+        DocumentJob.objects.filter(pk__in=exhausted).update(
+            status=JobStatus.FAILED.value, error='Lease expired on the last attempt',
+        )
+        jobs = [job for job in due if job.pk not in exhausted]
+        DocumentJob.objects.filter(pk__in=[job.pk for job in jobs]).update(
+            status=JobStatus.RUNNING.value, attempts=F('attempts') + 1,
+            run_after=now + timedelta(seconds=settings.DOCUMENT_JOB_TIMEOUT),
+        )
+    for job in jobs:
+        job.attempts += 1
+    return jobs
+
+
+def fail_job(job, error):
+    """
+    Schedules a retry with exponential backoff, or fails the job after DOCUMENT_JOB_ATTEMPTS attempts.
+    """
+    if job.attempts >= settings.DOCUMENT_JOB_ATTEMPTS:
+        fields = {'status': JobStatus.FAILED.value}
+    else:
+        delay = settings.DOCUMENT_JOB_BACKOFF * 2 ** (job.attempts - 1)
+        fields = {'status': JobStatus.PENDING.value, 'run_after': timezone.now() + timedelta(seconds=delay)}
+    DocumentJob.objects.filter(pk=job.pk).update(error=f'{type(error).__name__}: {error}', **fields)
+
+
+def run_job(job):
+    """
+    Extracts the document of the job and re-indexes the lectures using it. Extracting a document
+    again overwrites its content, so a job may safely run more than once.
+    """
+    try:
+        content = extract_document(job.document)
+    except Exception as error:
+        fail_job(job, error)
+        return False
+    with transaction.atomic():
+        DocumentContent.objects.update_or_create(document=job.document, defaults=content)
+        DocumentJob.objects.filter(pk=job.pk).update(status=JobStatus.DONE.value, error='')
+        for lecture in Lecture.objects.filter(document=job.document):
+            search.index_save(Lecture, lecture, created=False)
+    return True
+
+
+def process_jobs(limit):
+    """
+    Runs a batch of due jobs and returns how many were claimed.
+    """
+    jobs = claim_jobs(limit)
+    for job in jobs:
+        run_job(job)
+    return len(jobs)
@@ -0,0 +1,44 @@
+from core.base_enum import BaseEnum
+
+
+class EnrollmentStatus(BaseEnum):
+    ADDED = 'added'
+    REMOVED = 'removed'
+    ALREADY_JOINED = 'already_joined'
+    NOT_JOINED = 'not_joined'
+    NOT_FOUND = 'not_found'
+    TEACHER = 'teacher'
+    INVALID = 'invalid'
+
+
+class ChangeTarget(BaseEnum):
+    LECTURE = 'lecture'
+    TASK = 'task'
+    SOLUTION = 'solution'
+    MARK = 'mark'
+    COMMENT = 'comment'
+
+
+class ChangeAction(BaseEnum):
+    CREATED = 'created'
+    UPDATED = 'updated'
+    DELETED = 'deleted'
+
+
+class EventType(BaseEnum):
+    MARK_CREATED = 'mark.created'
+    MARK_UPDATED = 'mark.updated'
+    COMMENT_CREATED = 'comment.created'
+
+
+class MarkingStatus(BaseEnum):
+    CREATED = 'created'
+    UPDATED = 'updated'
+    NOT_FOUND = 'not_found'
+
+
+class JobStatus(BaseEnum):
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
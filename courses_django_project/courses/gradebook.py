@@ -0,0 +1,100 @@
+import csv
+import json
+from itertools import groupby
+from operator import itemgetter
+
+from courses.models import Course, Solution, Task
+from users.enum_types import RoleTypes
+
+CHUNK_SIZE = 2000
+
+
+class Echo:
+    def write(self, value):
+        return value
+
+
+def get_task_ids(course_id):
+    return list(Task.objects.filter(course_id=course_id).order_by('lecture_id', 'id').values_list('id', flat=True))
+
+
+def iter_marks(course_id):
+    """
+    Yields (user_id, {task_id: result}) per student with solutions from a single server-side cursor
+    over the course solutions joined with their marks, ordered by user id.
+    """
+    rows = (Solution.objects
+            .filter(course_id=course_id)
+            .order_by('user_id', 'task_id', 'id')
+            .values_list('user_id', 'task_id', 'mark__result')
+            .iterator(chunk_size=CHUNK_SIZE))
+    for user_id, solutions in groupby(rows, key=itemgetter(0)):
+        yield user_id, {task_id: result for _, task_id, result in solutions if result is not None}
+
+
+def iter_students(course_id):
+    """
+    Yields one (user_id, username, {task_id: result}) row per student of the course, including the
+    ones without solutions. Students and marks are read by user id and merged.
+    """
+    participants = (Course.participants.through.objects
+                    .filter(course_id=course_id, user__role=RoleTypes.STUDENT.value)
+                    .order_by('user_id')
+                    .values_list('user_id', 'user__username')
+                    .iterator(chunk_size=CHUNK_SIZE))
+    marks = iter_marks(course_id)
+    current = next(marks, None)
+    for user_id, username in participants:
+        while current is not None and current[0] < user_id:
+            current = next(marks, None)
+        if current is not None and current[0] == user_id:
+            yield user_id, username, current[1]
+        else:
+            yield user_id, username, {}
+
+
+def average(marks):
+    return round(sum(marks.values()) / len(marks), 2) if marks else None
+
+
+class TaskAverages:
+    def __init__(self):
+        self.totals = {}
+        self.counts = {}
+
+    def add(self, marks):
+        for task_id, result in marks.items():
+            self.totals[task_id] = self.totals.get(task_id, 0) + result
+            self.counts[task_id] = self.counts.get(task_id, 0) + 1
+
+    def get(self, task_id):
+        if task_id not in self.counts:
+            return None
+        return round(self.totals[task_id] / self.counts[task_id], 2)
+
+
+def stream_csv(course_id):
+    task_ids = get_task_ids(course_id)
+    task_averages = TaskAverages()
+    writer = csv.writer(Echo())
+    yield writer.writerow(['user_id', 'username', *(f'task_{task_id}' for task_id in task_ids), 'average'])
+    for user_id, username, marks in iter_students(course_id):
+        task_averages.add(marks)
+        yield writer.writerow([user_id, username, *(marks.get(task_id, '') for task_id in task_ids),
+                               average(marks) or ''])
+    yield writer.writerow(['', 'average', *(task_averages.get(task_id) or '' for task_id in task_ids), ''])
+
+
+def stream_jsonl(course_id):
+    task_averages = TaskAverages()
+    for user_id, username, marks in iter_students(course_id):
+        task_averages.add(marks)
+        yield json.dumps({
+            'user_id': user_id,
+            'username': username,
+            'marks': {str(task_id): result for task_id, result in marks.items()},
+            'average': average(marks),
+        }) + '\n'
+    yield json.dumps({
+        'task_averages': {str(task_id): task_averages.get(task_id) for task_id in task_averages.counts},
+    }) + '\n'
@@ -0,0 +1,107 @@
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from courses.models import Course, Mark, Solution, StudentGrades, TaskGrades
+
+FIELDS = ('count', 'total', 'histogram')
+
+
+def lock_student_grades(keys):
+    keys = set(keys)
+    courses, users = {course_id for course_id, _ in keys}, {user_id for _, user_id in keys}
+    rows = StudentGrades.objects.select_for_update().filter(course_id__in=courses, user_id__in=users)
+    return {(row.course_id, row.user_id): row for row in rows if (row.course_id, row.user_id) in keys}
+
+
+def lock_task_grades(keys):
+    return {row.task_id: row for row in TaskGrades.objects.select_for_update().filter(task_id__in=keys)}
+
+
+def update(model, deltas, lock, build):
+    """
+    Applies the (old, new) result pairs of every key to its locked row. Rows are only created
+    for keys gaining a result, with an insert that ignores rows created concurrently.
+    """
+    rows = lock(list(deltas))
+    missing = [key for key, results in deltas.items()
+               if key not in rows and any(new is not None for _, new in results)]
+    if missing:
+        model.objects.bulk_create([build(key) for key in missing], ignore_conflicts=True)
+        rows.update(lock(missing))
+    for key, row in rows.items():
+        for old, new in deltas[key]:
+            if old is not None:
+                row.add(old, -1)
+            if new is not None:
+                row.add(new)
+    model.objects.bulk_update(list(rows.values()), FIELDS)
+
+
+def apply_results(changes):
+    """
+    Updates the student and task aggregates with (solution, old result, new result) changes of marks.
+    The old result is None for a new mark, the new one None for a deleted mark.
+    """
+    students, tasks, task_courses = defaultdict(list), defaultdict(list), {}
+    for solution, old, new in changes:
+        if old == new:
+            continue
+        students[solution.course_id, solution.user_id].append((old, new))
+        tasks[solution.task_id].append((old, new))
+        task_courses[solution.task_id] = solution.course_id
+    if not students:
+        return
+    with transaction.atomic(savepoint=False):
+        update(StudentGrades, students, lock_student_grades,
+               lambda key: StudentGrades(course_id=key[0], user_id=key[1]))
+        update(TaskGrades, tasks, lock_task_grades,
+               lambda key: TaskGrades(task_id=key, course_id=task_courses[key]))
+
+
+@receiver(post_delete, sender=Mark)
+def remove_deleted_mark(sender, instance, **kwargs):
+    if Course.is_being_deleted(instance.course_id):
+        # The aggregates of the course are deleted with it
+        return
+    solution = Solution.objects.filter(pk=instance.solution_id).only('course_id', 'user_id', 'task_id').first()
+    if solution is not None:
+        apply_results([(solution, instance.result, None)])
+
+
+def build_histograms(rows, key_fields):
+    grades = {}
+    for row in rows:
+        key = tuple(row[field] for field in key_fields)
+        stats = grades.setdefault(key, {'count': 0, 'total': 0, 'histogram': [0] * 10})
+        stats['count'] += row['marks']
+        stats['total'] += row['marks'] * row['result']
+        stats['histogram'][row['result'] - 1] += row['marks']
+    return grades
+
+
+def rebuild(course_ids=None):
+    """
+    Recomputes the aggregates of the given courses, or of all courses, from per-result mark counts.
+    """
+    marks = Mark.objects.all()
+    student_grades, task_grades = StudentGrades.objects.all(), TaskGrades.objects.all()
+    if course_ids is not None:
+        marks = marks.filter(course_id__in=course_ids)
+        student_grades = student_grades.filter(course_id__in=course_ids)
+        task_grades = task_grades.filter(course_id__in=course_ids)
+    by_student = marks.values('course_id', 'solution__user_id', 'result').annotate(marks=Count('id')).order_by()
+    by_task = marks.values('course_id', 'solution__task_id', 'result').annotate(marks=Count('id')).order_by()
+
+    with transaction.atomic():
+        student_grades.delete()
+        task_grades.delete()
+        students = build_histograms(by_student, ('course_id', 'solution__user_id'))
+        StudentGrades.objects.bulk_create([StudentGrades(course_id=course_id, user_id=user_id, **stats)
+                                           for (course_id, user_id), stats in students.items()], batch_size=1000)
+        tasks = build_histograms(by_task, ('course_id', 'solution__task_id'))
+        TaskGrades.objects.bulk_create([TaskGrades(course_id=course_id, task_id=task_id, **stats)
+                                        for (course_id, task_id), stats in tasks.items()], batch_size=1000)
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from courses.documents import enqueue
+from courses.models import Lecture
+
+
+class Command(BaseCommand):
+    help = 'Queues the text extraction of existing lecture documents'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--course', type=int, action='append', dest='courses',
+                            help='Only queue the documents of this course, may be repeated')
+        parser.add_argument('--force', action='store_true', help='Also extract documents that were already extracted')
+
+    def handle(self, *args, **options):
+        lectures = Lecture.objects.exclude(document='')
+        if options['courses']:
+            lectures = lectures.filter(course_id__in=options['courses'])
+        names = set(lectures.values_list('document', flat=True).distinct())
+        enqueue(names, force=options['force'])
+        self.stdout.write(self.style.SUCCESS(f'Queued {len(names)} documents'))
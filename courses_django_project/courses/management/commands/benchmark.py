@@ -0,0 +1,74 @@
+import json
+import os
+import shutil
+import tempfile
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+
+from courses.benchmarks.data import build_school
+from courses.benchmarks.scenarios import compare, run_scenarios
+from courses.benchmarks.serialization import run_serialization
+
+BASELINE = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'benchmarks', 'baseline.json')
+
+
+class Command(BaseCommand):
+    help = 'Runs the courses API benchmark scenarios against a throwaway test database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--courses', type=int, default=5)
+        parser.add_argument('--students', type=int, default=200)
+        parser.add_argument('--lectures', type=int, default=5)
+        parser.add_argument('--tasks', type=int, default=3)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--output', help='Write the JSON report to this file')
+        parser.add_argument('--baseline', default=BASELINE)
+        parser.add_argument('--tolerance', type=float, default=2.0,
+                            help='Allowed relative p95 latency and peak memory growth factor')
+        parser.add_argument('--update-baseline', action='store_true')
+
+    def handle(self, *args, **options):
+        media = tempfile.mkdtemp()
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            with override_settings(MEDIA_ROOT=media, CHUNKED_UPLOAD_DIR=os.path.join(media, 'uploads')):
+                fixture = build_school(courses=options['courses'], students=options['students'],
+                                       lectures=options['lectures'], tasks=options['tasks'])
+                scenarios = run_scenarios(fixture, repeat=options['repeat'])
+                serialization = run_serialization(fixture, repeat=options['repeat'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+            shutil.rmtree(media)
+
+        report = {'vendor': connection.vendor, 'scenarios': scenarios, 'serialization': serialization}
+        for name, result in scenarios.items():
+            self.stdout.write(f"{name:28} {result['status']} {result['queries']:3} queries "
+                              f"p50 {result['p50_ms']:8.2f} ms  p95 {result['p95_ms']:8.2f} ms "
+                              f"(x{result['p95_ratio']:6.2f})  peak {result['peak_kb']:9.1f} KiB")
+        for name, result in serialization.items():
+            self.stdout.write(f"{'serialize.' + name:28} {result['rows']:5} rows  "
+                              f"serializer {result['serializer_ms']:8.2f} ms  values {result['values_ms']:8.2f} ms  "
+                              f"x{result['speedup']}")
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(report, output, indent=2)
+
+        mismatches = [name for name, result in serialization.items() if not result['identical']]
+        if mismatches:
+            raise CommandError('Values plans differ from their serializers: ' + ', '.join(mismatches))
+        if options['update_baseline']:
+            with open(options['baseline'], 'w') as output:
+                json.dump(report, output, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Baseline written to {options['baseline']}"))
+            return
+        if not os.path.exists(options['baseline']):
+            return
+        with open(options['baseline']) as baseline:
+            regressions = compare(scenarios, json.load(baseline)['scenarios'], options['tolerance'])
+        if regressions:
+            raise CommandError('Performance regressions:\n' + '\n'.join(regressions))
+        self.stdout.write(self.style.SUCCESS('No regressions against the baseline'))
@@ -0,0 +1,26 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from courses.documents import process_jobs
+
+
+class Command(BaseCommand):
+    help = 'Runs a worker extracting the text of queued lecture documents'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Exit when no job is due instead of polling')
+        parser.add_argument('--batch', type=int, default=10, help='Jobs claimed at once')
+
+    def handle(self, *args, **options):
+        processed = 0
+        while True:
+            claimed = process_jobs(options['batch'])
+            processed += claimed
+            if claimed:
+                continue
+            if options['once']:
+                break
+            time.sleep(settings.DOCUMENT_WORKER_POLL_INTERVAL)
+        self.stdout.write(self.style.SUCCESS(f'Processed {processed} jobs'))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from courses.grades import rebuild
+from courses.models import StudentGrades, TaskGrades
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the stored per-student and per-task grade aggregates from the marks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--course', type=int, action='append', dest='courses',
+                            help='Only rebuild this course, may be repeated')
+
+    def handle(self, *args, **options):
+        courses = options['courses']
+        rebuild(courses)
+        students, tasks = StudentGrades.objects.all(), TaskGrades.objects.all()
+        if courses:
+            students, tasks = students.filter(course_id__in=courses), tasks.filter(course_id__in=courses)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {students.count()} student and {tasks.count()} task aggregates'))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from courses.models import SearchEntry
+from courses.search import rebuild
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the search index of the lectures, tasks, solutions and comments'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--course', type=int, action='append', dest='courses',
+                            help='Only rebuild this course, may be repeated')
+
+    def handle(self, *args, **options):
+        courses = options['courses']
+        rebuild(courses)
+        entries = SearchEntry.objects.all()
+        if courses:
+            entries = entries.filter(course_id__in=courses)
+        self.stdout.write(self.style.SUCCESS(f'Indexed {entries.count()} entries'))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from courses.similarity import sign_missing
+
+
+class Command(BaseCommand):
+    help = 'Stores the similarity signatures of the solutions submitted before they were signed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--course', type=int, action='append', dest='courses',
+                            help='Only sign the solutions of this course, may be repeated')
+
+    def handle(self, *args, **options):
+        count = sign_missing(options['courses'])
+        self.stdout.write(self.style.SUCCESS(f'Signed {count} solutions'))
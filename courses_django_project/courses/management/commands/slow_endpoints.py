@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from core.instrumentation import METRICS, QUANTILES, summarize
+
+
+class Command(BaseCommand):
+    help = 'Prints rolling latency, query, serialization and render percentiles per view, slowest first'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=20)
+        parser.add_argument('--quantile', type=float, choices=QUANTILES, default=0.95)
+        parser.add_argument('--sort', choices=METRICS, default='wall_ms')
+
+    def handle(self, *args, **options):
+        q = options['quantile']
+        summary = summarize()
+        views = sorted(summary.items(), key=lambda item: item[1][options['sort']][q], reverse=True)
+        self.stdout.write(f"{'view':40} {'count':>6} {'wall ms':>9} {'queries':>8} {'sql ms':>9} "
+                          f"{'serialize ms':>13} {'render ms':>10}")
+        for view, data in views[:options['limit']]:
+            self.stdout.write(f"{view:40} {data['count']:6} {data['wall_ms'][q]:9.2f} {data['queries'][q]:8} "
+                              f"{data['sql_ms'][q]:9.2f} {data['serialize_ms'][q]:13.2f} {data['render_ms'][q]:10.2f}")
+            for sql, count in data['duplicates'].most_common(3):
+                self.stdout.write(self.style.WARNING(f'    {count} x {sql[:100]}'))
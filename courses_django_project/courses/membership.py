@@ -0,0 +1,44 @@
+from django.conf import settings
+from django.core.cache import cache
+
+from core.cache import bump_versions, course_scope, user_scope
+
+from courses.models import Course
+
+MEMBERSHIP_CACHE_TIMEOUT = getattr(settings, 'MEMBERSHIP_CACHE_TIMEOUT', 30)
+
+
+def _cache_key(course_id, user_id):
+    return f'membership:{course_id}:{user_id}'
+
+
+def is_participant(request, course_id):
+    token_courses = getattr(request.user, 'token_courses', None)
+    if token_courses is not None:
+        return course_id in token_courses
+    memo = getattr(request, '_membership', None)
+    if memo is None:
+        memo = request._membership = {}
+    if course_id in memo:
+        return memo[course_id]
+    key = _cache_key(course_id, request.user.id)
+    joined = cache.get(key)
+    if joined is None:
+        joined = Course.participants.through.objects.filter(course_id=course_id,
+                                                            user_id=request.user.id).exists()
+        cache.set(key, joined, MEMBERSHIP_CACHE_TIMEOUT)
+    memo[course_id] = joined
+    return joined
+
+
+def invalidate_membership(course_id, user_ids):
+    cache.delete_many([_cache_key(course_id, user_id) for user_id in user_ids])
+
+
+def course_changed(course_id, user_ids=()):
+    """
+    Bumps the cached response versions of the course and of everyone who lists it.
+    """
+    participant_ids = Course.participants.through.objects.filter(course_id=course_id).values_list('user_id',
+                                                                                                   flat=True)
+    bump_versions([course_scope(course_id), *map(user_scope, {*participant_ids, *user_ids})])
@@ -0,0 +1,23 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(model_name='task', name='course', field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='courses.course')),
+        migrations.AddField(model_name='solution', name='course', field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='courses.course')),
+        migrations.AddField(model_name='solution', name='lecture', field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='courses.lecture')),
+        migrations.AddField(model_name='mark', name='course', field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='courses.course')),
+        migrations.AddField(model_name='mark', name='lecture', field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='courses.lecture')),
+        migrations.AddField(model_name='comment', name='course', field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='courses.course')),
+        migrations.AddField(model_name='comment', name='lecture', field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='courses.lecture')),
+        migrations.AddIndex(
+            model_name='solution',
+            index=models.Index(fields=['task', 'user'], name='solution_task_user_idx'),
+        ),
+    ]
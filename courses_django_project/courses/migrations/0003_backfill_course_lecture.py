@@ -0,0 +1,40 @@
+from django.db import migrations
+from django.db.models import OuterRef, Subquery
+
+
+def backfill(apps, schema_editor):
+    Lecture = apps.get_model('courses', 'Lecture')
+    Task = apps.get_model('courses', 'Task')
+    Solution = apps.get_model('courses', 'Solution')
+    Mark = apps.get_model('courses', 'Mark')
+    Comment = apps.get_model('courses', 'Comment')
+
+    Task.objects.update(
+        course_id=Subquery(Lecture.objects.filter(pk=OuterRef('lecture_id')).values('course_id')),
+    )
+    tasks = Task.objects.filter(pk=OuterRef('task_id'))
+    Solution.objects.update(
+        course_id=Subquery(tasks.values('course_id')),
+        lecture_id=Subquery(tasks.values('lecture_id')),
+    )
+    solutions = Solution.objects.filter(pk=OuterRef('solution_id'))
+    Mark.objects.update(
+        course_id=Subquery(solutions.values('course_id')),
+        lecture_id=Subquery(solutions.values('lecture_id')),
+    )
+    marks = Mark.objects.filter(pk=OuterRef('mark_id'))
+    Comment.objects.update(
+        course_id=Subquery(marks.values('course_id')),
+        lecture_id=Subquery(marks.values('lecture_id')),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0002_denormalize_course_lecture'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
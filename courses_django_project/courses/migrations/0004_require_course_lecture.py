@@ -0,0 +1,19 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0003_backfill_course_lecture'),
+    ]
+
+    operations = [
+        migrations.AlterField(model_name='task', name='course', field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='courses.course')),
+        migrations.AlterField(model_name='solution', name='course', field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='courses.course')),
+        migrations.AlterField(model_name='solution', name='lecture', field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='courses.lecture')),
+        migrations.AlterField(model_name='mark', name='course', field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='courses.course')),
+        migrations.AlterField(model_name='mark', name='lecture', field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='courses.lecture')),
+        migrations.AlterField(model_name='comment', name='course', field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='courses.course')),
+        migrations.AlterField(model_name='comment', name='lecture', field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='courses.lecture')),
+    ]
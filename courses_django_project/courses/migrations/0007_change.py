@@ -0,0 +1,31 @@
+# Generated by Django 3.2.25 on 2026-10-18 10:49
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0006_blob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Change',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('target', models.CharField(choices=[('lecture', 'LECTURE'), ('task', 'TASK'), ('solution', 'SOLUTION'), ('mark', 'MARK'), ('comment', 'COMMENT')], max_length=16)),
+                ('action', models.CharField(choices=[('created', 'CREATED'), ('updated', 'UPDATED'), ('deleted', 'DELETED')], max_length=16)),
+                ('object_id', models.PositiveIntegerField()),
+                ('parent_id', models.PositiveIntegerField(null=True)),
+                ('solution_id', models.PositiveIntegerField(null=True)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('course', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='courses.course')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='change',
+            index=models.Index(fields=['course', 'id'], name='change_course_id_idx'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0007_change'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='solution',
+            name='created',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddIndex(
+            model_name='solution',
+            index=models.Index(fields=['course', 'id'], name='solution_course_id_idx'),
+        ),
+    ]
@@ -0,0 +1,55 @@
+import courses.models
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def create_vector_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('CREATE INDEX search_entry_vector_idx ON courses_searchentry USING gin (vector)')
+
+
+def drop_vector_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS search_entry_vector_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0009_grades'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('target', models.CharField(choices=[('lecture', 'LECTURE'), ('task', 'TASK'), ('solution', 'SOLUTION'), ('mark', 'MARK'), ('comment', 'COMMENT')], max_length=16)),
+                ('object_id', models.PositiveIntegerField()),
+                ('parent_id', models.PositiveIntegerField(null=True)),
+                ('solution_id', models.PositiveIntegerField(null=True)),
+                ('text', models.TextField()),
+                ('vector', courses.models.TsVectorField(null=True)),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='courses.course')),
+                ('lecture', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='courses.lecture')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SearchTerm',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=64)),
+                ('count', models.PositiveIntegerField()),
+                ('entry', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='terms', to='courses.searchentry')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='searchterm',
+            index=models.Index(fields=['term', 'entry'], name='search_term_term_entry_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='searchentry',
+            constraint=models.UniqueConstraint(fields=('target', 'object_id'), name='search_entry_target_object_uniq'),
+        ),
+        migrations.RunPython(create_vector_index, drop_vector_index),
+    ]
@@ -0,0 +1,20 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0011_documents'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SolutionSignature',
+            fields=[
+                ('solution', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to='courses.solution')),
+                ('signature', models.BinaryField()),
+                ('task', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='courses.task')),
+            ],
+        ),
+    ]
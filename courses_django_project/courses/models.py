@@ -1,10 +1,27 @@
 import os
+import uuid
+from contextvars import ContextVar
 
+from django.conf import settings
 from django.core.validators import MinValueValidator, MaxValueValidator
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F, Lookup
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from core.storage import ContentAddressedStorage
+
+from courses.enum_types import ChangeAction, ChangeTarget, JobStatus
 
 from users.models import User
 
+document_storage = ContentAddressedStorage()
+
+_deleting_courses = ContextVar('deleting_courses', default=frozenset())
+
 
 def get_upload_path_doc(self, filename):
     return os.path.join(self.doc_path(), filename)
@@ -14,33 +31,335 @@ class Course(models.Model):
     title = models.CharField(max_length=256)
     participants = models.ManyToManyField(User)
 
+    def delete(self, *args, **kwargs):
+        """
+        Receivers of the rows the course cascades to may skip their per-row work while it's deleted,
+        see `is_being_deleted`.
+        """
+        token = _deleting_courses.set(_deleting_courses.get() | {self.pk})
+        try:
+            return super().delete(*args, **kwargs)
+        finally:
+            _deleting_courses.reset(token)
+
+    @staticmethod
+    def is_being_deleted(course_id):
+        return course_id in _deleting_courses.get()
+
+
+class BlobMissing(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'The document was deleted while it was stored, upload it again'
+
+
+class Blob(models.Model):
+    name = models.CharField(max_length=256, unique=True)
+    sha256 = models.CharField(max_length=64, db_index=True)
+    size = models.BigIntegerField()
+    ref_count = models.PositiveIntegerField(default=0)
+
+    @staticmethod
+    def is_blob(name):
+        return bool(name) and name.startswith(f'{document_storage.prefix}/')
+
+    @classmethod
+    def acquire(cls, name, count=1):
+        """
+        Adds `count` references to the blob of a stored file. The row is created with an insert that ignores
+        a concurrent one and then locked, so `delete_orphan` either runs before and the missing file is
+        reported, or after and sees the references.
+        """
+        if not cls.is_blob(name):
+            return
+        with transaction.atomic():
+            if not cls.objects.filter(name=name).exists() and document_storage.exists(name):
+                sha256 = os.path.splitext(os.path.basename(name))[0][:64]
+                cls.objects.bulk_create([cls(name=name, sha256=sha256, size=document_storage.size(name))],
+                                        ignore_conflicts=True)
+            blob = cls.objects.select_for_update().filter(name=name).first()
+            if blob is None or not document_storage.exists(name):
+                raise BlobMissing()
+            cls.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') + count)
+
+    @classmethod
+    def release(cls, name):
+        """
+        Drops a reference. The row of the last one is kept until `delete_orphan` locks it after the commit.
+        """
+        if not cls.is_blob(name):
+            return
+        with transaction.atomic():
+            blob = cls.objects.select_for_update().filter(name=name).first()
+            if blob is None:
+                return
+            cls.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') - 1)
+            if blob.ref_count <= 1:
+                transaction.on_commit(lambda: cls.delete_orphan(name))
+
+    @classmethod
+    def delete_orphan(cls, name):
+        with transaction.atomic():
+            blob = cls.objects.select_for_update().filter(name=name).first()
+            if blob is not None:
+                if blob.ref_count:
+                    return
+                blob.delete()
+            document_storage.delete(name)
+            DocumentContent.objects.filter(document=name).delete()
+            DocumentJob.objects.filter(document=name).delete()
+
 
 class Lecture(models.Model):
     course = models.ForeignKey(Course, on_delete=models.CASCADE)
     topic = models.CharField(max_length=256)
-    document = models.FileField(upload_to=get_upload_path_doc)
+    document = models.FileField(upload_to=get_upload_path_doc, storage=document_storage)
+
+    _stored_document = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._stored_document = instance.__dict__.get('document')
+        return instance
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if self.document.name != self._stored_document:
+                Blob.acquire(self.document.name)
+                Blob.release(self._stored_document)
+        self._stored_document = self.document.name
 
     def doc_path(self):
         return os.path.join(f'documents/{self.course_id}')
 
 
+@receiver(post_delete, sender=Lecture)
+def release_lecture_document(sender, instance, **kwargs):
+    Blob.release(instance.document.name)
+
+
+class DocumentJob(models.Model):
+    """
+    A queued text extraction of a lecture document, run by `manage.py process_documents`.
+    A running job keeps its lease in `run_after`, so the job of a crashed worker is picked up again.
+    """
+    document = models.CharField(max_length=256, unique=True)
+    status = models.CharField(max_length=16, choices=JobStatus.items(), default=JobStatus.PENDING.value)
+    attempts = models.PositiveIntegerField(default=0)
+    run_after = models.DateTimeField(default=timezone.now)
+    error = models.TextField(blank=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=('status', 'run_after'), name='document_job_status_run_idx'),
+        ]
+
+
+class DocumentContent(models.Model):
+    """
+    Text and metadata extracted from a lecture document, shared by the lectures with the same document.
+    """
+    document = models.CharField(max_length=256, unique=True)
+    sha256 = models.CharField(max_length=64)
+    size = models.BigIntegerField()
+    content_type = models.CharField(max_length=128)
+    pages = models.PositiveIntegerField(null=True)
+    text = models.TextField(blank=True)
+    extracted = models.DateTimeField(auto_now=True)
+
+
+class LectureUpload(models.Model):
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    course = models.ForeignKey(Course, on_delete=models.CASCADE)
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    filename = models.CharField(max_length=256)
+    size = models.BigIntegerField()
+    offset = models.BigIntegerField(default=0)
+    sha256 = models.CharField(max_length=64, blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+
+    def part_path(self):
+        return os.path.join(settings.CHUNKED_UPLOAD_DIR, f'{self.id}.part')
+
+
 class Task(models.Model):
+    course = models.ForeignKey(Course, on_delete=models.CASCADE)
     lecture = models.ForeignKey(Lecture, on_delete=models.CASCADE)
     text = models.TextField()
 
+    def save(self, *args, **kwargs):
+        if self.course_id is None:
+            self.course_id = self.lecture.course_id
+        super().save(*args, **kwargs)
+
 
 class Solution(models.Model):
+    course = models.ForeignKey(Course, on_delete=models.CASCADE)
+    lecture = models.ForeignKey(Lecture, on_delete=models.CASCADE)
     task = models.ForeignKey(Task, on_delete=models.CASCADE)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     text = models.TextField()
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=('task', 'user'), name='solution_task_user_idx'),
+            models.Index(fields=('course', 'id'), name='solution_course_id_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        if self.course_id is None or self.lecture_id is None:
+            self.course_id = self.task.course_id
+            self.lecture_id = self.task.lecture_id
+        super().save(*args, **kwargs)
+
+
+class SolutionSignature(models.Model):
+    """
+    MinHash signature of the text of a solution, compared by courses.similarity to find copied solutions.
+    """
+    solution = models.OneToOneField(Solution, on_delete=models.CASCADE, primary_key=True)
+    task = models.ForeignKey(Task, on_delete=models.CASCADE)
+    signature = models.BinaryField()
 
 
 class Mark(models.Model):
+    course = models.ForeignKey(Course, on_delete=models.CASCADE)
+    lecture = models.ForeignKey(Lecture, on_delete=models.CASCADE)
     solution = models.OneToOneField(Solution, on_delete=models.CASCADE)
     result = models.IntegerField(validators=[MinValueValidator(1), MaxValueValidator(10)])
 
+    def save(self, *args, **kwargs):
+        if self.course_id is None or self.lecture_id is None:
+            self.course_id = self.solution.course_id
+            self.lecture_id = self.solution.lecture_id
+        super().save(*args, **kwargs)
+
 
 class Comment(models.Model):
+    course = models.ForeignKey(Course, on_delete=models.CASCADE)
+    lecture = models.ForeignKey(Lecture, on_delete=models.CASCADE)
     mark = models.ForeignKey(Mark, on_delete=models.CASCADE)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     text = models.TextField()
+
+    def save(self, *args, **kwargs):
+        if self.course_id is None or self.lecture_id is None:
+            self.course_id = self.mark.course_id
+            self.lecture_id = self.mark.lecture_id
+        super().save(*args, **kwargs)
+
+
+class Change(models.Model):
+    """
+    An entry of the course change log. Changes of a solution, its mark and their comments keep
+    the solution id, so students only see the changes of their own solutions.
+    The course key doesn't constrain, so objects deleted together with their course can still be logged.
+    """
+    course = models.ForeignKey(Course, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    target = models.CharField(max_length=16, choices=ChangeTarget.items())
+    action = models.CharField(max_length=16, choices=ChangeAction.items())
+    object_id = models.PositiveIntegerField()
+    parent_id = models.PositiveIntegerField(null=True)
+    solution_id = models.PositiveIntegerField(null=True)
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=('course', 'id'), name='change_course_id_idx'),
+        ]
+
+
+def empty_histogram():
+    return [0] * 10
+
+
+class GradeStats(models.Model):
+    """
+    Count, sum and histogram of the 1-10 mark results, kept up to date by courses.grades.
+    """
+    count = models.PositiveIntegerField(default=0)
+    total = models.PositiveIntegerField(default=0)
+    histogram = models.JSONField(default=empty_histogram)
+
+    class Meta:
+        abstract = True
+
+    @property
+    def mean(self):
+        return round(self.total / self.count, 2) if self.count else None
+
+    def add(self, result, sign=1):
+        self.count += sign
+        self.total += sign * result
+        self.histogram[result - 1] += sign
+
+
+class StudentGrades(GradeStats):
+    course = models.ForeignKey(Course, on_delete=models.CASCADE)
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=('course', 'user'), name='student_grades_course_user_uniq'),
+        ]
+
+
+class TaskGrades(GradeStats):
+    task = models.OneToOneField(Task, on_delete=models.CASCADE, primary_key=True)
+    course = models.ForeignKey(Course, on_delete=models.CASCADE)
+
+
+class TsVectorField(models.Field):
+    """
+    A Postgres tsvector column. Other backends get a text column that stays empty.
+    """
+
+    def db_type(self, connection):
+        return 'tsvector' if connection.vendor == 'postgresql' else 'text'
+
+
+@TsVectorField.register_lookup
+class Matches(Lookup):
+    lookup_name = 'matches'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} @@ {rhs}', [*lhs_params, *rhs_params]
+
+
+class SearchEntry(models.Model):
+    """
+    The searchable text of a lecture, task, solution or comment, kept up to date by courses.search.
+    Entries of a solution and of the comments on its mark keep the solution id for the student visibility rules.
+    """
+    course = models.ForeignKey(Course, on_delete=models.CASCADE)
+    lecture = models.ForeignKey(Lecture, on_delete=models.CASCADE)
+    target = models.CharField(max_length=16, choices=ChangeTarget.items())
+    object_id = models.PositiveIntegerField()
+    parent_id = models.PositiveIntegerField(null=True)
+    solution_id = models.PositiveIntegerField(null=True)
+    text = models.TextField()
+    vector = TsVectorField(null=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=('target', 'object_id'), name='search_entry_target_object_uniq'),
+        ]
+
+
+class SearchTerm(models.Model):
+    """
+    The inverted index of the search entries on backends without full-text search.
+    """
+    entry = models.ForeignKey(SearchEntry, on_delete=models.CASCADE, related_name='terms')
+    term = models.CharField(max_length=64)
+    count = models.PositiveIntegerField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=('term', 'entry'), name='search_term_term_entry_idx'),
+        ]
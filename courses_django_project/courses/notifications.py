@@ -0,0 +1,74 @@
+import time
+
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from django.http import HttpResponseNotAllowed, JsonResponse
+from rest_framework.exceptions import APIException, NotAuthenticated
+
+from core.authentication import StatelessJWTAuthentication
+from core.cache import course_scope, user_scope
+from core.error_serializer import ErrorSerializer
+from core.events import EventStreamResponse, broker, stream_events
+
+from courses.models import Course
+from users.enum_types import RoleTypes
+
+
+def publish(event_type, solution, data, actor_id):
+    """
+    Publishes an event about a solution to its student and to the teachers of its course
+    once the transaction commits.
+    """
+    event = {
+        'type': event_type.value,
+        'actor': actor_id,
+        'data': {
+            'course': solution.course_id,
+            'lecture': solution.lecture_id,
+            'task': solution.task_id,
+            'solution': solution.id,
+            **data,
+        },
+    }
+    channels = [user_scope(solution.user_id), course_scope(solution.course_id)]
+    transaction.on_commit(lambda: broker.publish(channels, event))
+
+
+def authenticate(request):
+    token = request.GET.get('token')
+    if token:
+        request.META['HTTP_AUTHORIZATION'] = f'Bearer {token}'
+    result = StatelessJWTAuthentication().authenticate(request)
+    if result is None:
+        raise NotAuthenticated
+    return result
+
+
+def get_channels(user):
+    """
+    Students listen to their own solutions, teachers also to the solutions of their courses.
+    """
+    channels = [user_scope(user.id)]
+    if user.role == RoleTypes.TEACHER.value:
+        course_ids = getattr(user, 'token_courses', None)
+        if course_ids is None:
+            course_ids = Course.participants.through.objects.filter(user_id=user.id).values_list('course_id',
+                                                                                                flat=True)
+        channels.extend(map(course_scope, course_ids))
+    return channels
+
+
+async def events_view(request):
+    """
+    Streams mark and comment events as server-sent events. The access token is sent in the
+    Authorization header or, for EventSource clients, as `?token=`. The stream ends when the token expires.
+    """
+    if request.method != 'GET':
+        return HttpResponseNotAllowed(('GET',))
+    try:
+        user, token = await sync_to_async(authenticate)(request)
+    except APIException as error:
+        return JsonResponse(ErrorSerializer({'detail': error.detail}).data, status=error.status_code)
+    channels = await sync_to_async(get_channels)(user)
+    subscription = broker.subscribe(channels)
+    return EventStreamResponse(stream_events(subscription, user.id, token.get('exp', time.time())))
@@ -0,0 +1,188 @@
+import re
+from collections import Counter
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, F, FloatField, Q, Subquery, Sum
+from django.db.models.signals import post_delete, post_save
+
+from courses.changes import TARGETS, get_solution_id
+from courses.models import Comment, Course, DocumentContent, Lecture, SearchEntry, SearchTerm, Solution, Task
+from users.enum_types import RoleTypes
+
+TEXT_FIELDS = {
+    Lecture: 'topic',
+    Task: 'text',
+    Solution: 'text',
+    Comment: 'text',
+}
+
+TOKEN_RE = re.compile(r'\w+')
+MAX_TERM_LENGTH = 64
+MAX_QUERY_TERMS = 10
+BATCH_SIZE = 1000
+
+
+def tokenize(text):
+    return [token[:MAX_TERM_LENGTH] for token in TOKEN_RE.findall(text.lower())]
+
+
+class PostgresBackend:
+    """
+    Full-text search over the tsvector column of the entries, matched through its GIN index.
+    """
+
+    def index(self, entries):
+        from django.contrib.postgres.search import SearchVector
+        entries.update(vector=SearchVector('text', config=settings.SEARCH_CONFIG))
+
+    def index_entry(self, entry, created):
+        self.index(SearchEntry.objects.filter(pk=entry.pk))
+
+    def search(self, entries, query):
+        from django.contrib.postgres.search import SearchQuery, SearchRank
+        query = SearchQuery(query, config=settings.SEARCH_CONFIG)
+        return entries.filter(vector__matches=query).annotate(rank=SearchRank(F('vector'), query))
+
+
+class TermBackend:
+    """
+    Search over the SearchTerm inverted index, for backends without full-text search. An entry
+    matches when it contains every term of the query and ranks by the occurrences of the terms.
+    """
+
+    def index(self, entries):
+        SearchTerm.objects.filter(entry__in=entries).delete()
+        terms = (SearchTerm(entry_id=entry_id, term=term, count=count)
+                 for entry_id, text in entries.values_list('id', 'text').iterator()
+                 for term, count in Counter(tokenize(text)).items())
+        SearchTerm.objects.bulk_create(terms, batch_size=BATCH_SIZE)
+
+    def index_entry(self, entry, created):
+        if not created:
+            SearchTerm.objects.filter(entry=entry).delete()
+        SearchTerm.objects.bulk_create([SearchTerm(entry=entry, term=term, count=count)
+                                        for term, count in Counter(tokenize(entry.text)).items()])
+
+    def search(self, entries, query):
+        terms = set(tokenize(query)[:MAX_QUERY_TERMS])
+        if not terms:
+            return entries.none()
+        return entries.filter(terms__term__in=terms).annotate(
+            matched=Count('terms__term', distinct=True),
+            rank=Sum('terms__count', output_field=FloatField()),
+        ).filter(matched=len(terms))
+
+
+def get_backend():
+    if connection.vendor == 'postgresql':
+        return PostgresBackend()
+    return TermBackend()
+
+
+def get_text(instance, documents=None):
+    """
+    The text to index; lectures include the text extracted from their document. `documents` maps
+    document names to their text when it's already loaded.
+    """
+    text = getattr(instance, TEXT_FIELDS[type(instance)])
+    if not isinstance(instance, Lecture) or not instance.document:
+        return text
+    if documents is None:
+        documents = dict(DocumentContent.objects.filter(document=instance.document.name)
+                         .values_list('document', 'text'))
+    document = documents.get(instance.document.name)
+    return f'{text}\n{document}' if document else text
+
+
+def build_entry(instance, text):
+    target, parent = TARGETS[type(instance)]
+    return SearchEntry(course_id=instance.course_id,
+                       lecture_id=instance.pk if isinstance(instance, Lecture) else instance.lecture_id,
+                       target=target.value, object_id=instance.pk,
+                       parent_id=getattr(instance, parent) if parent else None,
+                       solution_id=get_solution_id(instance),
+                       text=text)
+
+
+def index_save(sender, instance, created, raw=False, **kwargs):
+    """
+    Indexes new objects and re-indexes saved ones whose text changed.
+    """
+    if raw:
+        return
+    entry, text = None, get_text(instance)
+    if not created:
+        target, _ = TARGETS[sender]
+        entry = SearchEntry.objects.filter(target=target.value, object_id=instance.pk).only('id', 'text').first()
+        if entry is not None and entry.text == text:
+            return
+    with transaction.atomic(savepoint=False):
+        if entry is None:
+            entry = build_entry(instance, text)
+            entry.save()
+        else:
+            entry.text = text
+            entry.save(update_fields=['text'])
+        get_backend().index_entry(entry, created)
+
+
+def index_delete(sender, instance, **kwargs):
+    if Course.is_being_deleted(instance.course_id):
+        return
+    target, _ = TARGETS[sender]
+    SearchEntry.objects.filter(target=target.value, object_id=instance.pk).delete()
+
+
+for model in TEXT_FIELDS:
+    post_save.connect(index_save, sender=model, dispatch_uid=f'search.save.{model.__name__}')
+    post_delete.connect(index_delete, sender=model, dispatch_uid=f'search.delete.{model.__name__}')
+
+
+def visible_entries(user, course_id=None):
+    """
+    Entries of the courses of the user; students only find their own solutions and the comments on
+    them, like they only see their own changes in the course change log.
+    """
+    course_ids = getattr(user, 'token_courses', None)
+    if course_ids is None:
+        course_ids = Course.participants.through.objects.filter(user_id=user.id).values('course_id')
+    entries = SearchEntry.objects.filter(course_id__in=course_ids)
+    if course_id is not None:
+        entries = entries.filter(course_id=course_id)
+    if user.role == RoleTypes.STUDENT.value:
+        own = Solution.objects.filter(user_id=user.id).values('id')
+        entries = entries.filter(Q(solution_id__isnull=True) | Q(solution_id__in=Subquery(own)))
+    return entries
+
+
+def search(entries, query):
+    """
+    The entries matching the query, annotated with `rank` and ordered by it.
+    """
+    return get_backend().search(entries, query).order_by('-rank', 'id')
+
+
+def rebuild(course_ids=None):
+    """
+    Re-indexes the lectures, tasks, solutions and comments of the given courses, or of all courses,
+    e.g. for rows written before the index existed or with bulk operations.
+    """
+    entries = SearchEntry.objects.all()
+    if course_ids is not None:
+        entries = entries.filter(course_id__in=course_ids)
+
+    documents = DocumentContent.objects.filter(document__in=Lecture.objects.values('document'))
+    if course_ids is not None:
+        documents = documents.filter(document__in=Lecture.objects.filter(course_id__in=course_ids).values('document'))
+    documents = dict(documents.values_list('document', 'text'))
+
+    with transaction.atomic():
+        entries.delete()
+        for model in TEXT_FIELDS:
+            instances = model.objects.select_related('mark') if model is Comment else model.objects.all()
+            if course_ids is not None:
+                instances = instances.filter(course_id__in=course_ids)
+            SearchEntry.objects.bulk_create((build_entry(instance, get_text(instance, documents))
+                                             for instance in instances.iterator()), batch_size=BATCH_SIZE)
+        get_backend().index(entries)
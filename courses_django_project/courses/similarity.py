@@ -0,0 +1,153 @@
+import random
+import re
+import struct
+import zlib
+from collections import defaultdict
+
+from courses.models import Solution, SolutionSignature
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+SHINGLE_SIZE = 3
+PERMUTATIONS = 128
+BANDS = 16
+ROWS = PERMUTATIONS // BANDS
+PRIME = (1 << 31) - 1
+THRESHOLD = 0.8
+BATCH_SIZE = 1000
+TOKEN_RE = re.compile(r'\w+')
+
+
+def make_coefficients(seed=1):
+    rng = random.Random(seed)
+    return [(rng.randrange(1, PRIME), rng.randrange(PRIME)) for _ in range(PERMUTATIONS)]
+
+
+COEFFICIENTS = make_coefficients()
+
+
+def shingles(text):
+    """
+    Hashes of the word `SHINGLE_SIZE`-grams of the text, case and punctuation are ignored.
+    """
+    tokens = TOKEN_RE.findall(text.lower())
+    return {zlib.crc32(' '.join(tokens[i:i + SHINGLE_SIZE]).encode())
+            for i in range(max(len(tokens) - SHINGLE_SIZE + 1, 1 if tokens else 0))}
+
+
+def minhash(hashes):
+    """
+    The MinHash signature of a set of shingle hashes as PERMUTATIONS little-endian 32-bit values,
+    or an empty signature for an empty set. Both code paths compute the same values.
+    """
+    if not hashes:
+        return b''
+    if numpy is not None:
+        values = numpy.fromiter(hashes, dtype=numpy.uint64, count=len(hashes))
+        a, b = (numpy.array(column, dtype=numpy.uint64) for column in zip(*COEFFICIENTS))
+        return ((numpy.outer(a, values) + b[:, None]) % PRIME).min(axis=1).astype('<u4').tobytes()
+    return struct.pack(f'<{PERMUTATIONS}I', *(min((a * x + b) % PRIME for x in hashes) for a, b in COEFFICIENTS))
+
+
+def store_signatures(solutions):
+    SolutionSignature.objects.bulk_create([
+        SolutionSignature(solution_id=solution.id, task_id=solution.task_id, signature=minhash(shingles(solution.text)))
+        for solution in solutions
+    ], ignore_conflicts=True)
+
+
+def sign_missing(course_ids=None):
+    """
+    Stores the signatures of the solutions submitted before they were signed, in batches, and returns their count.
+    """
+    solutions = Solution.objects.filter(solutionsignature__isnull=True).only('id', 'task_id', 'text').order_by('id')
+    if course_ids:
+        solutions = solutions.filter(course_id__in=course_ids)
+    count, last = 0, 0
+    while True:
+        batch = list(solutions.filter(id__gt=last)[:BATCH_SIZE])
+        if not batch:
+            return count
+        store_signatures(batch)
+        count, last = count + len(batch), batch[-1].id
+
+
+class Signatures:
+    """
+    The signatures of a task as a matrix, compared row against rows with NumPy when it's installed.
+    """
+
+    def __init__(self, signatures):
+        if numpy is not None:
+            self.rows = numpy.frombuffer(b''.join(signatures), dtype='<u4').reshape(len(signatures), PERMUTATIONS)
+        else:
+            self.rows = [struct.unpack(f'<{PERMUTATIONS}I', signature) for signature in signatures]
+
+    def similarity(self, row, others):
+        if numpy is not None:
+            return (self.rows[others] == self.rows[row]).mean(axis=1).tolist()
+        values = self.rows[row]
+        return [sum(x == y for x, y in zip(values, self.rows[other])) / PERMUTATIONS for other in others]
+
+
+def find_clusters(task_id, threshold=THRESHOLD):
+    """
+    Groups the solutions of a task whose estimated Jaccard similarity is at least `threshold`.
+
+    Solutions sharing a band of their signatures land in the same LSH bucket. Within a bucket every
+    solution is compared with the bucket's leaders only and either joins the cluster of the most similar
+    one or becomes a leader itself, so identical submissions don't cost a comparison per pair.
+    Returns (min similarity, solution ids) pairs, largest clusters first. Signatures are written with
+    their solutions and read from the primary, as a replica may miss the latest ones; solutions older than
+    the signatures are signed by `manage.py sign_solutions`.
+    """
+    rows = [(solution_id, bytes(signature)) for solution_id, signature in
+            SolutionSignature.objects.using('default').filter(task_id=task_id).order_by('solution_id')
+            .values_list('solution_id', 'signature')]
+    rows = [row for row in rows if row[1]]
+    if len(rows) < 2:
+        return []
+    ids, signatures = zip(*rows)
+    matrix = Signatures(signatures)
+
+    buckets = defaultdict(list)
+    width = ROWS * 4
+    for index, signature in enumerate(signatures):
+        for band in range(BANDS):
+            buckets[band, signature[band * width:(band + 1) * width]].append(index)
+
+    parent = list(range(len(ids)))
+
+    def find(index):
+        while parent[index] != index:
+            parent[index] = parent[parent[index]]
+            index = parent[index]
+        return index
+
+    edges = []
+    for members in buckets.values():
+        if len(members) < 2:
+            continue
+        leaders = [members[0]]
+        for member in members[1:]:
+            if find(member) in {find(leader) for leader in leaders}:
+                continue
+            scores = matrix.similarity(member, leaders)
+            best = max(range(len(leaders)), key=scores.__getitem__)
+            if scores[best] < threshold:
+                leaders.append(member)
+                continue
+            edges.append((member, scores[best]))
+            parent[find(member)] = find(leaders[best])
+
+    clusters, similarity = defaultdict(list), {}
+    for index in range(len(ids)):
+        clusters[find(index)].append(ids[index])
+    for member, score in edges:
+        root = find(member)
+        similarity[root] = min(similarity.get(root, 1.0), score)
+    return sorted(((similarity[root], members) for root, members in clusters.items() if len(members) > 1),
+                  key=lambda cluster: (-len(cluster[1]), cluster[1][0]))
@@ -1,3 +1,1491 @@
-from django.test import TestCase
+import asyncio
+import hashlib
+import io
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import zipfile
+import zlib
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, connections
+from django.db.utils import ConnectionHandler
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import AsyncClient, RequestFactory, SimpleTestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import path
+from django.utils import timezone
+
+from rest_framework import status
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory, APITestCase
+from rest_framework_simplejwt.tokens import AccessToken
+
+from core.asgi import AsyncStreamingASGIHandler, current_receive
+from core.async_views import async_view
+from core.authentication import TokenUser, add_claims
+from core.cache import user_scope
+from core.db.pool import ConnectionPool, PoolTimeout, close_pools
+from core.db.router import ReplicaRouter
+from core.events import broker
+from core.files import content_disposition
+from core.instrumentation import Registry, load_snapshots, summarize
+from core.middleware import InstrumentationMiddleware, ReplicaRoutingMiddleware
+from core.pagination import KeysetPagination
+from core.throttling import TokenBucketThrottle, take
+from core.values import compile_plan
+
+from courses.api.v1.serializers import GradingQueueSerializer, LectureSerializer, SolutionSerializer
+from courses.api.v1.views import LectureViewSet, SolutionViewSet
+from courses.benchmarks.data import build_school
+from courses.benchmarks.scenarios import compare, run_scenarios
+from courses.benchmarks.serialization import run_serialization
+from courses.enum_types import EventType, JobStatus
+from courses.management.commands.benchmark import BASELINE
+from courses.documents import claim_jobs, enqueue, extract_document
+from courses.models import (Blob, BlobMissing, Change, Comment, Course, DocumentJob, Lecture, Mark, SearchEntry,
+                            Solution, SolutionSignature, StudentGrades, Task, TaskGrades, document_storage)
+from courses.notifications import events_view
+from courses.uploads import append_chunk
+from users.enum_types import RoleTypes
+from users.models import User
+
+
+overlapping_reads = threading.Barrier(2, timeout=5)
+
+
+def overlapping_read(request):
+    """
+    Answers once a second read is served at the same time, the view of `urlpatterns` below.
+    """
+    overlapping_reads.wait()
+    return HttpResponse()
+
+
+urlpatterns = [path('overlapping/', async_view(overlapping_read))]
+
+
+def instrumented(test, **options):
+    """
+    Enables instrumentation with snapshots flushed to a temporary directory removed after `test`.
+    """
+    directory = tempfile.mkdtemp()
+    test.addCleanup(shutil.rmtree, directory, True)
+    return override_settings(INSTRUMENTATION_ENABLED=True, INSTRUMENTATION_DIR=directory, **options)
+
+
+class CoursesTestCase(APITestCase):
+
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+        self.teacher = User.objects.create_user('teacher', password='password', role=RoleTypes.TEACHER.value)
+        self.student = User.objects.create_user('student', password='password')
+        self.course = Course.objects.create(title='course')
+        self.course.participants.add(self.teacher)
+        self.lecture = Lecture.objects.create(course=self.course, topic='topic', document='documents/doc.pdf')
+
+
+class ParticipantTestCase(CoursesTestCase):
+
+    def test_membership_check_is_cached_per_request(self):
+        self.client.force_authenticate(self.teacher)
+        url = f'/api/v1/courses/{self.course.id}/lectures/'
+        with self.assertNumQueries(2):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        with self.assertNumQueries(1):
+            self.client.get(url, {'page_size': 10})
+
+    def test_roster_change_invalidates_membership(self):
+        url = f'/api/v1/courses/{self.course.id}/lectures/'
+        self.client.force_authenticate(self.student)
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_403_FORBIDDEN)
+
+        self.client.force_authenticate(self.teacher)
+        response = self.client.post(f'/api/v1/courses/{self.course.id}/participants/', {'id': self.student.id})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        self.client.force_authenticate(self.student)
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK)
+
+    def test_unknown_course(self):
+        self.client.force_authenticate(self.teacher)
+        response = self.client.get('/api/v1/courses/0/lectures/')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class CourseListTestCase(CoursesTestCase):
+
+    def add_courses(self, count):
+        for i in range(count):
+            course = Course.objects.create(title=f'course {i}')
+            course.participants.add(self.teacher, self.student)
+        caches['responses'].clear()
+
+    def test_list_query_count_does_not_grow_with_courses(self):
+        self.client.force_authenticate(self.teacher)
+        for mode, queries in (('', 2), ('ids', 2), ('count', 1)):
+            self.add_courses(3)
+            with self.assertNumQueries(queries):
+                small = self.client.get('/api/v1/courses/', {'participants': mode})
+            self.add_courses(10)
+            with self.assertNumQueries(queries):
+                large = self.client.get('/api/v1/courses/', {'participants': mode})
+            self.assertEqual(len(large.data['results']), len(small.data['results']) + 10)
+
+    def test_compact_participants(self):
+        self.add_courses(1)
+        self.client.force_authenticate(self.student)
+        response = self.client.get('/api/v1/courses/', {'participants': 'count'})
+        self.assertEqual(response.data['results'][0]['participants_count'], 2)
+        response = self.client.get('/api/v1/courses/', {'participants': 'ids'})
+        self.assertEqual(sorted(response.data['results'][0]['participants']), sorted([self.teacher.id, self.student.id]))
+
+
+class PaginationTestCase(CoursesTestCase):
+
+    def test_cursor_pages(self):
+        Lecture.objects.bulk_create(Lecture(course=self.course, topic=str(i), document='doc.pdf') for i in range(4))
+        self.client.force_authenticate(self.teacher)
+        url = f'/api/v1/courses/{self.course.id}/lectures/?page_size=2'
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertLessEqual(len(response.data['results']), 2)
+            ids.extend(lecture['id'] for lecture in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(ids, list(Lecture.objects.order_by('id').values_list('id', flat=True)))
+
+    def test_max_page_size(self):
+        paginator = KeysetPagination()
+        request = Request(APIRequestFactory().get('/', {'page_size': 100000}))
+        self.assertEqual(paginator.get_page_size(request), paginator.max_page_size)
+
+
+class DenormalizedKeysTestCase(CoursesTestCase):
+
+    def test_nested_objects_carry_course_and_lecture(self):
+        self.course.participants.add(self.student)
+        task = Task.objects.create(lecture=self.lecture, text='task')
+        self.assertEqual(task.course_id, self.course.id)
+        base = f'/api/v1/courses/{self.course.id}/lectures/{self.lecture.id}/tasks/{task.id}/solutions/'
+
+        self.client.force_authenticate(self.student)
+        solution_id = self.client.post(base, {'text': 'solution'}).data['id']
+        self.client.force_authenticate(self.teacher)
+        mark_id = self.client.post(f'{base}{solution_id}/marks/', {'result': 7}).data['id']
+        comments = f'{base}{solution_id}/marks/{mark_id}/comments/'
+        self.client.post(comments, {'text': 'comment'})
+
+        for model in (Solution, Mark, Comment):
+            obj = model.objects.get()
+            self.assertEqual((obj.course_id, obj.lecture_id), (self.course.id, self.lecture.id))
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(comments)
+        self.assertEqual(len(response.data['results']), 1)
+        comment_query = next(q['sql'] for q in queries if 'courses_comment' in q['sql'])
+        self.assertNotIn('courses_task', comment_query)
+
+    def test_mismatched_parents_do_not_resolve(self):
+        task, other = (Task.objects.create(lecture=self.lecture, text=text) for text in ('task', 'other'))
+        solution = Solution.objects.create(task=task, user=self.student, text='solution')
+        mark = Mark.objects.create(solution=solution, result=7)
+        Comment.objects.create(mark=mark, user=self.teacher, text='comment')
+        other_solution = Solution.objects.create(task=task, user=self.student, text='other')
+        lectures = f'/api/v1/courses/{self.course.id}/lectures/{self.lecture.id}'
+
+        self.client.force_authenticate(self.teacher)
+        response = self.client.get(f'{lectures}/tasks/{other.id}/solutions/{solution.id}/marks/{mark.id}/')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        for task_id, solution_id in ((task.id, other_solution.id), (other.id, solution.id)):
+            response = self.client.get(f'{lectures}/tasks/{task_id}/solutions/{solution_id}/marks/{mark.id}/comments/')
+            self.assertEqual(response.data['results'], [])
+
+    def test_create_outside_url_scope(self):
+        other = Lecture.objects.create(course=Course.objects.create(title='other'), topic='t', document='d.pdf')
+        self.client.force_authenticate(self.teacher)
+        response = self.client.post(f'/api/v1/courses/{self.course.id}/lectures/{other.id}/tasks/', {'text': 'task'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class BulkParticipantTestCase(CoursesTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.url = f'/api/v1/courses/{self.course.id}/participants/bulk/'
+        self.students = [User.objects.create_user(f'student{i}', password='password') for i in range(5)]
+        self.client.force_authenticate(self.teacher)
+
+    def test_bulk_enroll(self):
+        self.course.participants.add(self.students[0])
+        ids = [student.id for student in self.students] + [0]
+        with self.assertNumQueries(5):
+            response = self.client.post(self.url, {'ids': ids}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        statuses = {row['id']: row['status'] for row in response.data}
+        self.assertEqual(statuses[self.students[0].id], 'already_joined')
+        self.assertEqual(statuses[self.students[1].id], 'added')
+        self.assertEqual(statuses[0], 'not_found')
+        self.assertEqual(self.course.participants.count(), 6)
+
+    def test_bulk_enroll_from_csv(self):
+        rows = 'id\n' + '\n'.join(str(student.id) for student in self.students)
+        upload = SimpleUploadedFile('students.csv', rows.encode())
+        response = self.client.post(self.url, {'file': upload}, format='multipart')
+        self.assertEqual([row['status'] for row in response.data], ['added'] * 5)
+
+        rows = f'id\n{self.students[0].id}\nfoo\n\n{self.student.id}'
+        response = self.client.post(self.url, {'file': SimpleUploadedFile('students.csv', rows.encode())},
+                                    format='multipart')
+        self.assertEqual([dict(row) for row in response.data], [
+            {'id': self.students[0].id, 'status': 'already_joined'},
+            {'id': self.student.id, 'status': 'added'},
+            {'id': None, 'status': 'invalid', 'row': 3, 'value': 'foo'},
+        ])
+
+        upload = SimpleUploadedFile('students.csv', 'id\n1\n\xe9'.encode('latin-1'))
+        response = self.client.post(self.url, {'file': upload}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bulk_remove_keeps_teachers(self):
+        self.course.participants.add(*self.students)
+        ids = [self.teacher.id, self.students[0].id, self.student.id]
+        response = self.client.delete(self.url, {'ids': ids}, format='json')
+        self.assertEqual([row['status'] for row in response.data], ['teacher', 'removed', 'not_joined'])
+        self.assertTrue(self.course.participants.filter(pk=self.teacher.id).exists())
+        self.assertEqual(self.course.participants.count(), 5)
+
+
+class GradebookTestCase(CoursesTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.tasks = [Task.objects.create(lecture=self.lecture, text=str(i)) for i in range(2)]
+        for result, task in zip((4, 8), self.tasks):
+            solution = Solution.objects.create(task=task, user=self.student, text='solution')
+            Mark.objects.create(solution=solution, result=result)
+        Solution.objects.create(task=self.tasks[0], user=self.teacher, text='ungraded')
+        self.course.participants.add(self.student)
+        self.url = f'/api/v1/courses/{self.course.id}/gradebook/'
+
+    def test_csv(self):
+        self.client.force_authenticate(self.teacher)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], f'user_id,username,task_{self.tasks[0].id},task_{self.tasks[1].id},average')
+        self.assertEqual(lines[1], f'{self.student.id},student,4,8,6.0')
+        self.assertEqual(lines[2], ',average,4.0,8.0,')
+        self.assertEqual(len(lines), 3)
+
+    def test_participants_without_solutions_are_listed(self):
+        newcomer = User.objects.create_user('newcomer', password='password')
+        self.course.participants.add(newcomer)
+        Solution.objects.create(task=self.tasks[0], user=User.objects.create_user('former'), text='left')
+        self.client.force_authenticate(self.teacher)
+        lines = b''.join(self.client.get(self.url).streaming_content).decode().splitlines()
+        self.assertEqual(lines[1:3], [f'{self.student.id},student,4,8,6.0', f'{newcomer.id},newcomer,,,'])
+        self.assertEqual(len(lines), 4)
+
+    def test_jsonl(self):
+        self.client.force_authenticate(self.teacher)
+        response = self.client.get(self.url, {'output': 'jsonl'})
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual(rows[0]['marks'], {str(self.tasks[0].id): 4, str(self.tasks[1].id): 8})
+        self.assertEqual(rows[-1]['task_averages'][str(self.tasks[1].id)], 8.0)
+
+    def test_students_cannot_export(self):
+        self.client.force_authenticate(self.student)
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_403_FORBIDDEN)
+
+
+class LectureDocumentTestCase(CoursesTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media)
+        override = override_settings(MEDIA_ROOT=self.media, CHUNKED_UPLOAD_DIR=os.path.join(self.media, 'uploads'))
+        override.enable()
+        self.addCleanup(override.disable)
+        self.client.force_authenticate(self.teacher)
+
+    def put_chunk(self, url, data, start, total, checksum=None):
+        headers = {'HTTP_CONTENT_RANGE': f'bytes {start}-{start + len(data) - 1}/{total}'}
+        headers['HTTP_X_CHUNK_CHECKSUM'] = checksum or hashlib.sha256(data).hexdigest()
+        return self.client.put(url, data, content_type='application/octet-stream', **headers)
+
+    def test_chunked_upload(self):
+        content = b'0123456789' * 10
+        digest = hashlib.sha256(content).hexdigest()
+        url = f'/api/v1/courses/{self.course.id}/uploads/'
+        upload = self.client.post(url, {'filename': '../slides.pdf', 'size': len(content)}).data
+        chunk_url = f'{url}{upload["id"]}/chunk/'
+
+        self.assertEqual(self.put_chunk(chunk_url, content[:60], 0, 100).data['offset'], 60)
+        response = self.put_chunk(chunk_url, content[60:], 60, 100, checksum='0' * 64)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.put_chunk(chunk_url, content[10:], 10, 100)
+        self.assertEqual((response.status_code, response.data['offset']), (status.HTTP_409_CONFLICT, 60))
+        self.assertEqual(self.client.get(f'{url}{upload["id"]}/').data['offset'], 60)
+        self.put_chunk(chunk_url, content[60:], 60, 100)
+
+        response = self.client.post(f'{url}{upload["id"]}/complete/', {'topic': 'slides'})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        lecture = Lecture.objects.get(pk=response.data['id'])
+        self.assertEqual(lecture.document.name, f'blobs/{digest[:2]}/{digest}.pdf')
+        self.assertEqual(lecture.document.read(), content)
+
+    def test_chunks_are_received_outside_the_transaction(self):
+        url = f'/api/v1/courses/{self.course.id}/uploads/'
+        upload = self.client.post(url, {'filename': 'notes.txt', 'size': 4}).data
+        depths, test_depth = [], len(connection.savepoint_ids)
+
+        class Stream(io.BytesIO):
+            def read(self, size=-1):
+                depths.append(len(connection.savepoint_ids))
+                return super().read(size)
+
+        self.assertEqual(append_chunk(upload['id'], Stream(b'data'), 0, 4, None).offset, 4)
+        self.assertEqual(set(depths), {test_depth})
+
+    def test_range_download(self):
+        self.lecture.document.save('notes.txt', ContentFile(b'abcdefghij'))
+        url = f'/api/v1/courses/{self.course.id}/lectures/{self.lecture.id}/download/'
+
+        response = self.client.get(url, HTTP_RANGE='bytes=2-5')
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(b''.join(response.streaming_content), b'cdef')
+        self.assertEqual(response['Content-Range'], 'bytes 2-5/10')
+
+        response = self.client.get(url, HTTP_RANGE='bytes=-3')
+        self.assertEqual(b''.join(response.streaming_content), b'hij')
+        self.assertEqual(self.client.get(url, HTTP_RANGE='bytes=20-').status_code,
+                         status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+
+        response = self.client.get(url)
+        self.assertEqual(b''.join(response.streaming_content), b'abcdefghij')
+        etag = response['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=f'"other", W/{etag}')
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=f'"x{etag[1:-1]}x"').status_code, status.HTTP_200_OK)
+
+    def test_download_file_names_are_escaped(self):
+        self.assertEqual(content_disposition('notes "v2".pdf'), 'attachment; filename="notes \\"v2\\".pdf"')
+        self.assertEqual(content_disposition('a\r\nSet-Cookie: x.pdf'),
+                         "attachment; filename*=utf-8''a%0D%0ASet-Cookie%3A%20x.pdf")
+        self.assertEqual(content_disposition('конспект.pdf'),
+                         "attachment; filename*=utf-8''%D0%BA%D0%BE%D0%BD%D1%81%D0%BF%D0%B5%D0%BA%D1%82.pdf")
+
+    @override_settings(SENDFILE_BACKEND='x-accel-redirect')
+    def test_accel_redirect(self):
+        self.lecture.document.save('notes.txt', ContentFile(b'abcdefghij'))
+        response = self.client.get(f'/api/v1/courses/{self.course.id}/lectures/{self.lecture.id}/download/')
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected/{self.lecture.document.name}')
+
+    def test_identical_documents_share_one_blob(self):
+        other = Lecture(course=self.course, topic='copy')
+        self.lecture.document.save('a.pdf', ContentFile(b'same bytes'))
+        other.document.save('b.pdf', ContentFile(b'same bytes'))
+        self.assertEqual(self.lecture.document.name, other.document.name)
+        blob = Blob.objects.get()
+        self.assertEqual((blob.ref_count, blob.size), (2, 10))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.lecture.delete()
+        self.assertEqual(Blob.objects.get().ref_count, 1)
+        self.assertTrue(document_storage.exists(blob.name))
+        with self.captureOnCommitCallbacks(execute=True):
+            other.delete()
+        self.assertFalse(Blob.objects.exists())
+        self.assertFalse(document_storage.exists(blob.name))
+
+    def test_released_blob_is_kept_until_its_file_is_deleted(self):
+        self.lecture.document.save('a.pdf', ContentFile(b'same bytes'))
+        name = self.lecture.document.name
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.lecture.delete()
+        self.assertEqual(Blob.objects.get().ref_count, 0)
+        Blob.acquire(name)
+        for callback in callbacks:
+            callback()
+        self.assertEqual(Blob.objects.get().ref_count, 1)
+        self.assertTrue(document_storage.exists(name))
+
+    def test_acquiring_a_deleted_file_conflicts(self):
+        self.lecture.document.save('a.pdf', ContentFile(b'same bytes'))
+        name = self.lecture.document.name
+        with self.captureOnCommitCallbacks(execute=True):
+            self.lecture.delete()
+        with self.assertRaises(BlobMissing):
+            Blob.acquire(name)
+        self.assertFalse(Blob.objects.exists())
+
+    def test_upload_of_known_blob_needs_its_bytes(self):
+        self.lecture.document.save('a.pdf', ContentFile(b'same bytes'))
+        url = f'/api/v1/courses/{self.course.id}/uploads/'
+        digest = hashlib.sha256(b'same bytes').hexdigest()
+        upload = self.client.post(url, {'filename': 'b.pdf', 'size': 10, 'sha256': digest}).data
+        self.assertEqual(upload['offset'], 0)
+        response = self.client.post(f'{url}{upload["id"]}/complete/', {'topic': 'copy'})
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+        self.put_chunk(f'{url}{upload["id"]}/chunk/', b'other byte', 0, 10)
+        response = self.client.post(f'{url}{upload["id"]}/complete/', {'topic': 'copy'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        upload = self.client.post(url, {'filename': 'b.pdf', 'size': 10, 'sha256': digest}).data
+        self.put_chunk(f'{url}{upload["id"]}/chunk/', b'same bytes', 0, 10)
+        response = self.client.post(f'{url}{upload["id"]}/complete/', {'topic': 'copy'})
+        self.assertEqual(Lecture.objects.get(pk=response.data['id']).document.name, self.lecture.document.name)
+        self.assertEqual(Blob.objects.get().ref_count, 2)
+
+
+class ResponseCacheTestCase(CoursesTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.course.participants.add(self.student)
+        self.url = f'/api/v1/courses/{self.course.id}/lectures/'
+
+    def test_cached_until_course_changes(self):
+        self.client.force_authenticate(self.student)
+        first = self.client.get(self.url)
+        with self.assertNumQueries(0):
+            second = self.client.get(self.url)
+        self.assertEqual(first.data, second.data)
+        self.assertEqual(first['ETag'], second['ETag'])
+
+        self.client.force_authenticate(self.teacher)
+        self.client.patch(f'{self.url}{self.lecture.id}/', {'topic': 'changed'}, format='multipart')
+
+        self.client.force_authenticate(self.student)
+        response = self.client.get(self.url)
+        self.assertEqual(response.data['results'][0]['topic'], 'changed')
+        self.assertNotEqual(response['ETag'], first['ETag'])
+
+    @override_settings(ALLOWED_HOSTS=['*'])
+    def test_cached_per_host(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        with override_settings(MEDIA_ROOT=media):
+            self.lecture.document.save('a.pdf', ContentFile(b'abc'))
+        self.client.force_authenticate(self.student)
+        self.client.get(self.url, HTTP_HOST='one.example')
+        response = self.client.get(self.url, HTTP_HOST='two.example')
+        self.assertTrue(response.data['results'][0]['document'].startswith('http://two.example/'))
+
+    def test_not_modified(self):
+        self.client.force_authenticate(self.student)
+        response = self.client.get(self.url)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag']).status_code,
+                         status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code,
+                         status.HTTP_304_NOT_MODIFIED)
+
+    def test_roster_change_refreshes_course_list(self):
+        self.client.force_authenticate(self.student)
+        self.assertEqual(len(self.client.get('/api/v1/courses/').data['results']), 1)
+        self.client.force_authenticate(self.teacher)
+        self.client.delete(f'/api/v1/courses/{self.course.id}/participants/', {'id': self.student.id})
+        self.client.force_authenticate(self.student)
+        self.assertEqual(len(self.client.get('/api/v1/courses/').data['results']), 0)
+
+    def test_cached_course_is_hidden_from_non_participants(self):
+        self.client.force_authenticate(self.teacher)
+        self.assertEqual(self.client.get(f'/api/v1/courses/{self.course.id}/').status_code, status.HTTP_200_OK)
+        other = User.objects.create_user('other', password='password', role=RoleTypes.TEACHER.value)
+        self.client.force_authenticate(other)
+        self.assertEqual(self.client.get(f'/api/v1/courses/{self.course.id}/').status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_not_modified_matches_whole_tags(self):
+        self.client.force_authenticate(self.student)
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=f'"x{etag[1:-1]}x", W/{etag}')
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=f'"x{etag[1:-1]}x"')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class BenchmarkTestCase(APITestCase):
+
+    def test_query_budget(self):
+        for cache in caches.all():
+            cache.clear()
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        with override_settings(MEDIA_ROOT=media, CHUNKED_UPLOAD_DIR=os.path.join(media, 'uploads')):
+            fixture = build_school(courses=2, students=10, lectures=2, tasks=2)
+            report = run_scenarios(fixture, repeat=1)
+        with open(BASELINE) as baseline:
+            baseline = json.load(baseline)['scenarios']
+        self.assertEqual(compare(report, baseline, tolerance=float('inf')), [])
+
+    def test_values_plans_match_serializers(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        with override_settings(MEDIA_ROOT=media):
+            report = run_serialization(build_school(courses=1, students=10, lectures=2, tasks=2), repeat=1)
+        self.assertEqual({name: result['identical'] for name, result in report.items()},
+                         dict.fromkeys(report, True))
+
+
+class InstrumentationTestCase(CoursesTestCase):
+
+    def test_sampled_requests_are_reported(self):
+        with instrumented(self, INSTRUMENTATION_SAMPLE_RATE=1.0):
+            client = APIClient()
+            client.force_authenticate(self.teacher)
+            response = client.get(f'/api/v1/courses/{self.course.id}/lectures/')
+            self.assertIn('db;dur=', response['Server-Timing'])
+            self.assertIn('serialize;dur=', response['Server-Timing'])
+            self.assertIn('LectureViewSet.list', summarize())
+            self.assertEqual(client.get('/metrics/').status_code, status.HTTP_404_NOT_FOUND)
+            client.force_login(User.objects.create_user('staff', password='password', is_staff=True))
+            metrics = client.get('/metrics/').content.decode()
+        self.assertIn('courses_view_wall_ms{view="LectureViewSet.list",quantile="0.95"}', metrics)
+        self.assertIn('courses_view_serialize_ms{view="LectureViewSet.list",quantile="0.95"}', metrics)
+
+    def test_metrics_token(self):
+        with instrumented(self, INSTRUMENTATION_METRICS_TOKEN='secret'):
+            self.assertEqual(self.client.get('/metrics/', HTTP_AUTHORIZATION='Bearer wrong').status_code,
+                             status.HTTP_404_NOT_FOUND)
+            self.assertEqual(self.client.get('/metrics/', HTTP_AUTHORIZATION='Bearer secret').status_code,
+                             status.HTTP_200_OK)
+
+    def test_stale_snapshots_are_deleted(self):
+        with instrumented(self, INSTRUMENTATION_FLUSH_INTERVAL=10):
+            directory = settings.INSTRUMENTATION_DIR
+            for name, age in (('1.json', 20), ('2.json', 40)):
+                with open(os.path.join(directory, name), 'w') as snapshot:
+                    json.dump({'View.list': {'samples': [{'wall_ms': age}], 'duplicates': {}}}, snapshot)
+                os.utime(os.path.join(directory, name), (time.time() - age, time.time() - age))
+            self.assertEqual(load_snapshots()['View.list']['samples'], [{'wall_ms': 20}])
+            self.assertEqual(os.listdir(directory), ['1.json'])
+
+    def test_flusher_stops_when_disabled(self):
+        registry = Registry(10)
+        with instrumented(self, INSTRUMENTATION_FLUSH_INTERVAL=0.01):
+            registry.add('View.list', {'wall_ms': 1}, {})
+            time.sleep(0.05)
+            directory = settings.INSTRUMENTATION_DIR
+            self.assertEqual(os.listdir(directory), [f'{os.getpid()}.json'])
+        registry.flusher.join(1)
+        self.assertFalse(registry.flusher.is_alive())
+
+    def test_disabled_by_default(self):
+        self.client.force_authenticate(self.teacher)
+        response = self.client.get(f'/api/v1/courses/{self.course.id}/lectures/')
+        self.assertNotIn('Server-Timing', response)
+        self.assertEqual(self.client.get('/metrics/').status_code, status.HTTP_404_NOT_FOUND)
+
+
+class AsyncViewTestCase(TransactionTestCase):
+
+    def test_reads_run_in_a_worker_thread(self):
+        teacher = User.objects.create_user('teacher', password='password', role=RoleTypes.TEACHER.value)
+        course = Course.objects.create(title='course')
+        course.participants.add(teacher)
+        Lecture.objects.create(course=course, topic='topic', document='documents/doc.pdf')
+        threads = []
+
+        def list_lectures(request, *args, **kwargs):
+            threads.append(threading.get_ident())
+            return LectureViewSet.as_view({'get': 'list'})(request, *args, **kwargs)
+
+        request = APIRequestFactory().get(f'/api/v1/courses/{course.id}/lectures/',
+                                          HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(teacher)}')
+        response = async_to_sync(async_view(list_lectures))(request, course_pk=str(course.id))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(json.loads(response.content)['results'][0]['topic'], 'topic')
+        self.assertNotEqual(threads, [threading.get_ident()])
+
+    def test_stream_closes_its_connections(self):
+        used, closed = [], []
+        wrapper = type(connections['default'])
+        close = wrapper.close
+
+        def parts():
+            used.append(connections['default'])
+            yield str(User.objects.count()).encode()
+
+        def record_close(self):
+            closed.append(self)
+            close(self)
+
+        async def stream():
+            async def send(message):
+                pass
+
+            await AsyncStreamingASGIHandler().send_response(StreamingHttpResponse(parts()), send)
+
+        # An in-memory SQLite connection ignores close(), so the calls are recorded instead
+        with mock.patch.object(wrapper, 'close', record_close), \
+                mock.patch.dict(connections.databases['default'], {'CONN_MAX_AGE': None}):
+            async_to_sync(stream)()
+        self.assertIsNot(used[0], connections['default'])
+        self.assertIn(used[0], closed)
+
+    @override_settings(ROOT_URLCONF='courses.tests', DATABASE_REPLICAS=['replica'])
+    def test_reads_overlap_through_the_middleware(self):
+        overlapping_reads.reset()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        sticky = {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': directory}
+
+        async def read_twice():
+            client = AsyncClient()
+            return await asyncio.gather(client.get('/overlapping/', authorization='Bearer a'),
+                                        client.get('/overlapping/', authorization='Bearer b'))
+
+        with instrumented(self, INSTRUMENTATION_SAMPLE_RATE=1.0), \
+                override_settings(CACHES={**settings.CACHES, 'sticky': sticky}, DATABASE_STICKY_CACHE='sticky'):
+            responses = async_to_sync(read_twice)()
+        self.assertEqual([response.status_code for response in responses], [200, 200])
+        self.assertIn('app;dur=', responses[0]['Server-Timing'])
+
+    def test_reads_are_instrumented_under_asgi(self):
+        teacher = User.objects.create_user('teacher', password='password', role=RoleTypes.TEACHER.value)
+        course = Course.objects.create(title='course')
+        course.participants.add(teacher)
+        view = async_view(LectureViewSet.as_view({'get': 'list'}))
+        request = APIRequestFactory().get(f'/api/v1/courses/{course.id}/lectures/',
+                                          HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(teacher)}')
+
+        async def get_response(request):
+            return await view(request, course_pk=course.id)
+
+        with instrumented(self, INSTRUMENTATION_SAMPLE_RATE=1.0):
+            responses = [
+                async_to_sync(InstrumentationMiddleware(get_response))(request),
+                # Sync middleware, e.g. under WSGI, runs the async view through async_to_sync
+                InstrumentationMiddleware(async_to_sync(get_response))(request),
+            ]
+        for response in responses:
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotIn('desc="0 queries"', response['Server-Timing'])
+            self.assertNotIn('render;dur=0.00', response['Server-Timing'])
+
+@override_settings(TOKEN_COURSES_CLAIM=True)
+class StatelessAuthTestCase(CoursesTestCase):
+
+    def get_tokens(self, username):
+        response = self.client.post('/api/token/', {'username': username, 'password': 'password'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def test_no_user_lookup(self):
+        tokens = self.get_tokens('teacher')
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {tokens['access']}")
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/api/v1/courses/{self.course.id}/lectures/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_roster_change_outdates_token_courses(self):
+        tokens = self.get_tokens('student')
+        url = f'/api/v1/courses/{self.course.id}/lectures/'
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {tokens['access']}")
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_403_FORBIDDEN)
+
+        self.client.force_authenticate(self.teacher)
+        self.client.post(f'/api/v1/courses/{self.course.id}/participants/', {'id': self.student.id})
+        self.client.force_authenticate(None)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {tokens['access']}")
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK)
+
+    def test_token_courses_need_a_shared_cache(self):
+        tokens = self.get_tokens('teacher')
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {tokens['access']}")
+        with override_settings(TOKEN_COURSES_CLAIM=False), CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f'/api/v1/courses/{self.course.id}/lectures/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('courses_course_participants', queries[0]['sql'])
+
+    def test_refresh_revalidates_role(self):
+        tokens = self.get_tokens('teacher')
+        self.teacher.role = RoleTypes.STUDENT.value
+        self.teacher.save()
+        response = self.client.post('/api/token/refresh/', {'refresh': tokens['refresh']})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(AccessToken(response.data['access'])['role'], RoleTypes.STUDENT.value)
+
+        self.teacher.is_active = False
+        self.teacher.save()
+        response = self.client.post('/api/token/refresh/', {'refresh': tokens['refresh']})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class ChangeLogTestCase(CoursesTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.other = User.objects.create_user('other', password='password')
+        self.course.participants.add(self.student, self.other)
+        self.task = Task.objects.create(lecture=self.lecture, text='task')
+        self.url = f'/api/v1/courses/{self.course.id}/changes/'
+
+    def test_changes_since_cursor(self):
+        self.client.force_authenticate(self.teacher)
+        cursor = self.client.get(self.url).data['cursor']
+        Lecture.objects.filter(pk=self.lecture.pk).update(topic='renamed')
+        self.task.text = 'updated'
+        self.task.save()
+        self.task.delete()
+
+        response = self.client.get(self.url, {'since': cursor})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([(change['target'], change['action'], change['data']) for change in response.data['results']],
+                         [('task', 'updated', None), ('task', 'deleted', None)])
+        self.assertEqual(self.client.get(self.url, {'since': response.data['cursor']}).data['results'], [])
+
+    def test_students_see_only_their_own_solutions(self):
+        own = Solution.objects.create(task=self.task, user=self.student, text='mine')
+        Mark.objects.create(solution=own, result=8)
+        foreign = Solution.objects.create(task=self.task, user=self.other, text='theirs')
+        Mark.objects.create(solution=foreign, result=3)
+
+        self.client.force_authenticate(self.student)
+        response = self.client.get(self.url, {'page_size': 2})
+        self.assertTrue(response.data['more'])
+        response = self.client.get(self.url, {'since': response.data['cursor']})
+        self.assertEqual([(change['target'], change['data']) for change in response.data['results']],
+                         [('solution', {'id': own.id, 'user': {'id': self.student.id, 'username': 'student',
+                                                               'role': RoleTypes.STUDENT.value},
+                                        'text': 'mine'}),
+                          ('mark', {'id': own.mark.id, 'result': 8})])
+
+    def test_not_a_participant(self):
+        self.client.force_authenticate(User.objects.create_user('stranger', password='password'))
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_course_deletion_drops_the_log_at_once(self):
+        for student in (self.student, self.other):
+            Mark.objects.create(solution=Solution.objects.create(task=self.task, user=student, text='text'), result=5)
+        self.client.force_authenticate(self.teacher)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.delete(f'/api/v1/courses/{self.course.id}/')
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(Change.objects.filter(course_id=self.course.id).exists())
+        self.assertEqual([query['sql'] for query in queries if query['sql'].startswith('INSERT')], [])
+        self.assertEqual([query['sql'] for query in queries
+                          if 'grades"' in query['sql'] and not query['sql'].startswith('DELETE')], [])
+        self.assertEqual(len([query for query in queries if 'DELETE FROM "courses_change"' in query['sql']]), 1)
+
+
+class EventTestCase(CoursesTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.course.participants.add(self.student)
+        task = Task.objects.create(lecture=self.lecture, text='task')
+        self.solution = Solution.objects.create(task=task, user=self.student, text='solution')
+        self.marks_url = (f'/api/v1/courses/{self.course.id}/lectures/{self.lecture.id}/tasks/{task.id}'
+                          f'/solutions/{self.solution.id}/marks/')
+        self.loop = asyncio.new_event_loop()
+        self.addCleanup(self.loop.close)
+
+    def test_marking_publishes_to_the_student(self):
+        async def listen():
+            return broker.subscribe([user_scope(self.student.id)])
+
+        subscription = self.loop.run_until_complete(listen())
+        self.addCleanup(broker.unsubscribe, subscription)
+        self.client.force_authenticate(self.teacher)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(self.marks_url, {'result': 9})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        event = self.loop.run_until_complete(asyncio.wait_for(subscription.queue.get(), 1))
+        self.assertEqual(event['type'], EventType.MARK_CREATED.value)
+        self.assertEqual(event['data']['solution'], self.solution.id)
+        self.assertEqual(event['data']['mark']['result'], 9)
+
+    def test_event_stream(self):
+        response = self.client.post('/api/token/', {'username': 'student', 'password': 'password'})
+        request = RequestFactory().get('/api/v1/events/', {'token': response.data['access']})
+        messages = []
+
+        async def stream():
+            disconnected = asyncio.Event()
+
+            async def receive():
+                await disconnected.wait()
+                return {'type': 'http.disconnect'}
+
+            async def send(message):
+                messages.append(message)
+                if b'event: mark.created' in message.get('body', b''):
+                    disconnected.set()
+
+            current_receive.set(receive)
+            response = await events_view(request)
+            sending = asyncio.ensure_future(AsyncStreamingASGIHandler().send_response(response, send))
+            broker.publish([user_scope(self.student.id)],
+                           {'type': EventType.MARK_CREATED.value, 'actor': self.teacher.id, 'data': {'mark': 1}})
+            await asyncio.wait_for(sending, 5)
+
+        async_to_sync(stream)()
+        self.assertEqual(messages[0]['status'], status.HTTP_200_OK)
+        self.assertIn((b'Content-Type', b'text/event-stream'), messages[0]['headers'])
+        self.assertEqual(messages[-1]['body'], b'event: mark.created\ndata: {"mark": 1}\n\n')
+        self.assertEqual(dict(broker.subscriptions), {})
+
+    def test_event_stream_requires_token(self):
+        response = async_to_sync(events_view)(RequestFactory().get('/api/v1/events/'))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class GradingQueueTestCase(CoursesTestCase):
+
+    def setUp(self):
+        super().setUp()
+        task = Task.objects.create(lecture=self.lecture, text='task')
+        self.solutions = [Solution.objects.create(task=task, user=self.student, text=f'solution {i}')
+                          for i in range(4)]
+        Mark.objects.create(solution=self.solutions[1], result=4)
+        self.url = f'/api/v1/courses/{self.course.id}/grading-queue/'
+        self.client.force_authenticate(self.teacher)
+
+    def test_ungraded_solutions(self):
+        response = self.client.get(self.url, {'page_size': 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([solution['id'] for solution in response.data['results']],
+                         [self.solutions[0].id, self.solutions[2].id])
+        response = self.client.get(response.data['next'])
+        self.assertEqual([solution['id'] for solution in response.data['results']], [self.solutions[3].id])
+
+    def test_solutions_submitted_at_once_are_paged_in_order(self):
+        Solution.objects.update(created=timezone.now())
+        ids, url = [], f'{self.url}?page_size=1'
+        while url:
+            response = self.client.get(url)
+            ids.extend(solution['id'] for solution in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(ids, [self.solutions[0].id, self.solutions[2].id, self.solutions[3].id])
+
+    def test_batch_marking(self):
+        data = {'marks': [{'solution': self.solutions[0].id, 'result': 7},
+                          {'solution': self.solutions[1].id, 'result': 9},
+                          {'solution': 0, 'result': 5}]}
+        with self.assertNumQueries(17):
+            response = self.client.post(f'{self.url}marks/', data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([row['status'] for row in response.data], ['created', 'updated', 'not_found'])
+        self.assertEqual(self.solutions[0].mark.result, 7)
+        self.assertEqual(Mark.objects.get(solution=self.solutions[1]).result, 9)
+        self.assertEqual(response.data[0]['mark'], self.solutions[0].mark.id)
+
+    def test_marking_a_marked_solution(self):
+        solution = self.solutions[1]
+        url = (f'/api/v1/courses/{self.course.id}/lectures/{self.lecture.id}/tasks/{solution.task_id}/'
+               f'solutions/{solution.id}/marks/')
+        response = self.client.post(url, {'result': 8})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(str(response.data['detail']), 'The solution is already marked, update its mark instead')
+        self.assertEqual(Mark.objects.get(solution=solution).result, 4)
+
+    def test_batch_marking_validates_every_row(self):
+        data = {'marks': [{'solution': self.solutions[0].id, 'result': 7},
+                          {'solution': self.solutions[2].id, 'result': 11}]}
+        response = self.client.post(f'{self.url}marks/', data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(list(response.data['marks'][1]), ['result'])
+        self.assertFalse(Mark.objects.filter(solution=self.solutions[0]).exists())
+
+    def test_students_cannot_grade(self):
+        self.course.participants.add(self.student)
+        self.client.force_authenticate(self.student)
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_403_FORBIDDEN)
+
+
+class GradesTestCase(CoursesTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.other = User.objects.create_user('other', password='password')
+        self.course.participants.add(self.student, self.other)
+        self.task = Task.objects.create(lecture=self.lecture, text='task')
+        self.solutions = [Solution.objects.create(task=self.task, user=user, text='solution')
+                          for user in (self.student, self.student, self.other)]
+        self.course_url = f'/api/v1/courses/{self.course.id}'
+        self.task_url = f'{self.course_url}/lectures/{self.lecture.id}/tasks/{self.task.id}'
+        self.client.force_authenticate(self.teacher)
+
+    def mark(self, solution, result):
+        url = f'{self.task_url}/solutions/{solution.id}/marks/'
+        mark = Mark.objects.filter(solution=solution).first()
+        if mark is None:
+            return self.client.post(url, {'result': result})
+        return self.client.put(f'{url}{mark.id}/', {'result': result})
+
+    def test_marks_update_aggregates(self):
+        self.mark(self.solutions[0], 4)
+        self.mark(self.solutions[1], 8)
+        self.mark(self.solutions[0], 6)
+        self.client.post(f'{self.course_url}/grading-queue/marks/',
+                         {'marks': [{'solution': self.solutions[2].id, 'result': 10}]}, format='json')
+
+        response = self.client.get(f'{self.course_url}/grades/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        grades = {row['user']['id']: row for row in response.data['results']}
+        self.assertEqual((grades[self.student.id]['count'], grades[self.student.id]['mean']), (2, 7.0))
+        self.assertEqual(grades[self.student.id]['histogram'], [0, 0, 0, 0, 0, 1, 0, 1, 0, 0])
+        self.assertEqual(grades[self.other.id]['mean'], 10.0)
+        with self.assertNumQueries(1):
+            response = self.client.get(f'{self.task_url}/grades/')
+        self.assertEqual((response.data['count'], response.data['mean']), (3, 8.0))
+
+        self.client.force_authenticate(self.student)
+        response = self.client.get(f'{self.course_url}/grades/')
+        self.assertEqual([row['user']['id'] for row in response.data['results']], [self.student.id])
+        self.assertEqual(self.client.get(f'{self.task_url}/grades/').status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_deleted_marks_and_rebuild(self):
+        self.mark(self.solutions[0], 4)
+        self.mark(self.solutions[2], 9)
+        self.solutions[0].delete()
+        self.assertEqual(StudentGrades.objects.get(user=self.student).count, 0)
+
+        Mark.objects.create(solution=self.solutions[1], result=2)
+        call_command('rebuild_grades', course=[self.course.id], stdout=io.StringIO())
+        self.assertEqual(StudentGrades.objects.get(user=self.student).histogram, [0, 1, 0, 0, 0, 0, 0, 0, 0, 0])
+        self.assertEqual(TaskGrades.objects.get(task=self.task).total, 11)
+
+
+class SearchTestCase(CoursesTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.other = User.objects.create_user('other', password='password')
+        self.course.participants.add(self.student, self.other)
+        self.task = Task.objects.create(lecture=self.lecture, text='Sort a linked list')
+        self.own = Solution.objects.create(task=self.task, user=self.student, text='Merge sort of the linked list')
+        self.foreign = Solution.objects.create(task=self.task, user=self.other, text='Bubble sort, list sort list')
+        mark = Mark.objects.create(solution=self.foreign, result=5)
+        Comment.objects.create(mark=mark, user=self.teacher, text='Bubble sort is slow')
+        hidden = Course.objects.create(title='hidden')
+        Lecture.objects.create(course=hidden, topic='Sorting lists', document='documents/doc.pdf')
+
+    def search(self, query, **params):
+        response = self.client.get('/api/v1/search/', {'q': query, **params})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [(row['target'], row['object_id']) for row in response.data['results']]
+
+    def test_search_is_ranked_and_scoped(self):
+        self.client.force_authenticate(self.teacher)
+        self.assertEqual(self.search('list sort'), [('solution', self.foreign.id), ('task', self.task.id),
+                                                    ('solution', self.own.id)])
+        self.assertEqual(len(self.search('bubble', course=self.course.id)), 2)
+
+        self.client.force_authenticate(self.student)
+        self.assertEqual(self.search('sort'), [('task', self.task.id), ('solution', self.own.id)])
+        self.assertEqual(self.client.get('/api/v1/search/').status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_index_follows_changes(self):
+        self.client.force_authenticate(self.teacher)
+        self.own.text = 'Quick sort'
+        self.own.save()
+        self.assertEqual(self.search('quick'), [('solution', self.own.id)])
+        self.assertEqual(self.search('merge'), [])
+        self.task.delete()
+        self.assertEqual(self.search('sort'), [])
+
+        SearchEntry.objects.all().delete()
+        call_command('rebuild_search_index', course=[self.course.id], stdout=io.StringIO())
+        self.assertEqual(self.search('topic'), [('lecture', self.lecture.id)])
+
+
+class DocumentExtractionTestCase(CoursesTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media)
+        override = override_settings(MEDIA_ROOT=self.media)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.client.force_authenticate(self.teacher)
+        self.url = f'/api/v1/courses/{self.course.id}/lectures/'
+
+    def process(self):
+        call_command('process_documents', once=True, stdout=io.StringIO())
+
+    def test_documents_are_extracted_by_the_worker(self):
+        document = SimpleUploadedFile('notes.txt', b'Recursion and memoization')
+        lecture = self.client.post(self.url, {'topic': 'dynamic programming', 'document': document}).data
+        content_url = f'{self.url}{lecture["id"]}/content/'
+        self.assertEqual(self.client.get(content_url).status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(DocumentJob.objects.get().status, JobStatus.PENDING.value)
+
+        self.process()
+        content = self.client.get(content_url).data
+        self.assertEqual((content['size'], content['content_type']), (25, 'text/plain'))
+        self.assertEqual(content['sha256'], hashlib.sha256(b'Recursion and memoization').hexdigest())
+        self.assertEqual(DocumentJob.objects.get().status, JobStatus.DONE.value)
+        response = self.client.get('/api/v1/search/', {'q': 'memoization'})
+        self.assertEqual([row['object_id'] for row in response.data['results']], [lecture['id']])
+
+        enqueue([Lecture.objects.get(pk=lecture['id']).document.name])
+        self.assertEqual(DocumentJob.objects.get().status, JobStatus.DONE.value)
+
+    def test_office_and_pdf_documents(self):
+        docx = io.BytesIO()
+        with zipfile.ZipFile(docx, 'w') as archive:
+            archive.writestr('word/document.xml', '<w:document xmlns:w="w"><w:body><w:p><w:r><w:t>Graphs</w:t>'
+                                                  '</w:r></w:p><w:p><w:r><w:t>and trees</w:t></w:r></w:p>'
+                                                  '</w:body></w:document>')
+            archive.writestr('docProps/app.xml', '<Properties><Pages>3</Pages></Properties>')
+        name = document_storage.save('slides.docx', ContentFile(docx.getvalue()))
+        content = extract_document(name)
+        self.assertEqual((content['text'], content['pages']), ('Graphs\nand trees', 3))
+
+        stream = zlib.compress(b'BT (Hello \\(PDF\\)) Tj [(Wor) -20 (ld)] TJ ET')
+        pdf = (b'%PDF-1.4\n1 0 obj << /Type /Pages /Count 2 >> endobj\n2 0 obj << /Type /Page >> endobj\n'
+               b'3 0 obj << /Type /Page >> endobj\n4 0 obj << /Filter /FlateDecode >>\nstream\n' + stream +
+               b'\nendstream\nendobj\n')
+        content = extract_document(document_storage.save('paper.pdf', ContentFile(pdf)))
+        self.assertEqual((content['text'], content['pages']), ('Hello (PDF)\nWorld', 2))
+
+    @override_settings(DOCUMENT_JOB_ATTEMPTS=2, DOCUMENT_JOB_BACKOFF=60)
+    def test_failed_jobs_are_retried_and_backfilled(self):
+        call_command('backfill_documents', course=[self.course.id], stdout=io.StringIO())
+        self.process()
+        job = DocumentJob.objects.get(document='documents/doc.pdf')
+        self.assertEqual((job.status, job.attempts), (JobStatus.PENDING.value, 1))
+        self.assertIn('FileNotFoundError', job.error)
+
+        DocumentJob.objects.update(run_after=timezone.now())
+        self.process()
+        self.assertEqual(DocumentJob.objects.get().status, JobStatus.FAILED.value)
+
+        os.makedirs(os.path.join(self.media, 'documents'))
+        with open(os.path.join(self.media, 'documents', 'doc.pdf'), 'wb') as document:
+            document.write(b'%PDF-1.4 /Type /Page')
+        call_command('backfill_documents', stdout=io.StringIO())
+        self.process()
+        job = DocumentJob.objects.get()
+        self.assertEqual((job.status, job.attempts), (JobStatus.DONE.value, 1))
+        self.assertEqual(self.client.get(f'{self.url}{self.lecture.id}/content/').data['pages'], 1)
+
+
+    @override_settings(DOCUMENT_JOB_ATTEMPTS=2)
+    def test_expired_lease_of_the_last_attempt_fails(self):
+        expired = timezone.now() - timedelta(seconds=1)
+        DocumentJob.objects.bulk_create([
+            DocumentJob(document='documents/crash.pdf', status=JobStatus.RUNNING.value, attempts=2, run_after=expired),
+            DocumentJob(document='documents/retry.pdf', status=JobStatus.RUNNING.value, attempts=1, run_after=expired),
+        ])
+        self.assertEqual([job.document for job in claim_jobs(10)], ['documents/retry.pdf'])
+        job = DocumentJob.objects.get(document='documents/crash.pdf')
+        self.assertEqual((job.status, job.attempts), (JobStatus.FAILED.value, 2))
+        self.assertEqual(DocumentJob.objects.get(document='documents/retry.pdf').attempts, 2)
+
+class SimilarityTestCase(CoursesTestCase):
+    essay = ('A binary search halves the sorted range on every step until the key is found or the range is empty, '
+             'so it needs a logarithmic number of comparisons and works on any random access sequence')
+
+    def setUp(self):
+        super().setUp()
+        self.course.participants.add(self.student)
+        self.task = Task.objects.create(lecture=self.lecture, text='Explain binary search')
+        self.url = f'/api/v1/courses/{self.course.id}/lectures/{self.lecture.id}/tasks/{self.task.id}/'
+        self.users = [User.objects.create_user(f'student{i}', password='password') for i in range(4)]
+        self.course.participants.add(*self.users)
+
+    def test_copied_solutions_are_clustered(self):
+        self.client.force_authenticate(self.student)
+        response = self.client.post(f'{self.url}solutions/', {'text': self.essay})
+        self.assertTrue(SolutionSignature.objects.filter(solution_id=response.data['id']).exists())
+        copies = [Solution.objects.create(task=self.task, user=user, text=text) for user, text in zip(self.users, [
+            self.essay.upper() + '!',
+            self.essay.replace('every step', 'each step'),
+            'Linear search looks at every element in turn and needs no sorting at all',
+            '',
+        ])]
+        self.client.force_authenticate(self.teacher)
+        self.assertEqual(self.client.get(f'{self.url}similar/').data, [])
+        self.assertEqual(SolutionSignature.objects.count(), 1)
+        call_command('sign_solutions', course=[self.course.id], stdout=io.StringIO())
+
+        response = self.client.get(f'{self.url}similar/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 1)
+        self.assertEqual([solution['id'] for solution in response.data[0]['solutions']],
+                         [response.data[0]['solutions'][0]['id'], copies[0].id, copies[1].id])
+        self.assertGreaterEqual(response.data[0]['similarity'], 0.8)
+        self.assertEqual(SolutionSignature.objects.count(), 5)
+
+        self.assertEqual(len(self.client.get(f'{self.url}similar/', {'threshold': '1'}).data), 1)
+        self.assertEqual(self.client.get(f'{self.url}similar/', {'threshold': 'high'}).status_code,
+                         status.HTTP_400_BAD_REQUEST)
+        self.client.force_authenticate(self.student)
+        self.assertEqual(self.client.get(f'{self.url}similar/').status_code, status.HTTP_403_FORBIDDEN)
+
+
+class CourseBundleTestCase(CoursesTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media)
+        override = override_settings(MEDIA_ROOT=self.media)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.lecture.document.save('slides.pdf', ContentFile(b'%PDF-1.4 slides'))
+        Lecture.objects.create(course=self.course, topic='reading', document='')
+        Task.objects.create(lecture=self.lecture, text='Prove the theorem')
+        Task.objects.create(lecture=self.lecture, text='Draw the graph')
+        self.client.force_authenticate(self.teacher)
+        self.url = f'/api/v1/courses/{self.course.id}/'
+
+    def assert_copied(self, course_id, title):
+        course = Course.objects.get(pk=course_id)
+        self.assertEqual(course.title, title)
+        self.assertEqual(list(course.participants.all()), [self.teacher])
+        lectures = list(Lecture.objects.filter(course=course).order_by('id'))
+        self.assertEqual([(lecture.topic, lecture.document.name) for lecture in lectures],
+                         [('topic', self.lecture.document.name), ('reading', '')])
+        self.assertEqual(list(Task.objects.filter(course=course, lecture=lectures[0]).values_list('text', flat=True)),
+                         ['Prove the theorem', 'Draw the graph'])
+        self.assertEqual(Change.objects.filter(course_id=course.id).count(), 4)
+        self.assertEqual(SearchEntry.objects.filter(course_id=course.id, text='Draw the graph').count(), 1)
+
+    def test_clone_shares_documents(self):
+        response = self.client.post(f'{self.url}clone/', {'title': 'Next semester'})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assert_copied(response.data['id'], 'Next semester')
+        self.assertEqual(Blob.objects.get().ref_count, 2)
+        courses = self.client.get('/api/v1/courses/').data['results']
+        self.assertIn(response.data['id'], [course['id'] for course in courses])
+
+        self.client.force_authenticate(self.student)
+        self.assertEqual(self.client.post(f'{self.url}clone/').status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_export_and_import_bundles(self):
+        bundle = self.client.get(f'{self.url}export/').data
+        self.assertEqual(bundle['lectures'][0]['document']['sha256'], Blob.objects.get().sha256)
+        response = self.client.post('/api/v1/courses/import/', bundle, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assert_copied(response.data['id'], 'course')
+
+        response = self.client.get(f'{self.url}export/', {'bundle': 'zip'})
+        archive = SimpleUploadedFile('course.zip', b''.join(response.streaming_content))
+        with self.captureOnCommitCallbacks(execute=True):
+            Course.objects.exclude(pk=self.course.pk).delete()
+            self.lecture.delete()
+        self.assertFalse(Blob.objects.exists())
+        response = self.client.post('/api/v1/courses/import/', {'file': archive})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        lecture = Lecture.objects.filter(course_id=response.data['id']).first()
+        self.assertEqual(lecture.document.read(), b'%PDF-1.4 slides')
+        self.assertEqual(Blob.objects.get().ref_count, 1)
+
+        bundle['lectures'][0]['document']['sha256'] = '0' * 64
+        response = self.client.post('/api/v1/courses/import/', bundle, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_stored_documents_are_only_reused_by_their_readers(self):
+        bundle = self.client.get(f'{self.url}export/').data
+        self.client.force_authenticate(User.objects.create_user('other', password='password',
+                                                                role=RoleTypes.TEACHER.value))
+        response = self.client.post('/api/v1/courses/import/', bundle, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Blob.objects.get().ref_count, 1)
+
+    def test_failed_import_deletes_its_documents(self):
+        document = {'name': 'notes.txt', 'sha256': hashlib.sha256(b'notes').hexdigest(), 'size': 5}
+        forged = {'name': 'forged.txt', 'sha256': '0' * 64, 'size': 6}
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, 'w') as bundle:
+            bundle.writestr('course.json', json.dumps({'version': 1, 'title': 'copy', 'lectures': [
+                {'topic': 'notes', 'document': document, 'tasks': []},
+                {'topic': 'forged', 'document': forged, 'tasks': []},
+            ]}))
+            bundle.writestr(f"documents/{document['sha256']}", b'notes')
+            bundle.writestr(f"documents/{forged['sha256']}", b'forged')
+        response = self.client.post('/api/v1/courses/import/',
+                                    {'file': SimpleUploadedFile('course.zip', archive.getvalue())})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        for name in (document_storage.blob_name(document['sha256'], 'notes.txt'),
+                     document_storage.blob_name(hashlib.sha256(b'forged').hexdigest(), 'forged.txt')):
+            self.assertFalse(document_storage.exists(name))
+
+
+class CourseTreeTestCase(CoursesTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.other = User.objects.create_user('other', password='password')
+        self.course.participants.add(self.student, self.other)
+        self.url = f'/api/v1/courses/{self.course.id}/tree/'
+
+    def build(self, lectures):
+        for i in range(lectures):
+            lecture = Lecture.objects.create(course=self.course, topic=f'lecture {i}', document='documents/doc.pdf')
+            for j in range(2):
+                task = Task.objects.create(lecture=lecture, text=f'task {j}')
+                for user in (self.student, self.other):
+                    solution = Solution.objects.create(task=task, user=user, text='solution')
+                    mark = Mark.objects.create(solution=solution, result=5)
+                    Comment.objects.create(mark=mark, user=self.teacher, text='comment')
+
+    def test_tree_uses_a_query_per_level(self):
+        self.build(1)
+        self.client.force_authenticate(self.teacher)
+        with self.assertNumQueries(4):
+            small = self.client.get(self.url).data
+        self.build(5)
+        with self.assertNumQueries(4):
+            response = self.client.get(self.url)
+        self.assertEqual(len(response.data['lectures']), 7)
+        solutions = response.data['lectures'][1]['tasks'][0]['solutions']
+        self.assertEqual([(solution['mark']['result'], solution['comments_count']) for solution in solutions],
+                         [(5, 1), (5, 1)])
+        self.assertEqual(small['lectures'][0]['tasks'], [])
+
+    def test_visibility_depth_and_fields(self):
+        self.build(1)
+        self.client.force_authenticate(self.student)
+        response = self.client.get(self.url, {'fields': 'lecture.topic,task.id,solution.id,solution.mark'})
+        lecture = response.data['lectures'][1]
+        self.assertEqual(set(lecture), {'topic', 'tasks'})
+        self.assertEqual(lecture['tasks'][0]['solutions'], [
+            {'id': Solution.objects.get(task_id=lecture['tasks'][0]['id'], user=self.student).id,
+             'mark': {'id': Mark.objects.get(solution__task_id=lecture['tasks'][0]['id'],
+                                             solution__user=self.student).id, 'result': 5}},
+        ])
+
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url, {'depth': 1})
+        self.assertNotIn('tasks', response.data['lectures'][0])
+        self.assertEqual(self.client.get(self.url, {'fields': 'lecture.secret'}).status_code,
+                         status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get(self.url, {'depth': 9}).status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class SparseFieldsTestCase(CoursesTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.course.participants.add(self.student)
+        self.task = Task.objects.create(lecture=self.lecture, text='task')
+        for i in range(3):
+            solution = Solution.objects.create(task=self.task, user=self.student, text=f'solution {i}')
+            mark = Mark.objects.create(solution=solution, result=5)
+            Comment.objects.create(mark=mark, user=self.teacher, text='comment')
+        Solution.objects.create(task=self.task, user=self.student, text='ungraded')
+        c = f'/api/v1/courses/{self.course.id}'
+        self.solutions = f'{c}/lectures/{self.lecture.id}/tasks/{self.task.id}/solutions/'
+
+    def test_values_path_is_opt_in(self):
+        self.client.force_authenticate(self.teacher)
+        with mock.patch('core.values.compile_plan', wraps=compile_plan) as plan:
+            self.client.get(self.solutions)
+            plan.assert_not_called()
+            with mock.patch.object(SolutionViewSet, 'values_list', True):
+                self.client.get(self.solutions)
+            plan.assert_called_once()
+
+    @override_settings(VALUES_LISTS=True)
+    def test_values_path_matches_serializers(self):
+        self.client.force_authenticate(self.teacher)
+        context = {'request': Request(APIRequestFactory().get('/'))}
+        solutions = Solution.objects.select_related('user').order_by('id')
+        cases = [
+            (self.solutions, SolutionSerializer, solutions),
+            (f'/api/v1/courses/{self.course.id}/grading-queue/', GradingQueueSerializer,
+             solutions.filter(mark__isnull=True).order_by('created')),
+            (f'/api/v1/courses/{self.course.id}/lectures/', LectureSerializer, Lecture.objects.order_by('id')),
+        ]
+        for url, serializer_class, queryset in cases:
+            self.assertIsNotNone(compile_plan(serializer_class(context=context), queryset))
+            response = self.client.get(url)
+            expected = serializer_class(queryset, many=True, context=context).data
+            self.assertEqual(json.dumps(response.data['results']), json.dumps(expected))
+
+        response = self.client.get('/api/v1/courses/', {'participants': 'count'})
+        self.assertEqual(response.data['results'], [{'id': self.course.id, 'title': 'course', 'participants_count': 2}])
+
+    def test_fields_select_top_level_and_nested_fields(self):
+        self.client.force_authenticate(self.student)
+        response = self.client.get(self.solutions, {'fields': 'id,user.username'})
+        self.assertEqual(response.data['results'][0], {'id': Solution.objects.order_by('id')[0].id,
+                                                       'user': {'username': 'student'}})
+        response = self.client.get(self.solutions, {'fields': 'text,user'})
+        self.assertEqual(response.data['results'][0], {'user': {'id': self.student.id, 'username': 'student',
+                                                                'role': RoleTypes.STUDENT.value},
+                                                       'text': 'solution 0'})
+
+        response = self.client.get('/api/v1/courses/', {'fields': 'title,participants.id'})
+        self.assertEqual(response.data['results'], [{'title': 'course', 'participants': [
+            {'id': self.teacher.id}, {'id': self.student.id},
+        ]}])
+        response = self.client.get(f'/api/v1/courses/{self.course.id}/changes/', {'fields': 'action,data.id'})
+        self.assertEqual(response.data['results'][0], {'action': 'created', 'data': {'id': self.task.id}})
+
+
+class ConnectionPoolTestCase(SimpleTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def connect(self):
+        return sqlite3.connect(os.path.join(self.directory, 'pool.sqlite3'), check_same_thread=False)
+
+    def test_connections_are_reused_checked_and_bounded(self):
+        pool = ConnectionPool(self.connect, size=2, timeout=0.05, check_interval=0)
+        first, second = pool.acquire(), pool.acquire()
+        with self.assertRaises(PoolTimeout):
+            pool.acquire()
+        pool.release(first)
+        self.assertIs(pool.acquire(), first)
+
+        pool.release(first)
+        first.close()
+        self.assertIsNot(pool.acquire(), first)
+        self.assertEqual(pool.open, 2)
+        pool.release(second, reusable=False)
+        self.assertEqual(pool.open, 1)
+
+        pool = ConnectionPool(self.connect, size=1, max_lifetime=0)
+        connection = pool.acquire()
+        pool.release(connection)
+        self.assertIsNot(pool.acquire(), connection)
+
+    def test_pooled_backend_returns_connections_on_close(self):
+        handler = ConnectionHandler({'default': {
+            'ENGINE': 'core.db.backends.sqlite3',
+            'NAME': os.path.join(self.directory, 'backend.sqlite3'),
+            'POOL': {'SIZE': 1},
+        }})
+        self.addCleanup(close_pools)
+        wrapper = handler['default']
+        with wrapper.cursor() as cursor:
+            cursor.execute('CREATE TABLE item (id integer)')
+        raw = wrapper.connection
+        wrapper.close()
+        self.assertIsNone(wrapper.connection)
+        with wrapper.cursor() as cursor:
+            cursor.execute('SELECT count(*) FROM item')
+            self.assertEqual(cursor.fetchone(), (0,))
+        self.assertIs(wrapper.connection, raw)
+        wrapper.close()
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRoutingTestCase(SimpleTestCase):
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        sticky = {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': directory}
+        override = override_settings(CACHES={**settings.CACHES, 'sticky': sticky}, DATABASE_STICKY_CACHE='sticky')
+        override.enable()
+        self.addCleanup(override.disable)
+        self.router = ReplicaRouter()
+        self.factory = RequestFactory()
+        self.middleware = ReplicaRoutingMiddleware(self.respond)
+
+    def respond(self, request):
+        self.routed = self.router.db_for_read(Course)
+        return HttpResponse(status=201 if request.method == 'POST' else 200)
+
+    def test_safe_reads_go_to_replicas_until_the_client_writes(self):
+        self.assertEqual(self.router.db_for_read(Course), 'default')
+        self.middleware(self.factory.get('/', HTTP_AUTHORIZATION='Bearer a'))
+        self.assertEqual(self.routed, 'replica')
+        self.middleware(self.factory.post('/', HTTP_AUTHORIZATION='Bearer a'))
+        self.assertEqual(self.routed, 'default')
+        self.middleware(self.factory.get('/', HTTP_AUTHORIZATION='Bearer a'))
+        self.assertEqual(self.routed, 'default')
+        self.middleware(self.factory.get('/', HTTP_AUTHORIZATION='Bearer b'))
+        self.assertEqual(self.routed, 'replica')
+        self.assertEqual(self.router.db_for_write(Course), 'default')
+
+    def test_per_process_sticky_cache_is_refused(self):
+        with override_settings(DATABASE_STICKY_CACHE='responses'):
+            with self.assertRaises(ImproperlyConfigured):
+                ReplicaRoutingMiddleware(self.respond)
+
+
+@override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': {
+    'submissions': '2/minute', 'marks': '60/minute', 'registration': '1/hour',
+}})
+class ThrottlingTestCase(CoursesTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.course.participants.add(self.student)
+        self.task = Task.objects.create(lecture=self.lecture, text='task')
+        self.solutions = f'/api/v1/courses/{self.course.id}/lectures/{self.lecture.id}/tasks/{self.task.id}/solutions/'
+
+    def test_submissions_are_throttled_per_student_and_course(self):
+        self.client.force_authenticate(self.student)
+        for _ in range(2):
+            self.assertEqual(self.client.post(self.solutions, {'text': 'solution'}).status_code,
+                             status.HTTP_201_CREATED)
+        response = self.client.post(self.solutions, {'text': 'solution'})
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(response['Retry-After'], '30')
+        self.assertEqual(self.client.get(self.solutions).status_code, status.HTTP_200_OK)
+
+        other = User.objects.create_user('other', password='password')
+        self.course.participants.add(other)
+        self.client.force_authenticate(other)
+        self.assertEqual(self.client.post(self.solutions, {'text': 'solution'}).status_code, status.HTTP_201_CREATED)
+
+    def test_buckets_refill_and_cost_no_queries(self):
+        view = type('View', (), {'action': 'retrieve', 'kwargs': {'course_pk': self.course.id},
+                                 'throttle_scopes': {'retrieve': 'marks'}})()
+        request = Request(APIRequestFactory().get('/'))
+        request.user = TokenUser(add_claims(AccessToken.for_user(self.student), self.student))
+        throttle = TokenBucketThrottle()
+        with self.assertNumQueries(0):
+            self.assertTrue(throttle.allow_request(request, view))
+        self.assertEqual(take((0.5, 100), 60, 1, 100), ((0.5, 100), 0.5))
+        self.assertEqual(take((0.5, 100), 60, 1, 101), ((0.5, 101), 0))
+        self.assertEqual(take(None, 60, 1, 100), ((59, 100), 0))
+
+        request.user = self.teacher
+        for _ in range(100):
+            self.assertTrue(throttle.allow_request(request, view))
+
+    def test_concurrent_requests_share_the_bucket(self):
+        view = type('View', (), {'action': 'create', 'kwargs': {'course_pk': self.course.id},
+                                 'throttle_scopes': {'create': 'submissions'}})()
+        request = Request(APIRequestFactory().get('/'))
+        request.user = self.student
+        allowed = []
+
+        def submit():
+            for _ in range(4):
+                allowed.append(TokenBucketThrottle().allow_request(request, view))
+
+        threads = [threading.Thread(target=submit) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(allowed.count(True), 2)
+
+    def test_anonymous_registration_is_throttled_by_address(self):
+        self.client.force_authenticate(None)
+        data = {'username': 'new', 'password': 'password', 'role': RoleTypes.STUDENT.value}
+        self.assertEqual(self.client.post('/api/v1/users/', data).status_code, status.HTTP_201_CREATED)
+        response = self.client.post('/api/v1/users/', {**data, 'username': 'newer'}, HTTP_X_FORWARDED_FOR='10.0.0.1')
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertIn('Retry-After', response)
@@ -0,0 +1,66 @@
+from django.db.models import Count, OuterRef, Prefetch, Subquery
+from django.db.models.functions import Coalesce
+
+from courses.api.v1.serializers import (
+    TreeSolutionSerializer,
+    TreeLectureSerializer,
+    CourseTreeSerializer,
+    TreeTaskSerializer,
+)
+from courses.models import Comment, Lecture, Solution, Task
+from users.enum_types import RoleTypes
+
+MAX_DEPTH = 3
+RESOURCES = {
+    serializer.Meta.resource: serializer
+    for serializer in (CourseTreeSerializer, TreeLectureSerializer, TreeTaskSerializer, TreeSolutionSerializer)
+}
+
+
+def parse_fields(value):
+    """
+    Parses `resource.field` pairs separated by commas into the selected fields of every resource.
+    """
+    fields = {}
+    for item in filter(None, value.split(',')):
+        resource, _, name = item.strip().partition('.')
+        if resource not in RESOURCES or name not in RESOURCES[resource].Meta.fields:
+            raise ValueError(f"Unknown field {item.strip()}, select fields as <{'|'.join(RESOURCES)}>.<field>")
+        fields.setdefault(resource, set()).add(name)
+    return fields
+
+
+def visible_solutions(course_id, user):
+    """
+    Solutions of the course the user may see, like SolutionViewSet.get_queryset: students only see their own.
+    """
+    solutions = Solution.objects.filter(course_id=course_id)
+    if user.role == RoleTypes.STUDENT.value:
+        return solutions.filter(user_id=user.id)
+    return solutions
+
+
+def load_tree(course, user, depth=MAX_DEPTH):
+    """
+    Loads the course tree to `depth` (1 lectures, 2 tasks, 3 solutions) with one query per level,
+    however many objects each level has.
+    """
+    if depth < 1:
+        return course
+    tasks = Task.objects.filter(course_id=course.id).order_by('id')
+    if depth >= 3:
+        comments = (Comment.objects.filter(mark__solution_id=OuterRef('pk'))
+                    .order_by()
+                    .values('mark__solution_id')
+                    .annotate(count=Count('*'))
+                    .values('count'))
+        solutions = (visible_solutions(course.id, user)
+                     .select_related('user', 'mark')
+                     .annotate(comments_count=Coalesce(Subquery(comments), 0))
+                     .order_by('id'))
+        tasks = tasks.prefetch_related(Prefetch('solution_set', queryset=solutions, to_attr='tree_solutions'))
+    lectures = Lecture.objects.filter(course_id=course.id).order_by('id')
+    if depth >= 2:
+        lectures = lectures.prefetch_related(Prefetch('task_set', queryset=tasks, to_attr='tree_tasks'))
+    course.tree_lectures = list(lectures)
+    return course
@@ -0,0 +1,107 @@
+import hashlib
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+
+from courses.models import Lecture, LectureUpload
+
+READ_SIZE = 64 * 1024
+
+
+class ChunkError(Exception):
+    def __init__(self, detail, offset=None):
+        super().__init__(detail)
+        self.detail = detail
+        self.offset = offset
+
+
+def start_upload(upload):
+    """
+    Creates the part file. Every upload sends its bytes, even when a blob with the announced sha256 is
+    stored: the storage shares the blob once it has hashed the bytes itself.
+    """
+    os.makedirs(settings.CHUNKED_UPLOAD_DIR, exist_ok=True)
+    open(upload.part_path(), 'wb').close()
+    return upload
+
+
+def check_offset(upload, offset, length):
+    if offset != upload.offset:
+        raise ChunkError('Unexpected chunk offset', upload.offset)
+    if offset + length > upload.size:
+        raise ChunkError('Chunk exceeds the declared file size')
+
+
+def receive_chunk(stream, length, checksum):
+    """
+    Reads `length` bytes from `stream` into a temporary file in small blocks and checks their sha256.
+    """
+    digest = hashlib.sha256()
+    chunk = tempfile.TemporaryFile(dir=settings.CHUNKED_UPLOAD_DIR)
+    remaining = length
+    while remaining:
+        block = stream.read(min(READ_SIZE, remaining))
+        if not block:
+            break
+        digest.update(block)
+        chunk.write(block)
+        remaining -= len(block)
+    if remaining or (checksum and digest.hexdigest() != checksum.lower()):
+        chunk.close()
+        raise ChunkError('Chunk is incomplete or its checksum does not match')
+    chunk.seek(0)
+    return chunk
+
+
+def append_chunk(upload_id, stream, offset, length, checksum):
+    """
+    Appends `length` bytes from `stream` at `offset`. The chunk is received and hashed before the upload
+    row is locked, so a slow client holds no database connection; a chunk whose sha256 doesn't match
+    `checksum` is dropped so the client can resend it.
+    """
+    if length > settings.CHUNKED_UPLOAD_MAX_CHUNK_SIZE:
+        raise ChunkError('Chunk is too large')
+    check_offset(LectureUpload.objects.only('offset', 'size').get(pk=upload_id), offset, length)
+    with receive_chunk(stream, length, checksum) as chunk:
+        with transaction.atomic():
+            upload = LectureUpload.objects.select_for_update().get(pk=upload_id)
+            check_offset(upload, offset, length)
+            with open(upload.part_path(), 'r+b') as part:
+                part.seek(offset)
+                shutil.copyfileobj(chunk, part, READ_SIZE)
+            upload.offset += length
+            upload.save(update_fields=['offset'])
+    return upload
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(READ_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def complete_upload(upload, topic=None, lecture=None):
+    if upload.offset != upload.size:
+        raise ChunkError('Upload is not complete', upload.offset)
+    if upload.sha256 and file_sha256(upload.part_path()) != upload.sha256:
+        raise ChunkError('Upload does not match its sha256')
+    if lecture is None:
+        lecture = Lecture(course_id=upload.course_id, topic=topic)
+    else:
+        lecture.topic = topic or lecture.topic
+    with open(upload.part_path(), 'rb') as part:
+        lecture.document.save(upload.filename, File(part), save=True)
+    abort_upload(upload)
+    return lecture
+
+
+def abort_upload(upload):
+    if os.path.exists(upload.part_path()):
+        os.remove(upload.part_path())
+    upload.delete()
@@ -2,6 +2,8 @@
 ASGI config for courses_django_project project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Read endpoints are served by async views (ASYNC_VIEWS) and streaming
+responses are pulled off the event loop.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/3.1/howto/deployment/asgi/
@@ -9,8 +11,13 @@ https://docs.djangoproject.com/en/3.1/howto/deployment/asgi/
 
 import os
 
-from django.core.asgi import get_asgi_application
+import django
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'courses_django_project.settings')
+os.environ.setdefault('ASYNC_VIEWS', '1')
 
-application = get_asgi_application()
+django.setup(set_prefix=False)
+
+from core.asgi import AsyncStreamingASGIHandler  # noqa: E402
+
+application = AsyncStreamingASGIHandler()
@@ -43,6 +43,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.InstrumentationMiddleware',
+    'core.middleware.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -73,20 +75,94 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'courses_django_project.wsgi.application'
 
+# Serve the API through async views; asgi.py turns this on, WSGI workers keep plain sync views.
+ASYNC_VIEWS = os.environ.get('ASYNC_VIEWS') == '1'
+
 # Database
 # https://docs.djangoproject.com/en/3.1/ref/settings/#databases
+# Connections persist for DATABASE_CONN_MAX_AGE seconds. With DATABASE_POOL_SIZE set every process shares a pool of
+# that many connections between its threads instead, connections idle for DATABASE_POOL_CHECK_INTERVAL seconds are
+# checked before reuse. Reads of safe requests go to the comma-separated POSTGRES_REPLICA_HOSTS, except for the
+# DATABASE_STICKY_SECONDS after a write by the same client. Replicas need a DATABASE_STICKY_CACHE shared by every
+# process, a per-process cache (see LOCAL_CACHE_BACKENDS) is refused.
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.postgresql_psycopg2',
+DATABASE_POOL_SIZE = int(os.environ.get('DATABASE_POOL_SIZE', '0'))
+
+DATABASE_POOL_CHECK_INTERVAL = 30
+
+DATABASE_CONN_MAX_AGE = int(os.environ.get('DATABASE_CONN_MAX_AGE', '60'))
+
+DATABASE_STICKY_SECONDS = 5
+
+DATABASE_STICKY_CACHE = 'responses'
+
+
+def database(host):
+    return {
+        'ENGINE': 'core.db.backends.postgresql' if DATABASE_POOL_SIZE else 'django.db.backends.postgresql_psycopg2',
         'NAME': os.environ.get('POSTGRES_DB', 'postgres'),
         'USER': os.environ.get('POSTGRES_USER', 'postgres'),
         'PASSWORD': os.environ.get('POSTGRES_PASSWORD', 'postgres'),
-        'HOST': os.environ.get('POSTGRES_HOST', 'db'),
+        'HOST': host,
         'PORT': os.environ.get('POSTGRES_PORT', '5432'),
+        'CONN_MAX_AGE': 0 if DATABASE_POOL_SIZE else DATABASE_CONN_MAX_AGE,
+        'POOL': {
+            'SIZE': DATABASE_POOL_SIZE,
+            'CHECK_INTERVAL': DATABASE_POOL_CHECK_INTERVAL,
+        },
     }
+
+
+DATABASES = {
+    'default': database(os.environ.get('POSTGRES_HOST', 'db')),
 }
 
+DATABASES.update({
+    f'replica{index}': {**database(host.strip()), 'TEST': {'MIRROR': 'default'}}
+    for index, host in enumerate(filter(None, os.environ.get('POSTGRES_REPLICA_HOSTS', '').split(',')), 1)
+})
+
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+
+DATABASE_ROUTERS = ['core.db.router.ReplicaRouter']
+
+# Cache
+# https://docs.djangoproject.com/en/3.1/topics/cache/
+
+# The `responses` cache holds cached API responses and their versions. Use a shared backend
+# (e.g. RESPONSE_CACHE_BACKEND=django.core.cache.backends.filebased.FileBasedCache with a
+# directory in RESPONSE_CACHE_LOCATION) when running several worker processes.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'responses': {
+        'BACKEND': os.environ.get('RESPONSE_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('RESPONSE_CACHE_LOCATION', 'responses'),
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+    'throttles': {
+        'BACKEND': os.environ.get('THROTTLE_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('THROTTLE_CACHE_LOCATION', 'throttles'),
+        'OPTIONS': {'MAX_ENTRIES': 100000},
+    },
+}
+
+# Caches only the current process can read
+LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+# Access tokens carry the course ids of their user, trusted while the roster version in the responses cache
+# is unchanged. Every process must see roster changes, so the claim is ignored with a per-process cache.
+TOKEN_COURSES_CLAIM = CACHES['responses']['BACKEND'] not in LOCAL_CACHE_BACKENDS
+
+MEMBERSHIP_CACHE_TIMEOUT = 30
+
+RESPONSE_CACHE_TIMEOUT = 300
+
 # Password validation
 # https://docs.djangoproject.com/en/3.1/ref/settings/#auth-password-validators
 
@@ -123,11 +199,96 @@ USE_TZ = True
 
 STATIC_URL = '/static/'
 
+# Instrumentation
+# Samples INSTRUMENTATION_SAMPLE_RATE of the requests per view; `manage.py slow_endpoints` and /metrics/
+# report rolling percentiles merged from the snapshots every process flushes to INSTRUMENTATION_DIR.
+# /metrics/ answers staff users and requests carrying `Authorization: Bearer <INSTRUMENTATION_METRICS_TOKEN>`.
+
+INSTRUMENTATION_ENABLED = os.environ.get('INSTRUMENTATION_ENABLED') == '1'
+
+INSTRUMENTATION_SAMPLE_RATE = float(os.environ.get('INSTRUMENTATION_SAMPLE_RATE', '0.1'))
+
+INSTRUMENTATION_WINDOW = 1000
+
+INSTRUMENTATION_FLUSH_INTERVAL = 10
+
+INSTRUMENTATION_DIR = os.environ.get('INSTRUMENTATION_DIR', str(BASE_DIR / 'instrumentation'))
+
+INSTRUMENTATION_METRICS_TOKEN = os.environ.get('INSTRUMENTATION_METRICS_TOKEN', '')
+
+# Lists whose serializer fields are plain columns are read from `.values()` rows instead of running the
+# serializer per row (core.values). Off by default, a view may opt in with `values_list = True`.
+
+VALUES_LISTS = os.environ.get('VALUES_LISTS') == '1'
+
+# Lecture documents
+# Documents are stored under MEDIA_ROOT, which the web and worker containers share.
+# Chunks of resumable uploads are appended to CHUNKED_UPLOAD_DIR until the upload is completed.
+# SENDFILE_BACKEND hands downloads to the web server: None, 'x-sendfile' or 'x-accel-redirect'.
+
+MEDIA_ROOT = os.environ.get('MEDIA_ROOT', '')
+
+CHUNKED_UPLOAD_DIR = os.environ.get('CHUNKED_UPLOAD_DIR', str(BASE_DIR / 'uploads'))
+
+CHUNKED_UPLOAD_MAX_CHUNK_SIZE = 8 * 1024 * 1024
+
+SENDFILE_BACKEND = os.environ.get('SENDFILE_BACKEND') or None
+
+SENDFILE_URL_PREFIX = '/protected/'
+
+# Text of lecture documents is extracted by `manage.py process_documents` workers polling the DocumentJob queue.
+# A failed job is retried DOCUMENT_JOB_ATTEMPTS times, DOCUMENT_JOB_BACKOFF seconds doubling between attempts.
+
+DOCUMENT_JOB_ATTEMPTS = 5
+
+DOCUMENT_JOB_BACKOFF = 30
+
+DOCUMENT_JOB_TIMEOUT = 10 * 60
+
+DOCUMENT_WORKER_POLL_INTERVAL = 5
+
+DOCUMENT_TEXT_LIMIT = 1000000
+
+# Events
+# Mark and comment events are streamed at /api/v1/events/ under ASGI. The default backend only reaches
+# streams of the publishing process; set EVENTS_BACKEND to a shared one when running several workers.
+
+EVENTS_BACKEND = os.environ.get('EVENTS_BACKEND', 'core.events.LocalBackend')
+
+EVENTS_KEEPALIVE = 15
+
+EVENTS_QUEUE_SIZE = 100
+
+# Search
+# Postgres matches /api/v1/search/ queries with full-text search in the SEARCH_CONFIG text search configuration,
+# other databases use the inverted index of courses.search. `manage.py rebuild_search_index` re-indexes the courses.
+
+SEARCH_CONFIG = os.environ.get('SEARCH_CONFIG', 'simple')
+
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': ('rest_framework.permissions.IsAuthenticated',),
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
-    )
+        'core.authentication.StatelessJWTAuthentication',
+    ),
+    'DEFAULT_PAGINATION_CLASS': 'core.pagination.KeysetPagination',
+    'PAGE_SIZE': 50,
+    'MAX_PAGE_SIZE': 200,
+    'DEFAULT_THROTTLE_CLASSES': ('core.throttling.TokenBucketThrottle',),
+    'DEFAULT_THROTTLE_RATES': {
+        'submissions': '10/minute',
+        'marks': '60/minute',
+        'registration': '5/hour',
+    },
+    'NUM_PROXIES': int(os.environ.get('NUM_PROXIES', '0')),
 }
 
+# Throttling
+# Views name the scopes of their actions, students and anonymous clients get a token bucket per scope, user and
+# course refilled at the scope's rate above. The buckets live in the `throttles` cache, set THROTTLE_CACHE_BACKEND
+# to a shared one (e.g. django.core.cache.backends.filebased.FileBasedCache) when running several worker processes.
+# Anonymous clients are keyed by REMOTE_ADDR, set NUM_PROXIES to the number of proxies in front of the app to key
+# them by their X-Forwarded-For address instead.
+
+THROTTLE_CACHE = 'throttles'
+
 AUTH_USER_MODEL = "users.User"
@@ -1,7 +1,8 @@
 from rest_framework import generics
 from rest_framework.permissions import IsAuthenticated
+from rest_framework_simplejwt import views as jwt_views
 
-from users.api.v1.serializers import UserSerializer
+from users.api.v1.serializers import TokenObtainPairSerializer, TokenRefreshSerializer, UserSerializer
 
 
 class UserView(generics.CreateAPIView):
@@ -10,3 +11,18 @@ class UserView(generics.CreateAPIView):
     """
     permission_classes = (~IsAuthenticated,)
     serializer_class = UserSerializer
+    throttle_scope = 'registration'
+
+
+class TokenObtainPairView(jwt_views.TokenObtainPairView):
+    """
+    Issues a token pair carrying the role and the courses of the user
+    """
+    serializer_class = TokenObtainPairSerializer
+
+
+class TokenRefreshView(jwt_views.TokenRefreshView):
+    """
+    Issues an access token with the current role and courses of the user
+    """
+    serializer_class = TokenRefreshSerializer